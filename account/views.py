@@ -2,16 +2,21 @@ from django.shortcuts import render
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from cart.utils import merge_guest_cart_to_user
 from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserSerializer
 
 
 @api_view(['POST'])
+@permission_classes([AllowAny])
 def register(request):
     serializer = UserRegistrationSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
+        # Before login() rotates the session, so the guest cart can still be found
+        merge_guest_cart_to_user(request, user)
         login(request, user)
         user_serializer = UserSerializer(user)
         return Response({
@@ -22,10 +27,12 @@ def register(request):
 
 
 @api_view(['POST'])
+@permission_classes([AllowAny])
 def login_view(request):
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']
+        merge_guest_cart_to_user(request, user)
         login(request, user)
         user_serializer = UserSerializer(user)
         return Response({
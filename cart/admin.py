@@ -33,7 +33,7 @@ class CartAdmin(admin.ModelAdmin):
     cart_owner.short_description = 'Owner'
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user').prefetch_related('items__food')
+        return super().get_queryset(request).select_related('user')
 
 
 @admin.register(CartItem)
@@ -0,0 +1,9 @@
+from django.utils.functional import SimpleLazyObject
+from .utils import get_cart_count
+
+
+def cart(request):
+    """Cart badge count for all templates, computed once and only if a template uses it"""
+    return {
+        'cart_count': SimpleLazyObject(lambda: get_cart_count(request))
+    }
@@ -0,0 +1,104 @@
+"""
+Guest carts kept in the session.
+
+With ``CART_GUEST_STORAGE = 'session'`` an anonymous visitor's cart is a
+``{food_id: quantity}`` map in their session, so browsing and reading the
+cart never write a Cart row. Rows are only created when the visitor logs in
+(see cart.utils.merge_guest_cart_to_user), and checkout requires a login.
+Lines are keyed by food id, which also serves as the line's item id.
+"""
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+from menu.models import Food
+from menu.serializers import FOOD_COLUMNS, serialize_food
+
+
+SESSION_KEY = 'guest_cart'
+
+_money = serializers.DecimalField(max_digits=10, decimal_places=2)
+_timestamp = serializers.DateTimeField()
+
+
+def guest_carts_in_session():
+    return getattr(settings, 'CART_GUEST_STORAGE', 'session') == 'session'
+
+
+class GuestCart:
+    id = None
+
+    def __init__(self, session):
+        self.session = session
+        self.data = session.get(SESSION_KEY) or {'lines': {}, 'created_at': None}
+
+    @property
+    def lines(self):
+        return self.data['lines']
+
+    def __contains__(self, food_id):
+        return str(food_id) in self.lines
+
+    @property
+    def total_items(self):
+        return sum(self.lines.values())
+
+    def _save(self):
+        if self.data['created_at'] is None:
+            self.data['created_at'] = _timestamp.to_representation(timezone.now())
+        self.session[SESSION_KEY] = self.data
+        self.session.modified = True
+
+    def add(self, food_id, quantity):
+        """Add ``quantity`` of a food and return the line's new quantity"""
+        key = str(food_id)
+        self.lines[key] = self.lines.get(key, 0) + quantity
+        self._save()
+        return self.lines[key]
+
+    def set(self, food_id, quantity):
+        self.lines[str(food_id)] = quantity
+        self._save()
+
+    def remove(self, food_id):
+        if self.lines.pop(str(food_id), None) is None:
+            return False
+        self._save()
+        return True
+
+    def clear(self):
+        if SESSION_KEY in self.session:
+            del self.session[SESSION_KEY]
+        self.data = {'lines': {}, 'created_at': None}
+
+    def food_lines(self, food_ids=None):
+        """(food row, quantity) pairs in the order the foods were added; deleted foods are skipped"""
+        food_ids = [int(pk) for pk in (food_ids or self.lines)]
+        foods = {row['id']: row for row in Food.objects.filter(id__in=food_ids).values(*FOOD_COLUMNS)}
+        return [(foods[pk], self.lines[str(pk)]) for pk in food_ids if pk in foods]
+
+    def serialize_item(self, food_id, request=None):
+        """Same shape as CartItemSerializer"""
+        lines = self.food_lines([food_id])
+        if not lines:
+            return None
+        food, quantity = lines[0]
+        return self._item(food, quantity, request)
+
+    def _item(self, food, quantity, request=None):
+        return {
+            'id': food['id'],
+            'food': serialize_food(food, request),
+            'quantity': quantity,
+            'subtotal': _money.to_representation(quantity * food['price']),
+        }
+
+    def serialize(self, request=None):
+        """Same shape as CartSerializer"""
+        lines = self.food_lines()
+        return {
+            'id': None,
+            'items': [self._item(food, quantity, request) for food, quantity in lines],
+            'total_price': _money.to_representation(sum(quantity * food['price'] for food, quantity in lines)),
+            'total_items': sum(quantity for _, quantity in lines),
+            'created_at': self.data['created_at'],
+        }
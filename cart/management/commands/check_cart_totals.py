@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from cart.models import Cart, CartItem
+from cart.utils import recount_cart_totals
+from menu.models import Food
+
+
+class Command(BaseCommand):
+    help = 'Find carts whose stored totals or line prices drifted from their items and repair them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without repairing it')
+
+    def handle(self, *args, **options):
+        menu_price = Subquery(Food.objects.filter(pk=OuterRef('food_id')).values('price'))
+        stale_lines = CartItem.objects.annotate(menu_price=menu_price).exclude(unit_price=F('menu_price'))
+
+        lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        total_items = lines.annotate(total=Sum('quantity')).values('total')
+        total_price = lines.annotate(
+            total=Sum(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=10, decimal_places=2))
+        ).values('total')
+        carts = Cart.objects.annotate(
+            expected_items=Coalesce(Subquery(total_items), 0),
+            expected_price=Coalesce(
+                Subquery(total_price), Decimal('0'), output_field=DecimalField(max_digits=10, decimal_places=2)
+            ),
+        ).values_list('id', 'total_items', 'total_price', 'expected_items', 'expected_price')
+
+        # Compared in Python: SQLite keeps decimals as floats, so SQL equality is unreliable
+        stale_count = stale_lines.count()
+        drifted_ids = [
+            cart_id for cart_id, items, price, expected_items, expected_price in carts.iterator()
+            if (items, price) != (expected_items, expected_price)
+        ]
+        self.stdout.write(f'Cart lines with a stale price: {stale_count}')
+        self.stdout.write(f'Carts with drifted totals: {len(drifted_ids)}')
+
+        if options['dry_run'] or not (stale_count or drifted_ids):
+            return
+
+        with transaction.atomic():
+            # Repricing recounts the carts it touches (see CartItemQuerySet.update)
+            CartItem.objects.filter(pk__in=list(stale_lines.values_list('pk', flat=True))).update(unit_price=menu_price)
+            recount_cart_totals(drifted_ids)
+
+        self.stdout.write(self.style.SUCCESS('Cart totals repaired'))
@@ -0,0 +1,65 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from cart.models import Cart
+from cart.utils import delete_carts
+
+
+class Command(BaseCommand):
+    help = 'Delete guest carts that have been idle longer than CART_GUEST_MAX_AGE_DAYS, in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CART_GUEST_MAX_AGE_DAYS)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be deleted')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--days and --batch-size must be positive')
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        idle = idle_guest_carts(cutoff).order_by('updated_at').values_list('id', flat=True)
+
+        if options['dry_run']:
+            self.stdout.write(f'Guest carts idle since before {cutoff:%Y-%m-%d}: {idle.count()}')
+            return
+
+        carts_deleted = items_deleted = 0
+        while True:
+            ids = list(idle[:options['batch_size']])
+            if not ids:
+                break
+            deleted_items, deleted_carts = self.delete_batch(ids, cutoff)
+            items_deleted += deleted_items
+            carts_deleted += deleted_carts
+            self.stdout.write(f'{carts_deleted} carts deleted...')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nCart purge completed!\n'
+                f'Carts deleted: {carts_deleted}\n'
+                f'Cart items deleted: {items_deleted}'
+            )
+        )
+
+    @transaction.atomic
+    def delete_batch(self, ids, cutoff):
+        # Each batch is its own short transaction, so the SQLite write lock is held briefly.
+        # The carts are re-checked under lock: one revived or ordered from since the ids
+        # were read is left alone
+        still_idle = list(idle_guest_carts(cutoff).filter(pk__in=ids).select_for_update().values_list('id', flat=True))
+        if not still_idle:
+            return 0, 0
+        return delete_carts(still_idle)
+
+
+def idle_guest_carts(cutoff):
+    """Guest carts untouched since ``cutoff``, never one an order still points at"""
+    return Cart.objects.filter(user__isnull=True, updated_at__lt=cutoff).exclude(order__isnull=False)
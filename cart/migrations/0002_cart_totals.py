@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:05
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_totals(apps, schema_editor):
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    Food = apps.get_model('menu', 'Food')
+
+    CartItem.objects.update(unit_price=Subquery(Food.objects.filter(pk=OuterRef('food_id')).values('price')))
+
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    total_items = lines.annotate(total=Sum('quantity')).values('total')
+    total_price = lines.annotate(
+        total=Sum(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=10, decimal_places=2))
+    ).values('total')
+    Cart.objects.update(
+        total_items=Coalesce(Subquery(total_items), 0),
+        total_price=Coalesce(Subquery(total_price), Decimal('0')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+        ('menu', '0006_availability_window'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='total_items',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=8),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_totals, migrations.RunPython.noop),
+    ]
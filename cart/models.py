@@ -3,27 +3,41 @@ from django.contrib.auth.models import User
 from menu.models import Food
 
 
+class CartItemQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """Bulk updates skip post_save, so recount the affected carts here"""
+        from .utils import recount_cart_totals
+        
+        cart_ids = set(self.values_list('cart_id', flat=True).distinct())
+        updated = super().update(**kwargs)
+        if updated and ({'quantity', 'unit_price'} & kwargs.keys()):
+            recount_cart_totals(cart_ids)
+        return updated
+
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     session_key = models.CharField(max_length=40, null=True, blank=True)  # for guest users
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Running totals, maintained from CartItem writes (see cart.signals)
+    total_items = models.PositiveIntegerField(default=0, editable=False)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Guest cart lookups in get_or_create_cart
+            models.Index(fields=['session_key'], name='cart_session_key_idx'),
+            # Idle-cart scan in purge_carts
+            models.Index(fields=['updated_at'], name='cart_updated_at_idx'),
+        ]
     
     def __str__(self):
         if self.user:
             return f"Cart for {self.user.username}"
         return f"Guest Cart {self.session_key}"
-    
-    @property
-    def total_price(self):
-        return sum(item.subtotal for item in self.items.all())
-    
-    @property
-    def total_items(self):
-        return sum(item.quantity for item in self.items.all())
 
 
 class CartItem(models.Model):
@@ -33,6 +47,11 @@ class CartItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Copy of food.price, kept current when the menu price changes
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, editable=False)
+    
+    objects = CartItemQuerySet.as_manager()
+    
     class Meta:
         unique_together = ['cart', 'food']
         ordering = ['created_at']
@@ -40,6 +59,36 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.food.name}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so writes can adjust the cart totals incrementally
+        instance._loaded_cart_id = instance.__dict__.get('cart_id')
+        instance._loaded_quantity = instance.__dict__.get('quantity')
+        instance._loaded_unit_price = instance.__dict__.get('unit_price')
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        # The row just read is the baseline for the next save's total diffs
+        refreshed = {field.attname for field in self._meta.concrete_fields if field.attname in self.__dict__}
+        if fields is not None:
+            refreshed &= {self._meta.get_field(name).attname for name in fields}
+        if 'cart_id' in refreshed:
+            self._loaded_cart_id = self.cart_id
+        if 'quantity' in refreshed:
+            self._loaded_quantity = self.quantity
+        if 'unit_price' in refreshed:
+            self._loaded_unit_price = self.unit_price
+    
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.food.price
+        super().save(*args, **kwargs)
+        self._loaded_cart_id = self.cart_id
+        self._loaded_quantity = self.quantity
+        self._loaded_unit_price = self.unit_price
+    
     @property
     def subtotal(self):
-        return self.quantity * self.food.price
+        return self.quantity * self.unit_price
@@ -1,6 +1,9 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from .models import Cart, CartItem
-from menu.serializers import FoodSerializer
+from menu.images import variant_urls
+from menu.serializers import FOOD_COLUMNS, FoodSerializer, file_url, serialize_food
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -21,3 +24,80 @@ class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = ['id', 'items', 'total_price', 'total_items', 'created_at']
+
+
+# values()-based equivalent of CartSerializer for the cart read endpoints
+
+CART_ITEM_COLUMNS = ('id', 'quantity', 'unit_price', *(f'food__{column}' for column in FOOD_COLUMNS))
+
+_money = serializers.DecimalField(max_digits=10, decimal_places=2)
+_timestamp = serializers.DateTimeField()
+
+
+def serialize_cart(cart, request=None, rows=None):
+    """
+    CartSerializer(cart).data, built from one joined values() query (or
+    ``rows`` already fetched with CART_ITEM_COLUMNS). Totals are summed from
+    the same rows, equal to the stored ones, so they match the items beside
+    them even when ``cart`` was read before a later write.
+    """
+    if rows is None:
+        rows = cart.items.values(*CART_ITEM_COLUMNS)
+    rows = list(rows)
+    items = [
+        {
+            'id': row['id'],
+            'food': serialize_food({column: row[f'food__{column}'] for column in FOOD_COLUMNS}, request),
+            'quantity': row['quantity'],
+            'subtotal': _money.to_representation(row['quantity'] * row['unit_price']),
+        }
+        for row in rows
+    ]
+
+    return {
+        'id': cart.id,
+        'items': items,
+        'total_price': _money.to_representation(sum(row['quantity'] * row['unit_price'] for row in rows)),
+        'total_items': sum(row['quantity'] for row in rows),
+        'created_at': _timestamp.to_representation(cart.created_at),
+    }
+
+
+def cart_lines(rows):
+    """(item id, food row, quantity) lines from rows fetched with CART_ITEM_COLUMNS"""
+    return [
+        (row['id'], {column: row[f'food__{column}'] for column in FOOD_COLUMNS}, row['quantity'])
+        for row in rows
+    ]
+
+
+def serialize_cart_json(lines):
+    """The flat cart_items_json payload from (item id, food row, quantity) lines"""
+    items_data = []
+    total_price = Decimal('0.00')
+    total_items = 0
+    
+    for item_id, food, quantity in lines:
+        item_total = food['price'] * quantity
+        total_price += item_total
+        total_items += quantity
+        food_image_variants, food_image_srcset = variant_urls(food['image_variants'])
+        
+        items_data.append({
+            'id': item_id,
+            'food_id': food['id'],
+            'food_name': food['name'],
+            'food_price': str(food['price']),
+            'food_image': file_url(food['image']),
+            'food_image_variants': food_image_variants,
+            'food_image_srcset': food_image_srcset,
+            'quantity': quantity,
+            'total_price': str(item_total)
+        })
+    
+    return {
+        'items': items_data,
+        'total_price': str(total_price),
+        'total_items': total_items,
+        'success': True
+    }
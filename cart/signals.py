@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from menu.models import Food
+from menu.utils import foods_repriced
+from .models import CartItem
+from .utils import adjust_cart_totals, recount_cart_totals, reprice_food, reprice_foods
+
+
+@receiver(post_save, sender=CartItem)
+def update_cart_totals(sender, instance, created, **kwargs):
+    """Move the line's contribution to the cart totals"""
+    if created:
+        adjust_cart_totals(instance.cart_id, instance.quantity, instance.subtotal)
+    elif not hasattr(instance, '_loaded_quantity'):
+        # Not loaded from the database, so there is no old state to diff against
+        recount_cart_totals([instance.cart_id], touch=True)
+    else:
+        old = (instance._loaded_cart_id, instance._loaded_quantity, instance._loaded_unit_price)
+        new = (instance.cart_id, instance.quantity, instance.unit_price)
+        if old != new:
+            adjust_cart_totals(old[0], -old[1], -old[1] * old[2])
+            adjust_cart_totals(new[0], new[1], new[1] * new[2])
+
+
+@receiver(post_delete, sender=CartItem)
+def remove_from_cart_totals(sender, instance, **kwargs):
+    quantity = getattr(instance, '_loaded_quantity', instance.quantity)
+    unit_price = getattr(instance, '_loaded_unit_price', instance.unit_price)
+    adjust_cart_totals(getattr(instance, '_loaded_cart_id', instance.cart_id), -quantity, -quantity * unit_price)
+
+
+@receiver(post_save, sender=Food)
+def reprice_cart_lines(sender, instance, created, **kwargs):
+    """Carts show the current menu price, so carry price changes onto their lines"""
+    if not created and instance.price != getattr(instance, '_loaded_price', None):
+        reprice_food(instance.pk, instance.price)
+
+
+@receiver(foods_repriced)
+def reprice_cart_lines_in_bulk(sender, food_ids, **kwargs):
+    """The same for bulk price writes; the line update recounts the affected carts"""
+    reprice_foods(food_ids)
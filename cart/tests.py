@@ -1,3 +1,522 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from menu.images import FORMATS, VARIANTS
+from menu.models import Category, Food
+from order.models import Order
+from .guest import GuestCart
+from .management.commands.purge_carts import Command as PurgeCommand
+from .models import Cart, CartItem
+from .serializers import CartSerializer, serialize_cart
+from .utils import get_cart_payloads, merge_guest_cart_to_user
+
+
+class GuestCartMergeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Mains')
+        Food.objects.bulk_create(
+            Food(category=category, category_name=category.name, name=f'Dish {i}',
+                 description='', price=Decimal('2.50'))
+            for i in range(60)
+        )
+        cls.foods = list(Food.objects.order_by('id'))
+        cls.user = User.objects.create_user('diner', password='secret-pass')
+
+    def setUp(self):
+        # Cart ids repeat between tests, and cached cart reads are keyed by id
+        cache.clear()
+
+    def make_request(self):
+        request = RequestFactory().post('/')
+        request.session = SessionStore()
+        request.session.create()
+        request.user = AnonymousUser()
+        return request
+
+    def session_guest(self, lines):
+        request = self.make_request()
+        guest = GuestCart(request.session)
+        for food in self.foods[:lines]:
+            guest.add(food.id, 2)
+        return request
+
+    def database_guest(self, lines):
+        request = self.make_request()
+        cart = Cart.objects.create(session_key=request.session.session_key)
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, food=food, quantity=2, unit_price=food.price) for food in self.foods[:lines]
+        )
+        return request
+
+    def merge_queries(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            merge_guest_cart_to_user(request, self.user)
+        return len(queries)
+
+    def test_session_cart_merge_query_count_is_constant(self):
+        small = self.merge_queries(self.session_guest(5))
+        Cart.objects.filter(user=self.user).delete()
+        request = self.session_guest(50)
+        with self.assertNumQueries(small):
+            merge_guest_cart_to_user(request, self.user)
+
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.items.count(), 50)
+        self.assertEqual(cart.total_items, 100)
+        self.assertEqual(cart.total_price, Decimal('250.00'))
+        self.assertEqual(GuestCart(request.session).lines, {})
+
+    @override_settings(CART_GUEST_STORAGE='database')
+    def test_database_cart_merge_query_count_is_constant(self):
+        Cart.objects.create(user=self.user)
+        small = self.merge_queries(self.database_guest(5))
+        request = self.database_guest(50)
+        with self.assertNumQueries(small):
+            merge_guest_cart_to_user(request, self.user)
+
+        # Lines from the first merge were incremented, the rest inserted
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.items.count(), 50)
+        self.assertEqual(cart.total_items, 110)
+        self.assertEqual(cart.items.get(food=self.foods[0]).quantity, 4)
+        self.assertFalse(Cart.objects.filter(user__isnull=True).exists())
+
+    def test_login_merges_guest_cart(self):
+        session = self.client.session
+        guest = GuestCart(session)
+        guest.add(self.foods[0].id, 3)
+        session.save()
+
+        response = self.client.post(
+            '/account/api/login/', {'username': 'diner', 'password': 'secret-pass'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        data = self.client.get('/cart/api/items/').json()
+        self.assertEqual(data['total_items'], 3)
+        self.assertEqual(data['items'][0]['food']['id'], self.foods[0].id)
+
+
+class GuestSessionCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Mains')
+        cls.jollof = Food.objects.create(category=category, category_name=category.name, name='Jollof',
+                                         description='', price=Decimal('4.00'))
+        cls.suya = Food.objects.create(category=category, category_name=category.name, name='Suya',
+                                       description='', price=Decimal('3.50'))
+        cls.user = User.objects.create_user('diner', password='secret-pass')
+
+    def setUp(self):
+        cache.clear()
+
+    def fill(self, operations):
+        response = self.client.post('/cart/api/batch/', {'operations': operations}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_browsing_writes_no_cart_rows(self):
+        data = self.client.get('/cart/api/items/').json()
+        self.assertEqual((data['items'], data['total_items']), ([], 0))
+        self.assertEqual(self.client.get('/cart/api/count/').json(), {'count': 0})
+        self.assertFalse(Cart.objects.exists())
+
+    def test_cart_is_read_from_the_session(self):
+        self.fill([
+            {'op': 'add', 'food_id': self.jollof.id, 'quantity': 2},
+            {'op': 'add', 'food_id': self.suya.id, 'quantity': 1},
+            {'op': 'add', 'food_id': self.jollof.id, 'quantity': 1},
+            {'op': 'set', 'food_id': self.suya.id, 'quantity': 2},
+        ])
+
+        data = self.client.get('/cart/api/items/').json()
+        self.assertEqual([(item['food']['name'], item['quantity']) for item in data['items']],
+                         [('Jollof', 3), ('Suya', 2)])
+        self.assertEqual((data['total_items'], data['total_price']), (5, '19.00'))
+        self.assertEqual(self.client.get('/cart/api/count/').json(), {'count': 5})
+        self.assertFalse(Cart.objects.exists())
+
+        self.fill([{'op': 'remove', 'food_id': self.jollof.id}, {'op': 'set', 'food_id': self.suya.id, 'quantity': 0}])
+        self.assertEqual(self.client.get('/cart/api/count/').json(), {'count': 0})
+
+    def test_line_endpoints_edit_the_session_cart(self):
+        response = self.client.post('/cart/api/add/', {'food_id': self.jollof.id, 'quantity': 2}, content_type='application/json')
+        self.assertEqual((response.status_code, response.json()['quantity']), (201, 2))
+        self.client.post('/cart/api/add/', {'food_id': self.suya.id}, content_type='application/json')
+
+        response = self.client.put(f'/cart/api/update/{self.jollof.id}/', {'quantity': 5}, content_type='application/json')
+        self.assertEqual(response.json()['quantity'], 5)
+        self.assertEqual(self.client.delete(f'/cart/api/remove/{self.suya.id}/').status_code, 200)
+        self.assertEqual(self.client.delete(f'/cart/api/remove/{self.suya.id}/').status_code, 404)
+
+        self.assertEqual(self.client.get('/cart/api/count/').json(), {'count': 5})
+        self.assertFalse(Cart.objects.exists())
+
+    def test_invalid_quantities_are_rejected(self):
+        self.client.post('/cart/api/add/', {'food_id': self.jollof.id}, content_type='application/json')
+        for quantity in ('many', None, [2], {'n': 2}):
+            with self.subTest(quantity=quantity):
+                response = self.client.put(f'/cart/api/update/{self.jollof.id}/', {'quantity': quantity},
+                                           content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                response = self.client.post('/cart/api/add/', {'food_id': self.jollof.id, 'quantity': quantity},
+                                            content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/cart/api/count/').json(), {'count': 1})
+
+    def test_login_merges_the_cart_filled_over_http(self):
+        self.fill([
+            {'op': 'add', 'food_id': self.jollof.id, 'quantity': 2},
+            {'op': 'add', 'food_id': self.suya.id, 'quantity': 1},
+        ])
+        response = self.client.post(
+            '/account/api/login/', {'username': 'diner', 'password': 'secret-pass'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        data = self.client.get('/cart/api/items/').json()
+        self.assertEqual(data['id'], Cart.objects.get(user=self.user).id)
+        self.assertEqual((data['total_items'], data['total_price']), (3, '11.50'))
+
+    def test_deleted_foods_drop_out_of_the_cart(self):
+        self.fill([{'op': 'add', 'food_id': self.jollof.id, 'quantity': 1}])
+        self.jollof.delete()
+        self.assertEqual(self.client.get('/cart/api/items/').json()['items'], [])
+
+    @override_settings(CART_GUEST_STORAGE='database')
+    def test_database_mode_keeps_a_row_per_visitor(self):
+        self.client.get('/cart/api/items/')
+        self.assertEqual(Cart.objects.filter(user__isnull=True).count(), 1)
+
+
+class BatchCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Mains')
+        cls.rice, cls.stew = Food.objects.bulk_create([
+            Food(category=category, category_name=category.name, name='Rice', description='', price=Decimal('5.00')),
+            Food(category=category, category_name=category.name, name='Stew', description='', price=Decimal('3.00')),
+        ])
+        cls.user = User.objects.create_user('diner')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def batch(self, *operations):
+        return self.client.post('/cart/api/batch/', {'operations': list(operations)}, content_type='application/json')
+
+    def assert_totals(self, items, price):
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.total_items, self.cart.total_price), (items, Decimal(price)))
+
+    def test_add_then_remove_in_one_batch(self):
+        response = self.batch({'op': 'add', 'food_id': self.rice.id, 'quantity': 1}, {'op': 'remove', 'food_id': self.rice.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.cart.items.exists())
+        self.assert_totals(0, '0.00')
+
+    def test_add_to_existing_line_then_remove(self):
+        CartItem.objects.create(cart=self.cart, food=self.rice, quantity=2)
+        response = self.batch(
+            {'op': 'add', 'food_id': self.rice.id, 'quantity': 4},
+            {'op': 'add', 'food_id': self.stew.id, 'quantity': 1},
+            {'op': 'remove', 'food_id': self.rice.id},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_items'], 1)
+        self.assert_totals(1, '3.00')
+
+    def test_set_remove_and_add_again(self):
+        response = self.batch(
+            {'op': 'set', 'food_id': self.rice.id, 'quantity': 3},
+            {'op': 'set', 'food_id': self.rice.id, 'quantity': 0},
+            {'op': 'add', 'food_id': self.rice.id, 'quantity': 2},
+            {'op': 'set', 'food_id': self.stew.id, 'quantity': 2},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart.items.get(food=self.rice).quantity, 2)
+        self.assert_totals(4, '16.00')
+
+    def test_invalid_operation_changes_nothing(self):
+        CartItem.objects.create(cart=self.cart, food=self.rice, quantity=1)
+        response = self.batch({'op': 'remove', 'food_id': self.rice.id}, {'op': 'add', 'food_id': 999999})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['index'], 1)
+        self.assert_totals(1, '5.00')
+
+
+class StoredTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Mains')
+        cls.rice = Food.objects.create(category=cls.category, name='Rice', description='', price=Decimal('5.00'))
+        cls.user = User.objects.create_user('diner')
+
+    def setUp(self):
+        cache.clear()
+        self.cart = Cart.objects.create(user=self.user)
+        self.line = CartItem.objects.create(cart=self.cart, food=self.rice, quantity=2)
+
+    def assert_total(self, price):
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_price, Decimal(price))
+
+    def test_line_writes_move_the_totals(self):
+        self.assert_total('10.00')
+        self.line.quantity = 3
+        self.line.save()
+        self.assert_total('15.00')
+        CartItem.objects.filter(pk=self.line.pk).update(quantity=1)
+        self.assert_total('5.00')
+        CartItem.objects.get(pk=self.line.pk).delete()
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.total_items, self.cart.total_price), (0, Decimal('0.00')))
+
+    def test_save_after_refresh_diffs_against_the_refreshed_line(self):
+        CartItem.objects.filter(pk=self.line.pk).update(quantity=4)
+        self.line.refresh_from_db()
+        self.line.save()
+        self.assert_total('20.00')
+        self.line.delete()
+        self.assert_total('0.00')
+
+    def test_saving_a_food_reprices_carts(self):
+        self.rice.price = Decimal('6.00')
+        self.rice.save()
+        self.assert_total('12.00')
+
+    def test_bulk_price_update_reprices_carts(self):
+        Food.objects.filter(pk=self.rice.pk).update(price=Decimal('9.00'))
+        self.assert_total('18.00')
+        self.line.refresh_from_db()
+        self.assertEqual(self.line.unit_price, Decimal('9.00'))
+
+    def test_import_reprices_carts(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w') as csv_file:
+            csv_file.write('category,name,price,description,is_available\nMains,Rice,7.50,,true\n')
+
+        call_command('import_menu', path, stdout=StringIO())
+        self.assert_total('15.00')
+
+
+class PurgeCartsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Mains')
+        cls.food = Food.objects.create(category=category, category_name=category.name, name='Jollof',
+                                       description='', price=Decimal('4.00'))
+        cls.user = User.objects.create_user('diner')
+
+    def setUp(self):
+        cache.clear()
+
+    def make_cart(self, days_idle, **fields):
+        cart = Cart.objects.create(**fields)
+        CartItem.objects.create(cart=cart, food=self.food, quantity=2, unit_price=self.food.price)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - timedelta(days=days_idle))
+        return cart
+
+    def purge(self, *args):
+        out = StringIO()
+        call_command('purge_carts', '--days', '30', *args, stdout=out)
+        return out.getvalue()
+
+    def test_only_idle_guest_carts_go(self):
+        idle = [self.make_cart(40, session_key=f'idle-{i}') for i in range(5)]
+        recent = self.make_cart(5, session_key='recent')
+        member = self.make_cart(400, user=self.user)
+        ordered = self.make_cart(400, session_key='ordered')
+        Order.objects.create(user=self.user, cart=ordered, total=Decimal('8.00'), customer_name='Ada',
+                             customer_phone='555-0100', customer_email='ada@example.com')
+
+        output = self.purge('--batch-size', '2')
+        self.assertIn('Carts deleted: 5', output)
+        self.assertIn('Cart items deleted: 5', output)
+        self.assertEqual(set(Cart.objects.all()), {recent, member, ordered})
+        self.assertFalse(CartItem.objects.filter(cart_id__in=[cart.id for cart in idle]).exists())
+
+    def test_carts_revived_after_the_select_are_kept(self):
+        idle = [self.make_cart(40, session_key=f'idle-{i}') for i in range(3)]
+        revived = idle[1]
+        delete_batch = PurgeCommand.delete_batch
+
+        def revive_then_delete(command, ids, cutoff):
+            # The visitor comes back after the batch ids were read
+            self.assertIn(revived.pk, ids)
+            Cart.objects.filter(pk=revived.pk).update(updated_at=timezone.now())
+            return delete_batch(command, ids, cutoff)
+
+        with mock.patch.object(PurgeCommand, 'delete_batch', autospec=True, side_effect=revive_then_delete):
+            output = self.purge()
+        self.assertIn('Carts deleted: 2', output)
+        self.assertEqual(list(Cart.objects.all()), [revived])
+        self.assertEqual(revived.items.count(), 1)
+
+    def test_dry_run_deletes_nothing(self):
+        self.make_cart(40, session_key='idle')
+        self.assertIn(': 1', self.purge('--dry-run'))
+        self.assertEqual(Cart.objects.count(), 1)
+
+
+class CartPayloadCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Mains')
+        cls.jollof = Food.objects.create(category=category, category_name=category.name, name='Jollof',
+                                         description='', price=Decimal('4.00'))
+        cls.suya = Food.objects.create(category=category, category_name=category.name, name='Suya',
+                                       description='', price=Decimal('3.50'))
+        cls.user = User.objects.create_user('diner')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.create(cart=self.cart, food=self.jollof, quantity=2)
+
+    def items_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(path).json()
+        return data, [query['sql'] for query in queries if '"cart_cartitem"' in query['sql']]
+
+    def test_both_endpoints_share_one_entry(self):
+        api, lines_read = self.items_queries('/cart/api/items/')
+        self.assertEqual(len(lines_read), 1)
+        flat, lines_read = self.items_queries('/cart/api/items/json/')
+        self.assertEqual(lines_read, [])
+        self.assertEqual((api['total_items'], api['total_price']), (2, '8.00'))
+        self.assertEqual((flat['total_items'], flat['total_price']), (2, '8.00'))
+
+    def test_checkout_empties_both_endpoints(self):
+        self.client.get('/cart/api/items/')
+        self.client.get('/cart/api/items/json/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/order/api/checkout/', {
+                'customer_name': 'Ada', 'customer_phone': '555-0100', 'customer_email': 'ada@example.com',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        api = self.client.get('/cart/api/items/').json()
+        flat = self.client.get('/cart/api/items/json/').json()
+        self.assertEqual((api['items'], api['total_items'], api['total_price']), ([], 0, '0.00'))
+        self.assertEqual((flat['items'], flat['total_items'], flat['total_price']), ([], 0, '0.00'))
+
+    def test_totals_match_the_items_when_the_cart_was_read_before_a_write(self):
+        stale = Cart.objects.get(pk=self.cart.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.create(cart=self.cart, food=self.suya, quantity=1)
+
+        api = get_cart_payloads(stale)['api']
+        self.assertEqual(len(api['items']), 2)
+        self.assertEqual((api['total_items'], api['total_price']), (3, '11.50'))
+
+
+class CartCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Mains')
+        cls.jollof = Food.objects.create(category=category, category_name=category.name, name='Jollof',
+                                         description='', price=Decimal('4.00'))
+        cls.suya = Food.objects.create(category=category, category_name=category.name, name='Suya',
+                                       description='', price=Decimal('3.50'))
+        cls.user = User.objects.create_user('diner')
+
+    def setUp(self):
+        cache.clear()
+
+    def write(self, method, path, data=None):
+        # The cached count is dropped on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(path, data, content_type='application/json')
+        self.assertLess(response.status_code, 300)
+        return response
+
+    def count(self):
+        return self.client.get('/cart/api/count/').json()['count']
+
+    def assert_writes_refresh_the_count(self):
+        self.assertEqual(self.count(), 0)
+        line = self.write('post', '/cart/api/add/', {'food_id': self.jollof.id, 'quantity': 2}).json()
+        self.assertEqual(self.count(), 2)
+        self.write('put', f'/cart/api/update/{line["id"]}/', {'quantity': 5})
+        self.assertEqual(self.count(), 5)
+        self.write('post', '/cart/api/batch/', {'operations': [{'op': 'add', 'food_id': self.suya.id, 'quantity': 1}]})
+        self.assertEqual(self.count(), 6)
+        self.write('delete', f'/cart/api/remove/{line["id"]}/')
+        self.assertEqual(self.count(), 1)
+
+    def test_member_count_follows_every_write(self):
+        self.client.force_login(self.user)
+        self.assert_writes_refresh_the_count()
+
+        self.write('post', '/order/api/checkout/', {
+            'customer_name': 'Ada', 'customer_phone': '555-0100', 'customer_email': 'ada@example.com',
+        })
+        self.assertEqual(self.count(), 0)
+
+    @override_settings(CART_GUEST_STORAGE='database')
+    def test_database_guest_count_follows_every_write(self):
+        self.assert_writes_refresh_the_count()
+
+    def test_warm_count_is_one_cache_get(self):
+        self.client.force_login(self.user)
+        self.write('post', '/cart/api/add/', {'food_id': self.jollof.id, 'quantity': 3})
+        self.assertEqual(self.count(), 3)
+
+        with mock.patch('cart.utils.cache', wraps=cache) as counted_cache:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.count(), 3)
+        self.assertEqual(counted_cache.get.call_count, 1)
+        self.assertEqual([query['sql'] for query in queries if '"cart_cart' in query['sql']], [])
+
+
+class CartSerializerParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Mains')
+        jollof = Food.objects.create(category=category, category_name=category.name, name='Jollof',
+                                     description='', price=Decimal('4.00'))
+        suya = Food.objects.create(category=category, category_name=category.name, name='Suya',
+                                   description='', price=Decimal('3.50'))
+        Food.objects.filter(pk=jollof.pk).update(
+            image='foods/jollof.jpg',
+            image_variants={variant: {fmt: f'foods/derived/jollof-{variant}.{fmt}' for fmt in FORMATS}
+                            for variant in VARIANTS},
+        )
+        cls.cart = Cart.objects.create(session_key='parity')
+        CartItem.objects.create(cart=cls.cart, food=jollof, quantity=2)
+        CartItem.objects.create(cart=cls.cart, food=suya, quantity=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cart_matches_the_serializer(self):
+        cart = Cart.objects.get(pk=self.cart.pk)
+        request = RequestFactory().get('/cart/api/items/')
+        for context in ({}, {'request': request}):
+            with self.subTest(request='request' in context):
+                fast = serialize_cart(cart, context.get('request'))
+                self.assertEqual(fast, CartSerializer(cart, context=context).data)
+                self.assertEqual((fast['total_items'], fast['total_price']), (5, '18.50'))
+
+    def test_empty_cart_matches_the_serializer(self):
+        cart = Cart.objects.create(session_key='empty')
+        self.assertEqual(serialize_cart(cart), CartSerializer(cart).data)
@@ -6,9 +6,12 @@ app_name = 'cart'
 urlpatterns = [
     # API endpoints
     path('api/items/', views.cart_items, name='api_cart_items'),
+    path('api/items/json/', views.cart_items_json, name='api_cart_items_json'),
+    path('api/count/', views.cart_count, name='api_cart_count'),
     path('api/add/', views.add_to_cart, name='api_add_to_cart'),
     path('api/update/<int:item_id>/', views.update_cart_item, name='api_update_cart_item'),
     path('api/remove/<int:item_id>/', views.remove_from_cart, name='api_remove_from_cart'),
+    path('api/batch/', views.batch_update_cart, name='api_batch_update_cart'),
     
     # Template views
     path('', views.cart_page, name='cart'),
@@ -1,57 +1,356 @@
+import time
+from decimal import Decimal
+
+from .guest import GuestCart, guest_carts_in_session
 from .models import Cart, CartItem
+from .serializers import CART_ITEM_COLUMNS, cart_lines, serialize_cart, serialize_cart_json
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from menu import schedule
+from menu.models import Food
+from menu.utils import ALL_FOODS_SCOPE, get_menu_version
+
+
+MERGE_BATCH_SIZE = 500
 
 
 def merge_guest_cart_to_user(request, user):
     """
-    Merge guest cart items to user cart when user logs in
+    Merge guest cart items to user cart when user logs in. Call it before
+    login(), which rotates the session key a database guest cart is stored
+    under. Runs a fixed number of statements per MERGE_BATCH_SIZE lines:
+    one multi-row upsert adds new lines and increments existing ones, then
+    the totals are recounted once and the guest cart is deleted.
     """
-    if not request.session.session_key:
+    guest = GuestCart(request.session)
+    incoming = {int(food_id): quantity for food_id, quantity in guest.lines.items()}
+    
+    guest_cart_ids = []
+    if request.session.session_key:
+        guest_cart_ids = list(
+            Cart.objects.filter(session_key=request.session.session_key, user__isnull=True).values_list('id', flat=True)
+        )
+    if guest_cart_ids:
+        for food_id, quantity in CartItem.objects.filter(cart_id__in=guest_cart_ids).values_list('food_id', 'quantity'):
+            incoming[food_id] = incoming.get(food_id, 0) + quantity
+    
+    if not incoming and not guest_cart_ids:
         return
     
-    try:
-        # Get guest cart
-        guest_cart = Cart.objects.get(session_key=request.session.session_key)
-        
-        # Get or create user cart
-        user_cart, created = Cart.objects.get_or_create(user=user)
-        
-        # Merge cart items
-        for guest_item in guest_cart.items.all():
-            user_item, created = CartItem.objects.get_or_create(
-                cart=user_cart,
-                food=guest_item.food,
-                defaults={'quantity': guest_item.quantity}
-            )
-            
-            if not created:
-                # If item already exists, add quantities
-                user_item.quantity += guest_item.quantity
-                user_item.save()
-        
-        # Delete guest cart
-        guest_cart.delete()
-        
-    except Cart.DoesNotExist:
-        pass
+    with transaction.atomic():
+        if incoming:
+            user_cart, created = Cart.objects.get_or_create(user=user)
+            # Foods deleted since they were added are dropped here
+            prices = Food.objects.filter(id__in=incoming).order_by().values_list('id', 'price')
+            lines = [(food_id, incoming[food_id], price) for food_id, price in prices]
+            for start in range(0, len(lines), MERGE_BATCH_SIZE):
+                upsert_cart_items(user_cart.id, lines[start:start + MERGE_BATCH_SIZE])
+            recount_cart_totals([user_cart.id], touch=True)
+            forget_cart_count(user_cart)
+        if guest_cart_ids:
+            delete_carts(guest_cart_ids)
+    
+    guest.clear()
+
+
+CART_COUNT_TIMEOUT = 60 * 5  # Bounds staleness from writes outside the cart views (e.g. the admin)
+
+
+def cart_count_key(user_id=None, session_key=None):
+    if user_id:
+        return f'cart_count_user_{user_id}'
+    return f'cart_count_session_{session_key}'
+
+
+def forget_cart_count(cart):
+    """Drop the cached badge count after ``cart`` changed; call it from every mutation path"""
+    if isinstance(cart, GuestCart):
+        return
+    key = cart_count_key(cart.user_id, cart.session_key)
+    transaction.on_commit(lambda: cache.delete(key))
 
 
 def get_cart_count(request):
     """
-    Get total number of items in cart
+    Get total number of items in cart. Logged-in users and database guest
+    carts are served from a cached counter, so this is usually one cache
+    get; session-held guest carts are counted from the session itself.
     """
     if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            return cart.total_items
-        except Cart.DoesNotExist:
-            return 0
+        key = cart_count_key(user_id=request.user.pk)
+        carts = Cart.objects.filter(user=request.user)
+    elif guest_carts_in_session():
+        return GuestCart(request.session).total_items
+    elif request.session.session_key:
+        key = cart_count_key(session_key=request.session.session_key)
+        carts = Cart.objects.filter(session_key=request.session.session_key)
     else:
-        session_key = request.session.session_key
-        if session_key:
+        return 0
+    
+    count = cache.get(key)
+    if count is None:
+        count = carts.values_list('total_items', flat=True).first() or 0
+        cache.set(key, count, CART_COUNT_TIMEOUT)
+    return count
+
+
+CART_CACHE_TIMEOUT = 60 * 60  # Payloads are keyed by version, so this only bounds idle entries
+
+
+def get_cart_version(cart_id):
+    """Return the current version of a cart's cached reads, seeding it if the cache was flushed"""
+    version_key = f'cart_version_{cart_id}'
+    version = cache.get(version_key)
+    if version is None:
+        # Seed from the clock so a flushed cache never matches an old payload again
+        cache.add(version_key, int(time.time() * 1000), settings.CACHE_VERSION_TIMEOUT)
+        version = cache.get(version_key)
+    return version
+
+
+def bump_cart_version(*cart_ids):
+    """Orphan the cached reads of each cart once the current transaction commits"""
+    def bump():
+        for cart_id in cart_ids:
             try:
-                cart = Cart.objects.get(session_key=session_key)
-                return cart.total_items
-            except Cart.DoesNotExist:
-                return 0
-    return 0
+                cache.incr(f'cart_version_{cart_id}')
+            except ValueError:
+                get_cart_version(cart_id)
+    transaction.on_commit(bump)
+
+
+def get_cart_payloads(cart):
+    """
+    Both cart read payloads, ``{'api': <CartSerializer shape>, 'json':
+    <cart_items_json shape>}``, from one cache entry keyed by the cart's
+    version and the menu version, so neither endpoint can serve a cart
+    older than its last write or menu edit. A miss runs one items query.
+    """
+    version_keys = [f'cart_version_{cart.id}', f'menu_version_{ALL_FOODS_SCOPE}']
+    versions = cache.get_many(version_keys)
+    cart_version = versions.get(version_keys[0]) or get_cart_version(cart.id)
+    menu_version = versions.get(version_keys[1]) or get_menu_version(ALL_FOODS_SCOPE)
+
+    cache_key = f'cart_data_{cart.id}_{cart_version}_{menu_version}'
+    payloads = cache.get(cache_key)
+    if payloads is None:
+        rows = list(cart.items.values(*CART_ITEM_COLUMNS))
+        payloads = {
+            'api': serialize_cart(cart, rows=rows),
+            'json': serialize_cart_json(cart_lines(rows)),
+        }
+        cache.set(cache_key, payloads, CART_CACHE_TIMEOUT)
+    return payloads
+
+
+def adjust_cart_totals(cart_id, items_delta, price_delta):
+    """Apply an incremental change to a cart's stored totals and mark it active"""
+    if cart_id and (items_delta or price_delta):
+        Cart.objects.filter(pk=cart_id).update(
+            total_items=F('total_items') + items_delta,
+            total_price=F('total_price') + price_delta,
+            updated_at=timezone.now(),
+        )
+        bump_cart_version(cart_id)
+
+
+def recount_cart_totals(cart_ids=None, touch=False):
+    """
+    Recompute the stored totals for ``cart_ids`` (or every cart) in one
+    statement. ``touch`` also marks the carts active, for customer edits.
+    """
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    total_items = lines.annotate(total=Sum('quantity')).values('total')
+    total_price = lines.annotate(
+        total=Sum(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=10, decimal_places=2))
+    ).values('total')
+
+    carts = Cart.objects.all()
+    if cart_ids is not None:
+        carts = carts.filter(pk__in=cart_ids)
+        bump_cart_version(*cart_ids)
+    extra = {'updated_at': timezone.now()} if touch else {}
+    return carts.update(
+        total_items=Coalesce(Subquery(total_items), 0),
+        total_price=Coalesce(Subquery(total_price), Decimal('0')),
+        **extra
+    )
+
+
+def reprice_food(food_id, price):
+    """Move every cart line for ``food_id`` to the new menu price"""
+    return CartItem.objects.filter(food_id=food_id).exclude(unit_price=price).update(unit_price=price)
+
+
+def reprice_foods(food_ids):
+    """Move every cart line for ``food_ids`` to its food's current price in one statement"""
+    price = Food.objects.filter(pk=OuterRef('food_id')).values('price')
+    return CartItem.objects.filter(food_id__in=food_ids).exclude(unit_price=F('food__price')).update(
+        unit_price=Subquery(price)
+    )
+
+
+UPSERT_SQL = """
+    INSERT INTO {table} (cart_id, food_id, quantity, unit_price, created_at, updated_at)
+    VALUES {values}
+    ON CONFLICT (cart_id, food_id) DO UPDATE SET
+        quantity = {quantity},
+        updated_at = excluded.updated_at
+    RETURNING id
+"""
+
+
+def upsert_cart_items(cart_id, lines, increment=True):
+    """
+    Insert cart lines, or add their quantity to the existing ones (replace
+    it when ``increment`` is false), in a single statement so concurrent
+    adds never lose an update. ``lines`` are ``(food_id, quantity,
+    unit_price)``; returns the line ids. Signals don't run, so the caller
+    keeps the cart totals in step.
+    """
+    table = CartItem._meta.db_table
+    sql = UPSERT_SQL.format(
+        table=table,
+        values=', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(lines)),
+        quantity=f'{table}.quantity + excluded.quantity' if increment else 'excluded.quantity',
+    )
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    params = [
+        value
+        for food_id, quantity, unit_price in lines
+        for value in (cart_id, food_id, quantity, connection.ops.adapt_decimalfield_value(unit_price, 8, 2), now, now)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def upsert_cart_item(cart_id, food_id, quantity, unit_price, increment=True):
+    """Single-line upsert_cart_items; returns the line id"""
+    return upsert_cart_items(cart_id, [(food_id, quantity, unit_price)], increment)[0]
+
+
+def remove_cart_items(cart_id, food_ids):
+    """
+    Delete a cart's lines for ``food_ids`` with one plain DELETE. Signals
+    don't run, so the caller recounts the cart totals afterwards.
+    """
+    placeholders = ', '.join(['%s'] * len(food_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {CartItem._meta.db_table} WHERE cart_id = %s AND food_id IN ({placeholders})',
+            [cart_id, *food_ids]
+        )
+        return cursor.rowcount
+
+
+def delete_carts(cart_ids):
+    """
+    Delete carts and their lines with two plain DELETEs. The ORM would load
+    every line and run the cart-total signals for carts that are going away.
+    Returns ``(items_deleted, carts_deleted)``.
+    """
+    placeholders = ', '.join(['%s'] * len(cart_ids))
+    bump_cart_version(*cart_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {CartItem._meta.db_table} WHERE cart_id IN ({placeholders})', cart_ids)
+        items = cursor.rowcount
+        cursor.execute(f'DELETE FROM {Cart._meta.db_table} WHERE id IN ({placeholders})', cart_ids)
+        return items, cursor.rowcount
+
+
+def clear_cart(cart):
+    """
+    Empty a cart with one DELETE and zero its totals with one UPDATE,
+    instead of deleting line by line through the cart-total signals
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {CartItem._meta.db_table} WHERE cart_id = %s', [cart.id])
+        items = cursor.rowcount
+    Cart.objects.filter(pk=cart.id).update(total_items=0, total_price=Decimal('0'), updated_at=timezone.now())
+    bump_cart_version(cart.id)
+    forget_cart_count(cart)
+    return items
+
+
+@transaction.atomic
+def add_to_cart_item(cart, food, quantity):
+    """Add ``quantity`` of ``food`` to a cart and its totals; returns the line id"""
+    item_id = upsert_cart_item(cart.id, food.id, quantity, food.price)
+    adjust_cart_totals(cart.id, quantity, quantity * food.price)
+    return item_id
+
+
+CART_OPERATIONS = ('add', 'set', 'remove')
+
+
+class CartOperationError(Exception):
+    """A batch operation that can't be applied; ``index`` is its position in the batch"""
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+
+
+def _parse_operations(operations):
+    if not isinstance(operations, list) or not operations:
+        raise CartOperationError(None, 'operations must be a non-empty list')
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in CART_OPERATIONS:
+            raise CartOperationError(index, f"op must be one of {', '.join(CART_OPERATIONS)}")
+        try:
+            food_id = int(operation.get('food_id'))
+            quantity = int(operation.get('quantity', 1 if operation['op'] == 'add' else 0))
+        except (TypeError, ValueError):
+            raise CartOperationError(index, 'food_id and quantity must be integers')
+        if quantity < (1 if operation['op'] == 'add' else 0):
+            raise CartOperationError(index, 'Invalid quantity')
+        parsed.append((operation['op'], food_id, quantity))
+    return parsed
+
+
+def apply_cart_operations(cart, operations):
+    """
+    Apply a list of ``{'op': 'add'|'set'|'remove', 'food_id': .., 'quantity': ..}``
+    to a cart, in order and all-or-nothing. Lines are addressed by food id
+    so the same batch works for session-held guest carts. ``set`` with a
+    quantity of 0 removes the line.
+    """
+    parsed = _parse_operations(operations)
+
+    added = {food_id for op, food_id, quantity in parsed if op == 'add' or (op == 'set' and quantity)}
+    foods = Food.objects.filter(is_available=True).in_bulk(added)
+    for index, (op, food_id, quantity) in enumerate(parsed):
+        if food_id in added:
+            food = foods.get(food_id)
+            if food is None:
+                raise CartOperationError(index, 'Food item not found')
+            if not schedule.is_orderable(food):
+                raise CartOperationError(index, 'This item is not available right now')
+
+    if isinstance(cart, GuestCart):
+        for op, food_id, quantity in parsed:
+            if op == 'add':
+                cart.add(food_id, quantity)
+            elif op == 'set' and quantity:
+                cart.set(food_id, quantity)
+            else:
+                cart.remove(food_id)
+        return
+
+    with transaction.atomic():
+        for op, food_id, quantity in parsed:
+            if op == 'remove' or not quantity:
+                # Raw, like the upserts: the delete signal would subtract totals they never added
+                remove_cart_items(cart.id, [food_id])
+            else:
+                upsert_cart_item(cart.id, food_id, quantity, foods[food_id].price, increment=op == 'add')
+        # One recount covers every write above
+        recount_cart_totals([cart.id], touch=True)
@@ -2,22 +2,32 @@ from django.shortcuts import render, get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from rest_framework import generics, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from .guest import GuestCart, guest_carts_in_session
 from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
+from .utils import (
+    CartOperationError, add_to_cart_item, apply_cart_operations, forget_cart_count, get_cart_count,
+    get_cart_payloads
+)
+from .serializers import CartItemSerializer, serialize_cart_json
+from menu import schedule
 from menu.models import Food
 from django.http import JsonResponse
 from django.views.decorators.cache import cache_page
 from django.views.decorators.http import require_http_methods
-from django.core.cache import cache
-from decimal import Decimal
 
 
 def get_or_create_cart(request):
-    """Get or create cart for user or session"""
+    """
+    Get or create cart for user or session. Anonymous visitors get a
+    GuestCart held in their session unless CART_GUEST_STORAGE is 'database'.
+    """
     if request.user.is_authenticated:
         cart, created = Cart.objects.get_or_create(user=request.user)
+    elif guest_carts_in_session():
+        return GuestCart(request.session)
     else:
         session_key = request.session.session_key
         if not session_key:
@@ -27,37 +37,55 @@ def get_or_create_cart(request):
     return cart
 
 
+def parse_quantity(value):
+    """The requested quantity as an int, or None when it isn't one"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 @api_view(['GET'])
 def cart_items(request):
     cart = get_or_create_cart(request)
-    serializer = CartSerializer(cart)
-    return Response(serializer.data)
+    if isinstance(cart, GuestCart):
+        return Response(cart.serialize())
+    return Response(get_cart_payloads(cart)['api'])
+
+
+@api_view(['GET'])
+def cart_count(request):
+    """Item count for the header badge, without serializing the cart"""
+    return Response({'count': get_cart_count(request)})
 
 
 @csrf_exempt
 @api_view(['POST'])
+@permission_classes([AllowAny])
 def add_to_cart(request):
     cart = get_or_create_cart(request)
     food_id = request.data.get('food_id')
-    quantity = request.data.get('quantity', 1)
+    quantity = parse_quantity(request.data.get('quantity', 1))
+    if quantity is None or quantity < 1:
+        return Response({'error': 'Invalid quantity'}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
         food = Food.objects.get(id=food_id, is_available=True)
     except Food.DoesNotExist:
         return Response({'error': 'Food item not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        food=food,
-        defaults={'quantity': quantity}
-    )
+    if not schedule.is_orderable(food):
+        return Response({'error': 'This item is not available right now'}, status=status.HTTP_400_BAD_REQUEST)
     
-    if not created:
-        cart_item.quantity += int(quantity)
-        cart_item.save()
+    if isinstance(cart, GuestCart):
+        cart.add(food.id, quantity)
+        return Response(cart.serialize_item(food.id), status=status.HTTP_201_CREATED)
     
-    cache_key = f'cart_items_{cart.id}'
-    cache.delete(cache_key)
+    # Insert-or-increment in one statement, so double taps can't lose an add
+    item_id = add_to_cart_item(cart, food, quantity)
+    cart_item = CartItem.objects.select_related('food').get(id=item_id)
+    
+    forget_cart_count(cart)
     
     serializer = CartItemSerializer(cart_item)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -65,23 +93,34 @@ def add_to_cart(request):
 
 @csrf_exempt
 @api_view(['PUT'])
+@permission_classes([AllowAny])
 def update_cart_item(request, item_id):
     cart = get_or_create_cart(request)
+    quantity = parse_quantity(request.data.get('quantity', 1))
+    if quantity is None:
+        return Response({'error': 'Invalid quantity'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if isinstance(cart, GuestCart):
+        if item_id not in cart:
+            return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
+        if quantity <= 0:
+            cart.remove(item_id)
+            return Response({'message': 'Item removed from cart'})
+        cart.set(item_id, quantity)
+        return Response(cart.serialize_item(item_id))
+    
     try:
         cart_item = CartItem.objects.get(id=item_id, cart=cart)
-        quantity = request.data.get('quantity', 1)
         
         if quantity <= 0:
             cart_item.delete()
-            cache_key = f'cart_items_{cart.id}'
-            cache.delete(cache_key)
+            forget_cart_count(cart)
             return Response({'message': 'Item removed from cart'})
         
         cart_item.quantity = quantity
         cart_item.save()
         
-        cache_key = f'cart_items_{cart.id}'
-        cache.delete(cache_key)
+        forget_cart_count(cart)
         
         serializer = CartItemSerializer(cart_item)
         return Response(serializer.data)
@@ -91,20 +130,47 @@ def update_cart_item(request, item_id):
 
 @csrf_exempt
 @api_view(['DELETE'])
+@permission_classes([AllowAny])
 def remove_from_cart(request, item_id):
     cart = get_or_create_cart(request)
+    if isinstance(cart, GuestCart):
+        if not cart.remove(item_id):
+            return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'message': 'Item removed from cart'})
+    
     try:
         cart_item = CartItem.objects.get(id=item_id, cart=cart)
         cart_item.delete()
         
-        cache_key = f'cart_items_{cart.id}'
-        cache.delete(cache_key)
+        forget_cart_count(cart)
         
         return Response({'message': 'Item removed from cart'})
     except CartItem.DoesNotExist:
         return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@csrf_exempt
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def batch_update_cart(request):
+    """
+    Apply several add/set/remove operations in one request and return the
+    updated cart: ``{"operations": [{"op": "set", "food_id": 3, "quantity": 2}, ...]}``
+    """
+    cart = get_or_create_cart(request)
+    try:
+        apply_cart_operations(cart, request.data.get('operations'))
+    except CartOperationError as e:
+        return Response({'error': e.message, 'index': e.index}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if isinstance(cart, GuestCart):
+        return Response(cart.serialize())
+    
+    forget_cart_count(cart)
+    cart.refresh_from_db(fields=['total_items', 'total_price'])
+    return Response(get_cart_payloads(cart)['api'])
+
+
 # Template views
 def cart_page(request):
     return render(request, 'cart/cart.html')
@@ -114,39 +180,8 @@ def cart_page(request):
 def cart_items_json(request):
     """Fast JSON endpoint for cart items"""
     cart = get_or_create_cart(request)
-    cache_key = f'cart_items_{cart.id}'
-    cart_data = cache.get(cache_key)
-    
-    if cart_data is None:
-        cart_items = CartItem.objects.filter(cart=cart).select_related('food', 'food__category')
-        
-        items_data = []
-        total_price = Decimal('0.00')
-        total_items = 0
-        
-        for item in cart_items:
-            item_total = item.food.price * item.quantity
-            total_price += item_total
-            total_items += item.quantity
-            
-            items_data.append({
-                'id': item.id,
-                'food_id': item.food.id,
-                'food_name': item.food.name,
-                'food_price': str(item.food.price),
-                'food_image': item.food.image.url if item.food.image else None,
-                'quantity': item.quantity,
-                'total_price': str(item_total)
-            })
-        
-        cart_data = {
-            'items': items_data,
-            'total_price': str(total_price),
-            'total_items': total_items,
-            'success': True
-        }
-        
-        # Cache for 1 minute (short cache since cart changes frequently)
-        cache.set(cache_key, cart_data, 60)
-    
-    return JsonResponse(cart_data)
+    if isinstance(cart, GuestCart):
+        # Read straight from the session; there is no row to key a cache entry on
+        lines = [(food['id'], food, quantity) for food, quantity in cart.food_lines()]
+        return JsonResponse(serialize_cart_json(lines))
+    return JsonResponse(get_cart_payloads(cart)['json'])
@@ -1,6 +1,14 @@
 from django.contrib import admin
+from django.core.files.storage import default_storage
 from django.utils.html import format_html
-from .models import Category, Food
+from . import search
+from .models import AvailabilityWindow, Category, Food
+
+
+class AvailabilityWindowInline(admin.TabularInline):
+    model = AvailabilityWindow
+    fields = ['name', 'weekday', 'starts_at', 'ends_at']
+    extra = 0
 
 
 @admin.register(Category)
@@ -8,14 +16,15 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'foods_count', 'created_at']
     search_fields = ['name', 'description']
     readonly_fields = ['created_at']
+    inlines = [AvailabilityWindowInline]
     
     def foods_count(self, obj):
-        count = obj.foods.filter(is_available=True).count()
         return format_html(
             '<span style="font-weight: bold; color: #28a745;">{}</span>',
-            count
+            obj.available_foods_count
         )
     foods_count.short_description = 'Available Foods'
+    foods_count.admin_order_field = 'available_foods_count'
 
 
 @admin.register(Food)
@@ -28,6 +37,7 @@ class FoodAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     list_editable = ['is_available', 'price']
     readonly_fields = ['created_at', 'updated_at', 'image_preview']
+    inlines = [AvailabilityWindowInline]
     
     fieldsets = (
         ('Basic Information', {
@@ -55,13 +65,21 @@ class FoodAdmin(admin.ModelAdmin):
     
     def image_preview(self, obj):
         if obj.image:
+            # Prefer the small derivative over the full-size upload
+            thumb = obj.image_variants.get('thumb', {}).get('jpeg')
             return format_html(
                 '<img src="{}" style="max-height: 100px; max-width: 150px; border-radius: 4px;"/>',
-                obj.image.url
+                default_storage.url(thumb) if thumb else obj.image.url
             )
         return "No image"
     image_preview.short_description = 'Image Preview'
     
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of a leading-wildcard scan when we can
+        if search_term and search.fts_available():
+            return queryset.filter(pk__in=search.matching_ids(search_term)), False
+        return super().get_search_results(request, queryset, search_term)
+    
     actions = ['make_available', 'make_unavailable']
     
     def make_available(self, request, queryset):
@@ -0,0 +1,104 @@
+"""
+Responsive derivatives for Food.image.
+
+Every uploaded photo is resized into a few fixed sizes, each saved as WebP
+and JPEG under a name derived from the original's content hash. The names
+never change for a given photo, so they can be served with far-future,
+immutable cache headers, and re-saving the same photo writes nothing new.
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+DERIVED_DIR = 'foods/derived'
+
+# name -> (width, height); images are cropped to fill the box
+VARIANTS = {
+    'thumb': (160, 120),
+    'card': (480, 360),
+    'hero': (1280, 720),
+}
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def content_hash(field_file):
+    digest = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()[:20]
+
+
+def _encode(image, fmt):
+    pil_format, options = FORMATS[fmt]
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def generate_variants(field_file):
+    """
+    Write every size/format of ``field_file`` and return the map stored on
+    Food.image_variants: ``{'thumb': {'webp': name, 'jpeg': name}, ...}``.
+    """
+    if not field_file:
+        return {}
+
+    digest = content_hash(field_file)
+    names = {
+        variant: {fmt: f'{DERIVED_DIR}/{digest}-{variant}.{fmt}' for fmt in FORMATS}
+        for variant in VARIANTS
+    }
+    if all(default_storage.exists(name) for formats in names.values() for name in formats.values()):
+        return names
+
+    field_file.open('rb')
+    try:
+        with Image.open(field_file) as original:
+            # Apply the camera's rotation, then drop EXIF and any alpha channel
+            source = ImageOps.exif_transpose(original).convert('RGB')
+    finally:
+        field_file.close()
+
+    for variant, size in VARIANTS.items():
+        resized = ImageOps.fit(source, size, Image.Resampling.LANCZOS)
+        for fmt, name in names[variant].items():
+            if not default_storage.exists(name):
+                default_storage.save(name, _encode(resized, fmt))
+
+    return names
+
+
+def variant_urls(variants, build_url=None):
+    """
+    Turn stored variant names into URLs: returns ``(urls, srcset)`` where
+    ``urls`` mirrors the variants map and ``srcset`` maps each format to a
+    ready-to-use ``srcset`` attribute value.
+    """
+    if not variants:
+        return None, None
+
+    build_url = build_url or (lambda url: url)
+    urls = {
+        variant: {fmt: build_url(default_storage.url(name)) for fmt, name in formats.items()}
+        for variant, formats in variants.items()
+    }
+    srcset = {
+        fmt: ', '.join(
+            f'{urls[variant][fmt]} {VARIANTS[variant][0]}w'
+            for variant in VARIANTS if variant in urls and fmt in urls[variant]
+        )
+        for fmt in FORMATS
+    }
+    return urls, srcset
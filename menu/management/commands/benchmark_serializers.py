@@ -0,0 +1,77 @@
+import timeit
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from cart.models import Cart, CartItem
+from cart.serializers import CartSerializer, serialize_cart
+from cart.utils import recount_cart_totals
+from menu.models import Category, Food
+from menu.serializers import FOOD_COLUMNS, FoodSerializer, serialize_foods
+from order.models import Order, OrderItem
+from order.serializers import OrderSerializer, serialize_orders
+
+
+class Command(BaseCommand):
+    help = 'Time the DRF serializers against the values()-based fast paths on throwaway data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000', help='Comma-separated row counts')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.repeat = options['repeat']
+
+        self.stdout.write(f"{'endpoint':<8}{'rows':>7}{'drf ms':>10}{'fast ms':>10}{'speedup':>9}")
+        # Everything is created inside a transaction that is rolled back
+        with transaction.atomic():
+            for size in sizes:
+                self.run_size(size)
+            transaction.set_rollback(True)
+
+    def run_size(self, size):
+        category = Category.objects.create(name=f'Benchmark {size}')
+        Food.objects.bulk_create(
+            Food(category=category, category_name=category.name, name=f'Dish {i}',
+                 description='Benchmark dish', price=Decimal('9.99') + i)
+            for i in range(size)
+        )
+        foods = Food.objects.filter(category=category)
+
+        cart = Cart.objects.create(session_key=f'benchmark-{size}')
+        CartItem.objects.bulk_create(CartItem(cart=cart, food=food, quantity=2, unit_price=food.price) for food in foods)
+        recount_cart_totals([cart.id])
+        cart.refresh_from_db()
+
+        user = User.objects.create(username=f'benchmark-{size}')
+        carts = Cart.objects.bulk_create(Cart(session_key=f'benchmark-{size}-{i}') for i in range(size))
+        orders = Order.objects.bulk_create(
+            Order(user=user, cart=order_cart, total=Decimal('19.98'), customer_name='Bench',
+                  customer_phone='000', customer_email='bench@example.com')
+            for order_cart in carts
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, food_name='Dish', food_price=Decimal('9.99'), quantity=2, subtotal=Decimal('19.98'))
+            for order in orders
+        )
+        orders = Order.objects.filter(user=user).order_by('-created_at')
+
+        self.compare('foods', size,
+                     lambda: FoodSerializer(foods, many=True).data,
+                     lambda: serialize_foods(foods.values(*FOOD_COLUMNS)))
+        self.compare('cart', size,
+                     lambda: CartSerializer(cart).data,
+                     lambda: serialize_cart(cart))
+        self.compare('orders', size,
+                     lambda: OrderSerializer(orders, many=True).data,
+                     lambda: serialize_orders(orders))
+
+    def compare(self, name, size, slow, fast):
+        if slow() != fast():
+            raise CommandError(f'{name}: fast serializer output differs from the DRF serializer')
+
+        slow_ms = min(timeit.repeat(slow, number=1, repeat=self.repeat)) * 1000
+        fast_ms = min(timeit.repeat(fast, number=1, repeat=self.repeat)) * 1000
+        self.stdout.write(f'{name:<8}{size:>7}{slow_ms:>10.1f}{fast_ms:>10.1f}{slow_ms / fast_ms:>8.1f}x')
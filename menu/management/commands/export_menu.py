@@ -0,0 +1,49 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from menu.models import Food
+
+
+EXPORT_FIELDS = ['category', 'name', 'price', 'description', 'is_available']
+
+
+class Command(BaseCommand):
+    help = 'Stream the menu to a CSV or JSONL file (the format import_menu reads)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Output file ('-' for stdout)")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+
+        rows = (
+            Food.objects.order_by('id')
+            .values('category_name', 'name', 'price', 'description', 'is_available')
+            .iterator(chunk_size=options['batch_size'])
+        )
+
+        stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            writer = csv.writer(stream) if fmt == 'csv' else None
+            if writer:
+                writer.writerow(EXPORT_FIELDS)
+
+            exported = 0
+            for row in rows:
+                values = [row['category_name'], row['name'], str(row['price']), row['description'], row['is_available']]
+                if writer:
+                    writer.writerow(values)
+                else:
+                    stream.write(json.dumps(dict(zip(EXPORT_FIELDS, values))) + '\n')
+                exported += 1
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        if path != '-':
+            self.stdout.write(self.style.SUCCESS(f'Exported {exported} food items to {path}'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from PIL import UnidentifiedImageError
+from menu.images import generate_variants
+from menu.models import Food
+
+
+class Command(BaseCommand):
+    help = 'Generate the responsive image derivatives for existing food photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Regenerate for every food, not only those without derivatives'
+        )
+
+    def handle(self, *args, **options):
+        foods = Food.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            foods = foods.filter(image_variants={})
+        
+        generated = 0
+        failed = 0
+        for food in foods.iterator():
+            try:
+                variants = generate_variants(food.image)
+            except (OSError, UnidentifiedImageError) as e:
+                failed += 1
+                self.stderr.write(f"Could not generate images for {food.name}: {e}")
+                continue
+            Food.objects.filter(pk=food.pk).update(image_variants=variants)
+            generated += 1
+            self.stdout.write(f"Generated images for: {food.name}")
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'\nImage generation completed: {generated} food items processed, {failed} failed')
+        )
@@ -0,0 +1,148 @@
+import csv
+import json
+import sys
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from menu.models import Category, Food
+from menu.utils import deferred_menu_sync, foods_repriced, invalidate_menu, recount_available_foods
+
+
+UPDATE_FIELDS = ['price', 'description', 'is_available']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+def read_rows(stream, fmt):
+    """Yield one dict per input row without loading the file"""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_row(row):
+    category = (row.get('category') or '').strip()
+    name = (row.get('name') or '').strip()
+    if not category or not name:
+        raise ValueError('category and name are required')
+
+    try:
+        price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"invalid price {row.get('price')!r}")
+
+    is_available = row.get('is_available', True)
+    if isinstance(is_available, str):
+        is_available = is_available.strip().lower() in TRUE_VALUES
+
+    return category, name, {
+        'price': price,
+        'description': row.get('description') or '',
+        'is_available': bool(is_available),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Upsert menu items from a CSV or JSONL file in fixed-size batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV/JSONL file with category,name,price,description,is_available ('-' for stdin)")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.created = self.updated = self.skipped = 0
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            # One recount and one cache invalidation for the whole import
+            with deferred_menu_sync():
+                batch = {}
+                for line_number, row in enumerate(read_rows(stream, fmt), start=1):
+                    try:
+                        category, name, values = parse_row(row)
+                    except (ValueError, TypeError) as e:
+                        self.skipped += 1
+                        self.stderr.write(f'Row {line_number} skipped: {e}')
+                        continue
+
+                    # Later rows for the same item win
+                    batch[(category, name)] = values
+                    if len(batch) >= batch_size:
+                        self.write_batch(batch)
+                        batch = {}
+                if batch:
+                    self.write_batch(batch)
+        except (json.JSONDecodeError, csv.Error) as e:
+            raise CommandError(f'Could not parse {path}: {e}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nMenu import completed!\n'
+                f'Food items created: {self.created}\n'
+                f'Food items updated: {self.updated}\n'
+                f'Rows skipped: {self.skipped}'
+            )
+        )
+
+    @transaction.atomic
+    def write_batch(self, batch):
+        missing = {category for category, _ in batch} - self.categories.keys()
+        if missing:
+            Category.objects.bulk_create([Category(name=name) for name in missing])
+            self.categories.update(
+                Category.objects.filter(name__in=missing).values_list('name', 'id')
+            )
+
+        keys = {(self.categories[category], name): values for (category, name), values in batch.items()}
+        existing = Food.objects.filter(
+            category_id__in={category_id for category_id, _ in keys},
+            name__in={name for _, name in keys},
+        ).only('id', 'category_id', 'name', *UPDATE_FIELDS)
+
+        now = timezone.now()
+        to_update = []
+        repriced = []
+        for food in existing:
+            values = keys.pop((food.category_id, food.name), None)
+            if values is not None:
+                if 'price' in values and values['price'] != food.price:
+                    repriced.append(food.id)
+                for field, value in values.items():
+                    setattr(food, field, value)
+                food.updated_at = now
+                to_update.append(food)
+
+        names = {category_id: name for name, category_id in self.categories.items()}
+        to_create = [
+            Food(category_id=category_id, category_name=names[category_id], name=name, **values)
+            for (category_id, name), values in keys.items()
+        ]
+
+        Food.objects.bulk_create(to_create)
+        Food.objects.bulk_update(to_update, UPDATE_FIELDS + ['updated_at'])
+        if repriced:
+            # One set-based repricing for every food whose price changed in this batch
+            foods_repriced.send(sender=Food, food_ids=repriced)
+        touched = {category_id for category_id, _ in keys} | {food.category_id for food in to_update}
+        recount_available_foods(touched)
+        # bulk_create and bulk_update skip the signals that evict snapshots
+        invalidate_menu(touched, categories=bool(missing))
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        self.stdout.write(f'{self.created + self.updated + self.skipped} rows processed...')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from menu.models import Food
+from menu.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the menu full-text search index from the Food table'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding menu search index...')
+        
+        if not rebuild_index():
+            self.stdout.write(
+                self.style.WARNING('Full-text search needs SQLite FTS5; search falls back to icontains.')
+            )
+            return
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Search index rebuilt: {Food.objects.count()} food items indexed')
+        )
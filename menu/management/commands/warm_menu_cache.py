@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from menu.utils import warm_menu_cache
+
+
+class Command(BaseCommand):
+    help = 'Pre-build the menu JSON snapshots so the first request is not a cold miss'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Warming menu cache...')
+        
+        warmed = warm_menu_cache()
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Menu cache warmed: {len(warmed)} snapshots built')
+        )
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_read_model(apps, schema_editor):
+    Category = apps.get_model('menu', 'Category')
+    Food = apps.get_model('menu', 'Food')
+
+    category_name = Category.objects.filter(pk=OuterRef('category_id')).values('name')
+    Food.objects.update(category_name=Subquery(category_name))
+
+    available = (
+        Food.objects.filter(category=OuterRef('pk'), is_available=True)
+        .order_by()
+        .values('category')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    Category.objects.update(available_foods_count=Coalesce(Subquery(available), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='available_foods_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='category_name',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(populate_read_model, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS menu_food_fts USING fts5(
+        name, description,
+        content='menu_food', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS menu_food_fts_ai AFTER INSERT ON menu_food BEGIN
+        INSERT INTO menu_food_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS menu_food_fts_ad AFTER DELETE ON menu_food BEGIN
+        INSERT INTO menu_food_fts(menu_food_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS menu_food_fts_au AFTER UPDATE OF name, description ON menu_food BEGIN
+        INSERT INTO menu_food_fts(menu_food_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO menu_food_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO menu_food_fts(menu_food_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS menu_food_fts_au',
+    'DROP TRIGGER IF EXISTS menu_food_fts_ad',
+    'DROP TRIGGER IF EXISTS menu_food_fts_ai',
+    'DROP TABLE IF EXISTS menu_food_fts',
+]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite only; other backends use the icontains fallback in menu.search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0003_food_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0005_food_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, help_text='e.g. Breakfast, Late night', max_length=50)),
+                ('weekday', models.PositiveSmallIntegerField(blank=True, choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')], help_text='Leave empty for every day', null=True)),
+                ('starts_at', models.TimeField()),
+                ('ends_at', models.TimeField(help_text='An end before the start runs past midnight')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='availability_windows', to='menu.category')),
+                ('food', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='availability_windows', to='menu.food')),
+            ],
+            options={
+                'ordering': ['weekday', 'starts_at'],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('category__isnull', True), ('food__isnull', False)), models.Q(('category__isnull', False), ('food__isnull', True)), _connector='OR'), name='menu_window_food_xor_category')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0006_availability_window'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='food',
+            options={'ordering': ['category_name', 'name', 'id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='food',
+            name='menu_food_keyset_idx',
+        ),
+        migrations.AddIndex(
+            model_name='food',
+            index=models.Index(fields=['category_name', 'name', 'id'], name='menu_food_listing_idx'),
+        ),
+    ]
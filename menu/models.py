@@ -1,17 +1,79 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
 
+class CategoryQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """Bulk updates skip post_save, so evict the affected snapshots here"""
+        from .utils import invalidate_menu
+        
+        category_ids = list(self.values_list('id', flat=True))
+        updated = super().update(**kwargs)
+        if updated:
+            if 'name' in kwargs:
+                # Keep the denormalized name on food rows in step
+                Food.objects.filter(category_id__in=category_ids).update(category_name=kwargs['name'])
+            # The counter is in no snapshot, so its maintenance evicts nothing
+            if set(kwargs) != {'available_foods_count'}:
+                invalidate_menu(category_ids, categories=True)
+        return updated
+
+
+class FoodQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """Bulk updates skip post_save, so refresh the read model and evict snapshots here"""
+        from .utils import foods_repriced, invalidate_menu, recount_available_foods
+        
+        category_ids = set(self.values_list('category_id', flat=True).distinct())
+        food_ids = list(self.values_list('id', flat=True)) if 'price' in kwargs else None
+        new_category = kwargs.pop('category', kwargs.pop('category_id', None))
+        if new_category is not None:
+            new_category_id = getattr(new_category, 'pk', new_category)
+            category_ids.add(new_category_id)
+            kwargs['category_id'] = new_category_id
+            kwargs['category_name'] = Category.objects.values_list('name', flat=True).get(pk=new_category_id)
+        
+        updated = super().update(**kwargs)
+        if updated:
+            if new_category is not None or 'is_available' in kwargs:
+                recount_available_foods(category_ids)
+            if food_ids:
+                foods_repriced.send(sender=Food, food_ids=food_ids)
+            invalidate_menu(category_ids)
+        return updated
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Read model, maintained from Food writes (see menu.signals)
+    available_foods_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    objects = CategoryQuerySet.as_manager()
+    
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['name']
     
     def __str__(self):
         return self.name
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        if 'name' in self.__dict__ and (fields is None or 'name' in fields):
+            self._loaded_name = self.name
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_name = self.name
 
 
 class Food(models.Model):
@@ -24,8 +86,125 @@ class Food(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Read model: copy of category.name so list endpoints need no join
+    category_name = models.CharField(max_length=100, blank=True, editable=False)
+    
+    # Resized copies of image, see menu.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    
+    objects = FoodQuerySet.as_manager()
+    
     class Meta:
-        ordering = ['category', 'name']
+        # By the denormalized category name, like the old join on category, with id to break ties
+        ordering = ['category_name', 'name', 'id']
+        indexes = [
+            # Keyset pagination seeks on the same (category_name, name, id)
+            models.Index(fields=['category_name', 'name', 'id'], name='menu_food_listing_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - ${self.price}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so writes can adjust the read model incrementally
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        instance._loaded_is_available = instance.__dict__.get('is_available')
+        instance._loaded_image = instance.__dict__.get('image')
+        instance._loaded_price = instance.__dict__.get('price')
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        # The row just read is the baseline for the next save's counter and price diffs
+        refreshed = {field.attname for field in self._meta.concrete_fields if field.attname in self.__dict__}
+        if fields is not None:
+            refreshed &= {self._meta.get_field(name).attname for name in fields}
+        if 'category_id' in refreshed:
+            self._loaded_category_id = self.category_id
+        if 'is_available' in refreshed:
+            self._loaded_is_available = self.is_available
+        if 'image' in refreshed:
+            self._loaded_image = self.image.name
+        if 'price' in refreshed:
+            self._loaded_price = self.price
+    
+    def save(self, *args, **kwargs):
+        if self.category_id and (
+            not self.category_name or self.category_id != getattr(self, '_loaded_category_id', None)
+        ):
+            self.category_name = self.category.name
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'category' in update_fields:
+                kwargs['update_fields'] = set(update_fields) | {'category_name'}
+        super().save(*args, **kwargs)
+        self._loaded_category_id = self.category_id
+        self._loaded_is_available = self.is_available
+        self._loaded_image = self.image.name
+        self._loaded_price = self.price
+
+
+class AvailabilityWindowQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """Bulk updates skip post_save, so recompile the schedule here"""
+        from .schedule import refresh_schedule
+        
+        updated = super().update(**kwargs)
+        if updated:
+            refresh_schedule()
+        return updated
+
+
+class AvailabilityWindow(models.Model):
+    """
+    A time of day when a food, or every food in a category, can be ordered.
+    Items without windows are orderable all day; a food's own windows take
+    precedence over its category's. See menu.schedule for the compiled index.
+    """
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+    
+    food = models.ForeignKey(
+        Food, on_delete=models.CASCADE, null=True, blank=True, related_name='availability_windows'
+    )
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, null=True, blank=True, related_name='availability_windows'
+    )
+    name = models.CharField(max_length=50, blank=True, help_text='e.g. Breakfast, Late night')
+    weekday = models.PositiveSmallIntegerField(
+        choices=WEEKDAY_CHOICES, null=True, blank=True, help_text='Leave empty for every day'
+    )
+    starts_at = models.TimeField()
+    ends_at = models.TimeField(help_text='An end before the start runs past midnight')
+    
+    objects = AvailabilityWindowQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['weekday', 'starts_at']
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(food__isnull=False, category__isnull=True)
+                    | models.Q(food__isnull=True, category__isnull=False)
+                ),
+                name='menu_window_food_xor_category',
+            ),
+        ]
+    
+    def __str__(self):
+        day = self.get_weekday_display() if self.weekday is not None else 'Daily'
+        return f"{self.name or day} {self.starts_at:%H:%M}-{self.ends_at:%H:%M}"
+    
+    def clean(self):
+        if self.food_id is not None and self.category_id is not None:
+            raise ValidationError('Attach the window to a food or a category, not both.')
+        if self.starts_at is not None and self.starts_at == self.ends_at:
+            raise ValidationError('A window must end at a different time than it starts.')
@@ -0,0 +1,149 @@
+"""
+Time-windowed availability for the menu.
+
+AvailabilityWindow rows are compiled into a per-weekday interval index:
+for each day, the sorted minutes at which anything opens or closes
+(breakpoints) and, for every segment between two breakpoints, the set of
+foods and categories that are open. Answering "what is orderable now" is a
+bisect over one day's breakpoints. The index is rebuilt after every
+schedule change and kept in the cache, so requests never evaluate rules;
+its cache lifetime bounds how long another process can miss a change.
+"""
+import hashlib
+from bisect import bisect_right
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import AvailabilityWindow
+
+
+SCHEDULE_CACHE_KEY = 'menu_schedule_index'
+
+# Other processes only see a schedule change once their copy expires (with a
+# per-process cache) or a stale copy written by a racing reader is replaced
+SCHEDULE_CACHE_TIMEOUT = 60 * 60
+
+MINUTES_PER_DAY = 24 * 60
+
+Segment = namedtuple('Segment', ['foods', 'categories', 'token'])
+
+# Nothing is scheduled: every available food is orderable at any time
+ALWAYS_OPEN = Segment(frozenset(), frozenset(), '')
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _intervals(window):
+    """Yield (weekday, start, end) minute ranges, splitting windows that pass midnight"""
+    start, end = _minutes(window.starts_at), _minutes(window.ends_at)
+    days = range(7) if window.weekday is None else [window.weekday]
+    for day in days:
+        if start < end:
+            yield day, start, end
+        else:
+            yield day, start, MINUTES_PER_DAY
+            if end:
+                yield (day + 1) % 7, 0, end
+
+
+def compile_schedule():
+    """Build the lookup index from every AvailabilityWindow"""
+    scheduled_foods, scheduled_categories = set(), set()
+    by_day = [[] for _ in range(7)]
+
+    for window in AvailabilityWindow.objects.all():
+        if window.food_id:
+            key = ('food', window.food_id)
+            scheduled_foods.add(window.food_id)
+        else:
+            key = ('category', window.category_id)
+            scheduled_categories.add(window.category_id)
+        for day, start, end in _intervals(window):
+            by_day[day].append((start, end, key))
+
+    # Part of every token, so any schedule change moves the tokens (and with them
+    # the snapshot keys and ETags) even where the open set stays the same
+    generation = hashlib.md5(repr([sorted(intervals) for intervals in by_day]).encode('utf-8')).hexdigest()
+    days = []
+    for intervals in by_day:
+        breakpoints = sorted({0} | {minute for start, end, _ in intervals for minute in (start, end)} - {MINUTES_PER_DAY})
+        segments = []
+        for index, start in enumerate(breakpoints):
+            open_keys = {key for begin, end, key in intervals if begin <= start < end}
+            foods = frozenset(pk for kind, pk in open_keys if kind == 'food')
+            categories = frozenset(pk for kind, pk in open_keys if kind == 'category')
+            # Same open set, same token: identical segments share snapshots
+            digest = hashlib.md5(repr((generation, sorted(foods), sorted(categories))).encode('utf-8')).hexdigest()[:12]
+            segments.append(Segment(foods, categories, digest))
+        days.append((breakpoints, segments))
+
+    return {
+        'foods': frozenset(scheduled_foods),
+        'categories': frozenset(scheduled_categories),
+        'days': days,
+    }
+
+
+def schedule_timeout():
+    return settings.CACHE_VERSION_TIMEOUT or SCHEDULE_CACHE_TIMEOUT
+
+
+def get_schedule():
+    schedule = cache.get(SCHEDULE_CACHE_KEY)
+    if schedule is None:
+        schedule = compile_schedule()
+        cache.set(SCHEDULE_CACHE_KEY, schedule, schedule_timeout())
+    return schedule
+
+
+def refresh_schedule():
+    """Recompile the index once the current transaction commits"""
+    transaction.on_commit(lambda: cache.set(SCHEDULE_CACHE_KEY, compile_schedule(), schedule_timeout()))
+
+
+def current_segment(now=None, schedule=None):
+    """The open foods and categories at ``now`` (default: the current local time)"""
+    schedule = schedule or get_schedule()
+    if not schedule['foods'] and not schedule['categories']:
+        return ALWAYS_OPEN
+
+    now = timezone.localtime(now)
+    breakpoints, segments = schedule['days'][now.weekday()]
+    return segments[bisect_right(breakpoints, _minutes(now)) - 1]
+
+
+def segment_token(now=None):
+    """Identifies the set of orderable items at ``now``; '' when nothing is scheduled"""
+    return current_segment(now).token
+
+
+def orderable_filter(now=None):
+    """Q limiting a Food queryset to items whose schedule is open at ``now``"""
+    schedule = get_schedule()
+    segment = current_segment(now, schedule)
+    if segment is ALWAYS_OPEN:
+        return Q()
+
+    # A food's own windows win; otherwise its category's apply, if it has any
+    by_category = Q(category_id__in=segment.categories) | ~Q(category_id__in=schedule['categories'])
+    return Q(pk__in=segment.foods) | (~Q(pk__in=schedule['foods']) & by_category)
+
+
+def is_orderable(food, now=None):
+    """True when ``food`` is available and inside one of its windows at ``now``"""
+    if not food.is_available:
+        return False
+
+    schedule = get_schedule()
+    segment = current_segment(now, schedule)
+    if food.pk in schedule['foods']:
+        return food.pk in segment.foods
+    if food.category_id in schedule['categories']:
+        return food.category_id in segment.categories
+    return True
@@ -0,0 +1,189 @@
+"""
+Full-text search over the menu.
+
+On SQLite the index is an FTS5 table (``menu_food_fts``) over Food.name and
+Food.description, created by migration 0004 and kept in sync by triggers on
+``menu_food`` so saves, bulk updates and deletes are all covered. Other
+backends fall back to a plain ``icontains`` scan.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+from .models import Food
+
+
+FTS_TABLE = 'menu_food_fts'
+
+# The migration that creates the index; it is only restored while this is applied
+INDEX_MIGRATION = ('menu', '0004_food_search_index')
+
+# Column weights for bm25(): a hit in the name counts far more than in the description
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+SEARCH_FIELDS = ('id', 'name', 'description', 'price', 'image')
+SEARCH_ALIASES = {'category__name': F('category_name'), 'category__id': F('category_id')}
+
+CREATE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description,
+        content='menu_food', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON menu_food BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON menu_food BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON menu_food BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+
+def fts_available():
+    """True when the FTS5 index exists on the current connection"""
+    if connection.vendor != 'sqlite':
+        return False
+    # Remembered per connection so searches don't re-read sqlite_master
+    available = getattr(connection, '_menu_fts_available', None)
+    if available is None:
+        available = FTS_TABLE in connection.introspection.table_names()
+        connection._menu_fts_available = available
+    return available
+
+
+def ensure_index(using='default'):
+    """
+    Recreate the index table or triggers if they are missing and reindex.
+    SQLite rebuilds menu_food for many schema changes, which silently drops
+    its triggers, so this runs after every migrate.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return False
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+            [FTS_TABLE, f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au']
+        )
+        if cursor.fetchone()[0] == 4:
+            return False
+        for statement in CREATE_SQL:
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    db._menu_fts_available = True
+    return True
+
+
+def rebuild_index():
+    """
+    Recreate the index (and its triggers, if they were dropped) from
+    menu_food. Returns False on backends without FTS5.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        for statement in CREATE_SQL:
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    connection._menu_fts_available = True
+    return True
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def build_match(tokens, column=None):
+    """
+    Turn user input into a safe FTS5 query: every token is quoted (so
+    operators in the input are inert) and the last one matches as a prefix.
+    """
+    terms = [f'"{token}"' for token in tokens[:-1]]
+    terms.append(f'"{tokens[-1]}"*')
+    match = ' '.join(terms)
+    if column:
+        return f'{column} : ({match})'
+    return match
+
+
+def _ranked_ids(match, limit, available_only=True):
+    """Best ``limit`` matches by bm25 over every match, unavailable foods filtered out first"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT f.id FROM {FTS_TABLE}
+            JOIN menu_food f ON f.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s
+            {'AND f.is_available' if available_only else ''}
+            ORDER BY bm25({FTS_TABLE}, %s, %s)
+            LIMIT %s
+            """,
+            [match, NAME_WEIGHT, DESCRIPTION_WEIGHT, limit]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def matching_ids(query):
+    """
+    Every food (available or not) matching ``query``, as a subquery for
+    ``pk__in`` so a broad term isn't capped or expanded into a huge IN list
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [build_match(tokens)])
+
+
+def search_foods(query, limit=20):
+    """Available foods matching ``query``, best match first"""
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    foods = Food.objects.filter(is_available=True)
+    if not fts_available():
+        for token in tokens:
+            foods = foods.filter(Q(name__icontains=token) | Q(description__icontains=token))
+        return list(foods.values(*SEARCH_FIELDS, **SEARCH_ALIASES)[:limit])
+
+    ids = _ranked_ids(build_match(tokens), limit)
+    rows = {row['id']: row for row in foods.filter(id__in=ids).values(*SEARCH_FIELDS, **SEARCH_ALIASES)}
+    return [rows[food_id] for food_id in ids if food_id in rows]
+
+
+def suggest(prefix, limit=8):
+    """Distinct food names for prefix autocomplete"""
+    tokens = tokenize(prefix)
+    if not tokens:
+        return []
+
+    if not fts_available():
+        foods = Food.objects.filter(is_available=True, name__istartswith=prefix.strip())
+        return list(foods.order_by('name').values_list('name', flat=True).distinct()[:limit])
+
+    ids = _ranked_ids(build_match(tokens, column='name'), limit * 2)
+    names = dict(Food.objects.filter(id__in=ids).values_list('id', 'name'))
+
+    suggestions = []
+    for food_id in ids:
+        name = names.get(food_id)
+        if name and name not in suggestions:
+            suggestions.append(name)
+    return suggestions[:limit]
@@ -1,21 +1,125 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
+from .images import variant_urls
 from .models import Category, Food
 
 
+def parse_fields(fields):
+    """Split a ``fields=id,name,price`` query value into a list of names"""
+    if not fields:
+        return None
+    return [name.strip() for name in fields.split(',') if name.strip()]
+
+
+class SparseFieldsMixin:
+    """
+    Accept a ``fields`` argument (list or comma-separated string) that limits
+    the serializer to a subset of its declared fields. Unknown names are ignored.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        
+        if isinstance(fields, str):
+            fields = parse_fields(fields)
+        if fields:
+            allowed = set(fields)
+            if allowed & set(self.fields):
+                for name in set(self.fields) - allowed:
+                    self.fields.pop(name)
+
+
 class CategorySerializer(serializers.ModelSerializer):
-    foods_count = serializers.SerializerMethodField()
+    foods_count = serializers.IntegerField(source='available_foods_count', read_only=True)
     
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'foods_count']
-    
-    def get_foods_count(self, obj):
-        return obj.foods.filter(is_available=True).count()
 
 
-class FoodSerializer(serializers.ModelSerializer):
-    category_name = serializers.CharField(source='category.name', read_only=True)
+class FoodSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    category_name = serializers.CharField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Food
-        fields = ['id', 'name', 'price', 'description', 'image', 'category', 'category_name', 'is_available']
+        fields = [
+            'id', 'name', 'price', 'description', 'image', 'image_variants', 'image_srcset',
+            'category', 'category_name', 'is_available'
+        ]
+    
+    def _variant_urls(self, obj):
+        request = self.context.get('request')
+        return variant_urls(obj.image_variants, request.build_absolute_uri if request else None)
+    
+    def get_image_variants(self, obj):
+        return self._variant_urls(obj)[0]
+    
+    def get_image_srcset(self, obj):
+        return self._variant_urls(obj)[1]
+
+
+# Fast paths for the hot read endpoints. They produce exactly what the
+# serializers above produce, but work on values() rows and reuse one field
+# instance per column for formatting instead of building a serializer per row.
+
+CATEGORY_COLUMNS = ('id', 'name', 'description', 'available_foods_count')
+
+FOOD_COLUMNS = (
+    'id', 'name', 'price', 'description', 'image', 'image_variants',
+    'category_id', 'category_name', 'is_available'
+)
+
+_food_price = serializers.DecimalField(max_digits=8, decimal_places=2)
+
+
+def file_url(name, request=None):
+    """Same output as DRF's FileField/ImageField for a stored file name"""
+    if not name:
+        return None
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def serialize_categories(rows):
+    """CategorySerializer output for rows of ``values(*CATEGORY_COLUMNS)``"""
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'foods_count': row['available_foods_count'],
+        }
+        for row in rows
+    ]
+
+
+def serialize_food(row, request=None):
+    """FoodSerializer output for one row of ``values(*FOOD_COLUMNS)``"""
+    urls, srcset = variant_urls(row['image_variants'], request.build_absolute_uri if request else None)
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'price': _food_price.to_representation(row['price']),
+        'description': row['description'],
+        'image': file_url(row['image'], request),
+        'image_variants': urls,
+        'image_srcset': srcset,
+        'category': row['category_id'],
+        'category_name': row['category_name'],
+        'is_available': row['is_available'],
+    }
+
+
+def serialize_foods(rows, request=None, fields=None):
+    """FoodSerializer(many=True) output, honouring ``fields`` like SparseFieldsMixin"""
+    data = [serialize_food(row, request) for row in rows]
+
+    if isinstance(fields, str):
+        fields = parse_fields(fields)
+    if fields and data:
+        keep = [name for name in data[0] if name in fields]
+        if keep:
+            data = [{name: item[name] for name in keep} for item in data]
+    return data
@@ -0,0 +1,100 @@
+import logging
+
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from PIL import UnidentifiedImageError
+from . import schedule, search
+from .images import generate_variants
+from .models import AvailabilityWindow, Category, Food
+from .utils import adjust_available_foods, invalidate_menu, recount_available_foods
+
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Food)
+def update_food_read_model(sender, instance, created, **kwargs):
+    """Move the food's contribution to the per-category counters"""
+    if created:
+        adjust_available_foods(instance.category_id, 1 if instance.is_available else 0)
+    elif not hasattr(instance, '_loaded_is_available'):
+        # Not loaded from the database, so there is no old state to diff against
+        recount_available_foods([instance.category_id])
+    else:
+        old = (instance._loaded_category_id, instance._loaded_is_available)
+        new = (instance.category_id, instance.is_available)
+        if old != new:
+            if old[1]:
+                adjust_available_foods(old[0], -1)
+            if new[1]:
+                adjust_available_foods(new[0], 1)
+
+
+@receiver(post_save, sender=Food)
+def update_image_variants(sender, instance, **kwargs):
+    """Generate the resized copies whenever a new photo is uploaded"""
+    if instance.image.name == getattr(instance, '_loaded_image', None) and (
+        instance.image_variants or not instance.image
+    ):
+        return
+    
+    try:
+        variants = generate_variants(instance.image)
+    except (OSError, UnidentifiedImageError):
+        # Left without variants, so `manage.py generate_food_images` retries it
+        logger.exception('Could not generate image variants for food %s', instance.pk)
+        variants = {}
+    if variants != instance.image_variants:
+        instance.image_variants = variants
+        Food.objects.filter(pk=instance.pk).update(image_variants=variants)
+
+
+@receiver(post_delete, sender=Food)
+def remove_food_from_read_model(sender, instance, **kwargs):
+    if getattr(instance, '_loaded_is_available', instance.is_available):
+        adjust_available_foods(getattr(instance, '_loaded_category_id', instance.category_id), -1)
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+def invalidate_food(sender, instance, **kwargs):
+    """Evict the food's category (and the one it moved from) plus "all" """
+    category_ids = {instance.category_id, getattr(instance, '_loaded_category_id', None)}
+    invalidate_menu(category_ids)
+
+
+@receiver(post_save, sender=Category)
+def update_category_read_model(sender, instance, created, **kwargs):
+    """Push a renamed category onto its denormalized food rows"""
+    if not created and instance.name != getattr(instance, '_loaded_name', None):
+        Food.objects.filter(category=instance).update(category_name=instance.name)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    """Food rows carry the category name, so their lists go stale too"""
+    invalidate_menu([instance.pk], categories=True)
+
+
+@receiver(post_save, sender=AvailabilityWindow)
+@receiver(post_delete, sender=AvailabilityWindow)
+def recompile_schedule(sender, instance, **kwargs):
+    schedule.refresh_schedule()
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, plan=None, **kwargs):
+    """
+    Table rebuilds during migrate drop the search triggers; put them back
+    after forward menu migrations, as long as the index's migration is applied
+    """
+    if sender.name != 'menu' or not plan:
+        return
+    if not any(migration.app_label == 'menu' and not backwards for migration, backwards in plan):
+        return
+    applied = MigrationRecorder(connections[using]).applied_migrations()
+    if search.INDEX_MIGRATION in applied:
+        search.ensure_index(using)
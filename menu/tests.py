@@ -1,3 +1,609 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import time as time_module
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from . import schedule, search
+from .images import FORMATS, VARIANTS
+from .models import AvailabilityWindow, Category, Food
+from .serializers import (
+    CATEGORY_COLUMNS, FOOD_COLUMNS, CategorySerializer, FoodSerializer, serialize_categories, serialize_foods
+)
+from .utils import ALL_FOODS_SCOPE, recount_available_foods
+
+
+def make_foods(category, count, name='Dish {i}', description='', **fields):
+    Food.objects.bulk_create(
+        Food(category=category, category_name=category.name, name=name.format(i=i),
+             description=description.format(i=i), price=Decimal('4.00'), **fields)
+        for i in range(count)
+    )
+    # bulk_create skips the signals that keep the counters
+    recount_available_foods([category.pk])
+
+
+class MenuSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mains = Category.objects.create(name='Mains')
+        make_foods(cls.mains, 3)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_menu_answers_304(self):
+        for path in ('/menu/api/foods/json/', '/menu/api/categories/json/', f'/menu/api/foods/json/?category={self.mains.pk}'):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            with self.assertNumQueries(0):
+                cached = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(cached.status_code, 304)
+
+    def test_snapshot_is_built_once_per_version(self):
+        first = self.client.get('/menu/api/foods/json/')
+        self.assertEqual(len(first.json()['foods']), 3)
+        with self.assertNumQueries(0):
+            again = self.client.get('/menu/api/foods/json/')
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(again['ETag'], first['ETag'])
+
+    def test_etag_follows_content_not_the_version(self):
+        before = self.client.get('/menu/api/foods/json/')
+        # Another process, or an expired counter, seeds a different version for the same menu
+        cache.delete(f'menu_version_{ALL_FOODS_SCOPE}')
+        with mock.patch('menu.utils.time.time', return_value=time_module.time() + 3600):
+            after = self.client.get('/menu/api/foods/json/', HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 304)
+
+        sparse = self.client.get('/menu/api/foods/json/', {'fields': 'id'})
+        self.assertNotEqual(sparse['ETag'], before['ETag'])
+
+    def test_write_changes_the_etag_and_body(self):
+        before = self.client.get('/menu/api/foods/json/')
+        food = Food.objects.first()
+        food.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            food.save()
+
+        after = self.client.get('/menu/api/foods/json/', HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        self.assertIn('Renamed', [row['name'] for row in after.json()['foods']])
+
+
+class MenuInvalidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mains = Category.objects.create(name='Mains')
+        cls.drinks = Category.objects.create(name='Drinks')
+        make_foods(cls.mains, 2)
+        make_foods(cls.drinks, 2, name='Drink {i}')
+
+    def setUp(self):
+        cache.clear()
+
+    def etags(self):
+        paths = {
+            'all': '/menu/api/foods/json/',
+            'mains': f'/menu/api/foods/json/?category={self.mains.pk}',
+            'drinks': f'/menu/api/foods/json/?category={self.drinks.pk}',
+            'categories': '/menu/api/categories/json/',
+        }
+        return {scope: self.client.get(path)['ETag'] for scope, path in paths.items()}
+
+    def changed(self, before):
+        after = self.etags()
+        return sorted(scope for scope in before if before[scope] != after[scope])
+
+    def test_food_write_evicts_its_category_and_all(self):
+        before = self.etags()
+        food = Food.objects.filter(category=self.mains).first()
+        food.price = Decimal('5.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            food.save()
+        self.assertEqual(self.changed(before), ['all', 'mains'])
+
+    def test_moving_a_food_evicts_both_categories(self):
+        before = self.etags()
+        food = Food.objects.filter(category=self.mains).first()
+        food.category = self.drinks
+        with self.captureOnCommitCallbacks(execute=True):
+            food.save()
+        self.assertEqual(self.changed(before), ['all', 'drinks', 'mains'])
+
+    def test_queryset_update_evicts_once(self):
+        before = self.etags()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Food.objects.filter(category=self.drinks).update(is_available=False)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(Category.objects.get(pk=self.drinks.pk).available_foods_count, 0)
+        self.assertEqual(self.changed(before), ['all', 'drinks'])
+        self.assertEqual(self.client.get(f'/menu/api/foods/json/?category={self.drinks.pk}').json()['foods'], [])
+
+    def test_category_rename_evicts_the_category_list(self):
+        before = self.etags()
+        self.drinks.name = 'Beverages'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.drinks.save()
+        self.assertEqual(self.changed(before), ['all', 'categories', 'drinks'])
+        rows = self.client.get(f'/menu/api/foods/json/?category={self.drinks.pk}').json()['foods']
+        self.assertEqual({row['category__name'] for row in rows}, {'Beverages'})
+
+    def test_import_evicts_the_categories_it_touches(self):
+        before = self.etags()
+        rows = StringIO('category,name,price\nDrinks,Drink 0,2.50\n')
+        with mock.patch('sys.stdin', rows), self.captureOnCommitCallbacks(execute=True):
+            call_command('import_menu', '-', stdout=StringIO())
+        self.assertEqual(self.changed(before), ['all', 'drinks'])
+
+        before = self.etags()
+        rows = StringIO('category,name,price\nDesserts,Puff puff,1.50\n')
+        with mock.patch('sys.stdin', rows), self.captureOnCommitCallbacks(execute=True):
+            call_command('import_menu', '-', stdout=StringIO())
+        self.assertEqual(self.changed(before), ['all', 'categories'])
+
+    def test_rolled_back_write_evicts_nothing(self):
+        before = self.etags()
+        with self.captureOnCommitCallbacks(execute=False):
+            Food.objects.filter(category=self.mains).update(price=Decimal('9.00'))
+        self.assertEqual(self.changed(before), [])
+
+
+class CategoryCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mains = Category.objects.create(name='Mains')
+        cls.drinks = Category.objects.create(name='Drinks')
+
+    def setUp(self):
+        cache.clear()
+
+    def counts(self):
+        return dict(Category.objects.values_list('name', 'available_foods_count'))
+
+    def assertCountsMatch(self, expected):
+        self.assertEqual(self.counts(), expected)
+        # The maintained figures agree with a recount from scratch
+        recount_available_foods()
+        self.assertEqual(self.counts(), expected)
+
+    def create(self, category, **fields):
+        return Food.objects.create(category=category, category_name=category.name, name='Dish',
+                                   description='', price=Decimal('4.00'), **fields)
+
+    def test_saves_and_deletes(self):
+        food = self.create(self.mains)
+        self.create(self.mains, is_available=False)
+        self.create(self.drinks)
+        self.assertCountsMatch({'Mains': 1, 'Drinks': 1})
+
+        food.category = self.drinks
+        food.save()
+        self.assertCountsMatch({'Mains': 0, 'Drinks': 2})
+
+        food.is_available = False
+        food.save()
+        self.assertCountsMatch({'Mains': 0, 'Drinks': 1})
+
+        Food.objects.filter(category=self.drinks, is_available=True).get().delete()
+        self.assertCountsMatch({'Mains': 0, 'Drinks': 0})
+
+    def test_save_after_refresh_diffs_against_the_refreshed_row(self):
+        food = self.create(self.mains)
+        Food.objects.filter(pk=food.pk).update(is_available=False, category=self.drinks)
+        food.refresh_from_db()
+        food.save()
+        self.assertCountsMatch({'Mains': 0, 'Drinks': 0})
+
+        Food.objects.filter(pk=food.pk).update(is_available=True)
+        food.refresh_from_db(fields=['is_available'])
+        food.delete()
+        self.assertCountsMatch({'Mains': 0, 'Drinks': 0})
+
+    def test_queryset_updates(self):
+        make_foods(self.mains, 3)
+        make_foods(self.drinks, 2)
+
+        first = Food.objects.filter(category=self.mains).first()
+        Food.objects.filter(pk=first.pk).update(is_available=False)
+        self.assertCountsMatch({'Mains': 2, 'Drinks': 2})
+
+        Food.objects.filter(category=self.drinks).update(category=self.mains)
+        self.assertCountsMatch({'Mains': 4, 'Drinks': 0})
+        self.assertEqual(set(Food.objects.values_list('category_name', flat=True)), {'Mains'})
+
+    def test_category_list_reads_the_counter(self):
+        make_foods(self.mains, 3)
+        with self.assertNumQueries(1):
+            rows = self.client.get('/menu/api/categories/').json()
+        self.assertEqual({row['name']: row['foods_count'] for row in rows}, {'Mains': 3, 'Drinks': 0})
+
+
+class FoodPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mains = Category.objects.create(name='Mains')
+        cls.drinks = Category.objects.create(name='Drinks')
+        # Repeated names, so pages have to break ties on id
+        make_foods(cls.mains, 5, name='Dish {i}')
+        make_foods(cls.mains, 3, name='Stew')
+        make_foods(cls.drinks, 4, name='Drink {i}')
+        # Menu order: category name first, so Drinks (created last) comes before Mains
+        cls.expected = list(
+            Food.objects.order_by('category__name', 'name', 'id').values_list('id', flat=True)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url):
+        ids = []
+        queries = []
+        while url:
+            with CaptureQueriesContext(connection) as captured:
+                data = self.client.get(url).json()
+            queries.append(len(captured))
+            ids += [row['id'] for row in data['results']]
+            url = data['next']
+        return ids, queries
+
+    def test_pages_cover_every_food_once(self):
+        ids, queries = self.walk('/menu/api/foods/?page_size=3')
+        self.assertEqual(ids, self.expected)
+        # Past the first request, which also loads the schedule index, every page is one seek
+        self.assertEqual(set(queries[1:]), {1})
+
+    def test_category_pages(self):
+        ids, _ = self.walk(f'/menu/api/foods/category/{self.mains.pk}/?page_size=3')
+        mains = Food.objects.filter(category=self.mains).order_by('name', 'id')
+        self.assertEqual(ids, list(mains.values_list('id', flat=True)))
+
+    def test_unpaginated_list_is_unchanged(self):
+        rows = self.client.get('/menu/api/foods/').json()
+        self.assertEqual([row['id'] for row in rows], self.expected)
+        self.assertIn('category_name', rows[0])
+        # The cached JSON endpoint lists in the same order, with or without pages
+        foods = self.client.get('/menu/api/foods/json/').json()['foods']
+        self.assertEqual([row['id'] for row in foods], self.expected)
+
+    def test_sparse_fields(self):
+        rows = self.client.get('/menu/api/foods/', {'fields': 'id,name,nonsense'}).json()
+        self.assertEqual(set(rows[0]), {'id', 'name'})
+        page = self.client.get('/menu/api/foods/json/', {'fields': 'id,price', 'page_size': 2}).json()
+        self.assertEqual([set(row) for row in page['foods']], [{'id', 'price'}] * 2)
+
+    def test_json_endpoint_pages(self):
+        ids = []
+        params = {'page_size': 5}
+        while True:
+            data = self.client.get('/menu/api/foods/json/', params).json()
+            ids += [row['id'] for row in data['foods']]
+            if not data['next_cursor']:
+                break
+            params['cursor'] = data['next_cursor']
+        self.assertEqual(ids, self.expected)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/menu/api/foods/', {'cursor': 'garbage'}).status_code, 404)
+        self.assertEqual(self.client.get('/menu/api/foods/json/', {'cursor': 'garbage'}).status_code, 400)
+
+
+class MenuImportExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.directory = directory
+
+    def write(self, name, content):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def menu(self):
+        return sorted(Food.objects.values_list('category_name', 'name', 'price', 'description', 'is_available'))
+
+    def test_round_trip(self):
+        for fmt in ('csv', 'jsonl'):
+            with self.subTest(fmt=fmt):
+                mains = Category.objects.create(name='Mains')
+                make_foods(mains, 3, description='Serves {i}, "spicy", with a comma')
+                Food.objects.filter(name='Dish 1').update(is_available=False, price=Decimal('7.25'))
+                exported = self.menu()
+
+                path = f'{self.directory}/menu.{fmt}'
+                call_command('export_menu', path, stdout=StringIO())
+                Food.objects.all().delete()
+                Category.objects.all().delete()
+
+                out = StringIO()
+                call_command('import_menu', path, '--batch-size', '2', stdout=out, stderr=StringIO())
+                self.assertEqual(self.menu(), exported)
+                self.assertIn('Food items created: 3', out.getvalue())
+                self.assertEqual(Category.objects.get(name='Mains').available_foods_count, 2)
+
+                Food.objects.all().delete()
+                Category.objects.all().delete()
+
+    def test_import_upserts_by_category_and_name(self):
+        mains = Category.objects.create(name='Mains')
+        make_foods(mains, 1, name='Jollof')
+        path = self.write('menu.csv', (
+            'category,name,price,description,is_available\n'
+            'Mains,Jollof,5.50,Smoky,yes\n'
+            'Mains,Fried rice,4.00,,no\n'
+            'Mains,,1.00,,yes\n'
+            'Mains,Fried rice,4.50,,true\n'
+        ))
+
+        out, err = StringIO(), StringIO()
+        call_command('import_menu', path, stdout=out, stderr=err)
+        self.assertIn('Food items created: 1', out.getvalue())
+        self.assertIn('Food items updated: 1', out.getvalue())
+        self.assertIn('Row 3 skipped', err.getvalue())
+        # Later rows for the same item win
+        self.assertEqual(self.menu(), [
+            ('Mains', 'Fried rice', Decimal('4.50'), '', True),
+            ('Mains', 'Jollof', Decimal('5.50'), 'Smoky', True),
+        ])
+
+    def test_import_queries_grow_with_batches_not_rows(self):
+        def import_rows(count, offset):
+            rows = ''.join(f'Mains,Dish {offset + i},4.00,,yes\n' for i in range(count))
+            path = self.write(f'menu-{offset}.csv', 'category,name,price,description,is_available\n' + rows)
+            with CaptureQueriesContext(connection) as queries:
+                call_command('import_menu', path, '--batch-size', '50', stdout=StringIO())
+            return len(queries)
+
+        Category.objects.create(name='Mains')
+        one_batch = import_rows(50, 0)
+        # Four batches cost at most four times one batch, however many rows each holds
+        self.assertLessEqual(import_rows(200, 1000), 4 * one_batch)
+        self.assertLess(one_batch, 50)
+
+
+def at(weekday, hour, minute=0):
+    """A moment in the week of Monday 2026-10-19, in the current time zone"""
+    monday = timezone.make_aware(datetime(2026, 10, 19))
+    return monday + timedelta(days=weekday, hours=hour, minutes=minute)
+
+
+class AvailabilityWindowTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.breakfast = Category.objects.create(name='Breakfast')
+        cls.mains = Category.objects.create(name='Mains')
+        make_foods(cls.breakfast, 1, name='Akara')
+        make_foods(cls.breakfast, 1, name='Pancakes')
+        make_foods(cls.mains, 1, name='Jollof')
+        make_foods(cls.mains, 1, name='Suya')
+        cls.foods = {food.name: food for food in Food.objects.all()}
+
+    def setUp(self):
+        cache.clear()
+
+    def add_window(self, starts_at, ends_at, weekday=None, **target):
+        with self.captureOnCommitCallbacks(execute=True):
+            return AvailabilityWindow.objects.create(starts_at=starts_at, ends_at=ends_at, weekday=weekday, **target)
+
+    def orderable(self, now):
+        names = set(Food.objects.filter(schedule.orderable_filter(now), is_available=True).values_list('name', flat=True))
+        # The per-food check agrees with the queryset filter
+        self.assertEqual(names, {name for name, food in self.foods.items() if schedule.is_orderable(food, now)})
+        return names
+
+    def test_unscheduled_menu_is_always_open(self):
+        self.assertEqual(self.orderable(at(2, 3)), set(self.foods))
+        self.assertEqual(schedule.segment_token(at(2, 3)), '')
+
+    def test_category_and_food_windows(self):
+        self.add_window(time(7), time(11), category=self.breakfast)
+        # A food's own window wins over its category's
+        self.add_window(time(6), time(14), food=self.foods['Pancakes'])
+
+        self.assertEqual(self.orderable(at(0, 6, 30)), {'Pancakes', 'Jollof', 'Suya'})
+        self.assertEqual(self.orderable(at(0, 8)), {'Akara', 'Pancakes', 'Jollof', 'Suya'})
+        self.assertEqual(self.orderable(at(0, 12)), {'Pancakes', 'Jollof', 'Suya'})
+        self.assertEqual(self.orderable(at(0, 14)), {'Jollof', 'Suya'})
+
+    def test_window_past_midnight_on_one_weekday(self):
+        # Friday late night runs into Saturday morning
+        self.add_window(time(22), time(2), weekday=4, food=self.foods['Suya'])
+
+        self.assertNotIn('Suya', self.orderable(at(4, 21, 59)))
+        self.assertIn('Suya', self.orderable(at(4, 23)))
+        self.assertIn('Suya', self.orderable(at(5, 1, 59)))
+        self.assertNotIn('Suya', self.orderable(at(5, 2)))
+        self.assertNotIn('Suya', self.orderable(at(3, 23)))
+
+    def test_segments_share_tokens_by_open_set(self):
+        self.add_window(time(7), time(11), category=self.breakfast)
+        self.assertEqual(schedule.segment_token(at(0, 8)), schedule.segment_token(at(3, 9)))
+        self.assertNotEqual(schedule.segment_token(at(0, 8)), schedule.segment_token(at(0, 12)))
+
+    def test_schedule_changes_are_seen_after_commit(self):
+        window = self.add_window(time(7), time(11), category=self.breakfast)
+        self.assertNotIn('Akara', self.orderable(at(0, 12)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AvailabilityWindow.objects.filter(pk=window.pk).update(ends_at=time(13))
+        self.assertIn('Akara', self.orderable(at(0, 12)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            window.delete()
+        self.assertEqual(self.orderable(at(0, 3)), set(self.foods))
+
+    def test_closed_window_on_an_unscheduled_food_evicts_its_snapshot(self):
+        # Something else is scheduled and open around the clock, so the open set
+        # now is the same before and after the new window
+        self.add_window(time(0), time(0), food=self.foods['Akara'])
+        before = self.client.get('/menu/api/foods/json/')
+        self.assertIn('Suya', [row['name'] for row in before.json()['foods']])
+
+        later = timezone.localtime() + timedelta(hours=2)
+        self.add_window(later.time(), (later + timedelta(hours=1)).time(), food=self.foods['Suya'])
+
+        after = self.client.get('/menu/api/foods/json/', HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotIn('Suya', [row['name'] for row in after.json()['foods']])
+        self.assertNotIn('Suya', [row['name'] for row in self.client.get('/menu/api/foods/').json()])
+
+    def test_lookups_read_the_cached_index(self):
+        self.add_window(time(7), time(11), category=self.breakfast)
+        schedule.get_schedule()
+        with self.assertNumQueries(0):
+            for hour in range(24):
+                schedule.orderable_filter(at(1, hour))
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Mains')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_name_hits_rank_above_description_hits(self):
+        make_foods(self.category, 1, name='Garden salad', description='Comes with jollof on the side')
+        make_foods(self.category, 1, name='Jollof rice', description='Smoky party rice')
+
+        names = [row['name'] for row in search.search_foods('jollof')]
+        self.assertEqual(names, ['Jollof rice', 'Garden salad'])
+        self.assertEqual(search.search_foods('jol')[0]['name'], 'Jollof rice')
+
+    def test_newer_available_hits_are_not_crowded_out(self):
+        # More older matches than any ranking window, none of them available
+        make_foods(self.category, 2100, name='Rice bowl {i}', is_available=False)
+        make_foods(self.category, 1, name='Rice')
+
+        results = search.search_foods('rice', limit=5)
+        self.assertEqual([row['name'] for row in results], ['Rice'])
+
+    def test_operators_in_the_query_are_inert(self):
+        make_foods(self.category, 1, name='Fried plantain')
+        self.assertEqual(search.search_foods('plantain OR "'), [])
+        self.assertEqual(search.search_foods('(plan')[0]['name'], 'Fried plantain')
+
+    def test_suggest_completes_names(self):
+        make_foods(self.category, 1, name='Suya skewers')
+        make_foods(self.category, 1, name='Suya wrap', description='suya')
+        make_foods(self.category, 1, name='Pepper soup', description='Suya spice')
+
+        self.assertEqual(sorted(search.suggest('suy')), ['Suya skewers', 'Suya wrap'])
+
+    def test_search_endpoint(self):
+        make_foods(self.category, 1, name='Egusi soup')
+        data = self.client.get('/menu/api/search/', {'q': 'egusi'}).json()
+        self.assertEqual([row['name'] for row in data['results']], ['Egusi soup'])
+        self.assertEqual(data['suggestions'], ['Egusi soup'])
+
+    def test_admin_search_is_not_capped(self):
+        make_foods(self.category, 1200, name='Stew {i}', is_available=False)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass')
+        self.client.force_login(admin)
+
+        response = self.client.get('/admin/menu/food/', {'q': 'stew'})
+        self.assertContains(response, '1200 foods')
+        self.assertEqual(Food.objects.filter(pk__in=search.matching_ids('stew')).count(), 1200)
+
+
+def photo(color='red', size=(800, 600)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class ImageVariantTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Mains')
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_settings = override_settings(MEDIA_ROOT=media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def make_food(self, content, name='Jollof'):
+        return Food.objects.create(
+            category=self.category, category_name=self.category.name, name=name, description='',
+            price=Decimal('4.00'), image=SimpleUploadedFile('dish.jpg', content, 'image/jpeg'),
+        )
+
+    def test_variants_are_named_after_the_content(self):
+        food = self.make_food(photo())
+        self.assertEqual(set(food.image_variants), set(VARIANTS))
+        for variant, formats in food.image_variants.items():
+            self.assertEqual(set(formats), set(FORMATS))
+            for fmt, name in formats.items():
+                self.assertRegex(name, rf'^foods/derived/[0-9a-f]{{20}}-{variant}\.{fmt}$')
+                with default_storage.open(name) as stored, Image.open(stored) as image:
+                    self.assertEqual(image.size, VARIANTS[variant])
+
+        # The same photo on another food shares the stored files
+        twin = self.make_food(photo(), name='Jollof (large)')
+        self.assertEqual(twin.image_variants, food.image_variants)
+        self.assertNotEqual(self.make_food(photo('blue')).image_variants, food.image_variants)
+
+    def test_unreadable_upload_is_saved_without_variants(self):
+        with self.assertLogs('menu.signals', 'ERROR'):
+            food = self.make_food(b'not really a jpeg')
+        food.refresh_from_db()
+        self.assertEqual(food.image_variants, {})
+
+        out = StringIO()
+        call_command('generate_food_images', stdout=out, stderr=StringIO())
+        self.assertIn('0 food items processed, 1 failed', out.getvalue())
+
+
+class SerializerParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        mains = Category.objects.create(name='Mains', description='Hot plates')
+        sides = Category.objects.create(name='Sides')
+        make_foods(mains, 2)
+        make_foods(sides, 1, is_available=False)
+        # Stored names are enough: the URLs are built without opening the files
+        Food.objects.filter(name='Dish 0', category=mains).update(
+            image='foods/dish.jpg',
+            image_variants={variant: {fmt: f'foods/derived/dish-{variant}.{fmt}' for fmt in FORMATS}
+                            for variant in VARIANTS},
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_foods_match_the_serializer(self):
+        foods = Food.objects.order_by('id')
+        request = RequestFactory().get('/menu/api/foods/')
+        for context in ({}, {'request': request}):
+            with self.subTest(request='request' in context):
+                fast = serialize_foods(foods.values(*FOOD_COLUMNS), context.get('request'))
+                self.assertEqual(fast, FoodSerializer(foods, many=True, context=context).data)
+                self.assertIsNotNone(fast[0]['image_srcset'])
+
+        fast = serialize_foods(foods.values(*FOOD_COLUMNS), request, fields='id,image,price')
+        self.assertEqual(fast, FoodSerializer(foods, many=True, context={'request': request},
+                                              fields='id,image,price').data)
+
+    def test_categories_match_the_serializer(self):
+        categories = Category.objects.order_by('name')
+        self.assertEqual(serialize_categories(categories.values(*CATEGORY_COLUMNS)),
+                         CategorySerializer(categories, many=True).data)
@@ -8,6 +8,7 @@ urlpatterns = [
     path('api/categories/', views.CategoryListView.as_view(), name='api_categories'),
     path('api/foods/', views.FoodListView.as_view(), name='api_foods'),
     path('api/foods/category/<int:category_id>/', views.foods_by_category, name='api_foods_by_category'),
+    path('api/search/', views.search_foods, name='api_search'),
     
     path('api/categories/json/', views.categories_json, name='categories_json'),
     path('api/foods/json/', views.foods_json, name='foods_json'),
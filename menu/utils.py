@@ -0,0 +1,231 @@
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+from restaurant_site.pagination import keyset_page
+from . import schedule
+from .images import variant_urls
+from .models import Category, Food
+
+
+SNAPSHOT_TIMEOUT = 60 * 60 * 24  # Snapshots are keyed by version; this only bounds idle entries
+
+CATEGORIES_SCOPE = 'categories'
+ALL_FOODS_SCOPE = 'foods_all'
+
+# Keyset for paginating foods: Food's default ordering, so pages come in the
+# unpaginated order; backed by the index on Food(category_name, name, id)
+FOOD_KEYSET_ORDERING = ('category_name', 'name', 'id')
+
+# foods_json output keys; None means the model field of the same name
+FOODS_JSON_FIELDS = {
+    'id': None,
+    'name': None,
+    'description': None,
+    'price': None,
+    'image': None,
+    'image_variants': None,  # also adds image_srcset
+    'category__name': F('category_name'),
+    'category__id': F('category_id'),
+}
+
+
+def foods_scope(category_id=None):
+    """Cache scope for the foods list of one category, or of the whole menu"""
+    if category_id is None:
+        return ALL_FOODS_SCOPE
+    return f'foods_{category_id}'
+
+
+def get_menu_version(scope):
+    """Return the current version of a menu scope, seeding it if the cache was flushed"""
+    version_key = f'menu_version_{scope}'
+    version = cache.get(version_key)
+    if version is None:
+        # Seed from the clock so a flushed (or expired) version never serves an old snapshot again
+        cache.add(version_key, int(time.time() * 1000), settings.CACHE_VERSION_TIMEOUT)
+        version = cache.get(version_key)
+    return version
+
+
+def bump_menu_version(*scopes):
+    """Move each scope to a new version, orphaning its snapshots"""
+    for scope in scopes:
+        try:
+            cache.incr(f'menu_version_{scope}')
+        except ValueError:
+            # Key was evicted; a fresh clock seed is always ahead of the old value
+            get_menu_version(scope)
+
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_menu_sync():
+    """
+    Collect the counter recounts and cache evictions requested by bulk writes
+    inside the block and apply each one once, on exit.
+    """
+    state = {'recount': set(), 'category_ids': set(), 'categories': False}
+    _deferred.state = state
+    try:
+        yield
+    finally:
+        _deferred.state = None
+        if state['recount']:
+            recount_available_foods(state['recount'])
+        invalidate_menu(state['category_ids'], state['categories'])
+
+
+def _deferred_state():
+    return getattr(_deferred, 'state', None)
+
+
+def invalidate_menu(category_ids=(), categories=False):
+    """
+    Evict the menu snapshots affected by a write once it commits: the foods
+    lists of ``category_ids`` plus the "all" list, and the category list
+    when ``categories`` is true.
+    """
+    state = _deferred_state()
+    if state is not None:
+        state['category_ids'].update(category_ids)
+        state['categories'] = state['categories'] or categories
+        return
+
+    scopes = {ALL_FOODS_SCOPE}
+    scopes.update(foods_scope(category_id) for category_id in category_ids if category_id)
+    if categories:
+        scopes.add(CATEGORIES_SCOPE)
+    transaction.on_commit(lambda: bump_menu_version(*scopes))
+
+
+def adjust_available_foods(category_id, delta):
+    """Apply an incremental change to a category's available-foods counter"""
+    if category_id and delta:
+        Category.objects.filter(pk=category_id).update(
+            available_foods_count=F('available_foods_count') + delta
+        )
+
+
+def recount_available_foods(category_ids=None):
+    """Recompute the available-foods counter for ``category_ids`` (or every category) in one statement"""
+    state = _deferred_state()
+    if state is not None and category_ids is not None:
+        state['recount'].update(category_ids)
+        return 0
+
+    available = (
+        Food.objects.filter(category=OuterRef('pk'), is_available=True)
+        .order_by()
+        .values('category')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+    return categories.update(available_foods_count=Coalesce(Subquery(available), 0))
+
+
+# Sent with ``food_ids`` after a bulk write (a queryset update, import_menu)
+# changed their prices without saving each food, so carts can reprice
+foods_repriced = Signal()
+
+
+def get_menu_snapshot(scope, build, variant=''):
+    """
+    Return ``(body, etag)`` for ``scope`` at its current version: the
+    pre-encoded JSON body and a strong ETag hashed from it, so the same
+    content has the same validator in every process and across version
+    bumps. ``variant`` distinguishes different views of the same scope
+    (page, fields). ``build`` is only called on a miss and must return
+    JSON-serializable data.
+    """
+    cache_key = f'menu_snapshot_{scope}_{get_menu_version(scope)}'
+    if variant:
+        cache_key += '_' + hashlib.md5(variant.encode('utf-8')).hexdigest()
+    snapshot = cache.get(cache_key)
+
+    if snapshot is None:
+        body = json.dumps(build(), cls=DjangoJSONEncoder).encode('utf-8')
+        snapshot = (body, f'"{hashlib.md5(body).hexdigest()}"')
+        cache.set(cache_key, snapshot, SNAPSHOT_TIMEOUT)
+
+    return snapshot
+
+
+def build_categories_payload():
+    categories = Category.objects.all().values('id', 'name', 'description')
+    return {
+        'categories': list(categories),
+        'success': True
+    }
+
+
+def _with_image_urls(row):
+    if 'image_variants' in row:
+        row['image_variants'], row['image_srcset'] = variant_urls(row['image_variants'])
+    return row
+
+
+def build_foods_payload(category_id=None, fields=None, cursor=None, page_size=None, now=None):
+    """
+    Build the foods_json payload. ``fields`` limits the keys of each row, and
+    a ``page_size`` switches to keyset pagination with a ``next_cursor``.
+    Only foods orderable at ``now`` (see menu.schedule) are included.
+    """
+    foods_query = Food.objects.filter(schedule.orderable_filter(now), is_available=True)
+
+    if category_id:
+        foods_query = foods_query.filter(category_id=category_id)
+
+    # Read the denormalized category columns; keys match the original join
+    if fields:
+        fields = [name for name in fields if name in FOODS_JSON_FIELDS] or None
+    selected = [name for name in FOODS_JSON_FIELDS if name in (fields or FOODS_JSON_FIELDS)]
+    columns = [name for name in selected if FOODS_JSON_FIELDS[name] is None]
+    aliases = {name: FOODS_JSON_FIELDS[name] for name in selected if FOODS_JSON_FIELDS[name] is not None}
+
+    if page_size is None:
+        return {
+            'foods': [_with_image_urls(row) for row in foods_query.values(*columns, **aliases)],
+            'success': True
+        }
+
+    # The keyset columns must be in each row to build the next cursor
+    columns += [name for name in FOOD_KEYSET_ORDERING if name not in columns]
+    rows, next_cursor = keyset_page(
+        foods_query.values(*columns, **aliases), FOOD_KEYSET_ORDERING, cursor, page_size
+    )
+    foods_data = [_with_image_urls({name: row[name] for name in selected}) for row in rows]
+    return {
+        'foods': foods_data,
+        'next_cursor': next_cursor,
+        'success': True
+    }
+
+
+def warm_menu_cache():
+    """Build every menu snapshot for the current versions; returns the scopes warmed"""
+    warmed = [CATEGORIES_SCOPE, ALL_FOODS_SCOPE]
+    token = schedule.segment_token()
+    get_menu_snapshot(CATEGORIES_SCOPE, build_categories_payload)
+    get_menu_snapshot(ALL_FOODS_SCOPE, build_foods_payload, token)
+
+    for category_id in Category.objects.values_list('id', flat=True):
+        scope = foods_scope(category_id)
+        get_menu_snapshot(scope, lambda: build_foods_payload(category_id), token)
+        warmed.append(scope)
+
+    return warmed
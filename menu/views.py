@@ -2,36 +2,72 @@ from django.shortcuts import render
 from rest_framework import generics, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from . import schedule, search
 from .models import Category, Food
-from .serializers import CategorySerializer, FoodSerializer
-from django.http import JsonResponse
-from django.views.decorators.cache import cache_page
-from django.views.decorators.http import require_http_methods
-from django.core.cache import cache
-import json
+from .serializers import (
+    CATEGORY_COLUMNS, FOOD_COLUMNS, CategorySerializer, FoodSerializer,
+    parse_fields, serialize_categories, serialize_foods
+)
+from .utils import (
+    CATEGORIES_SCOPE, FOOD_KEYSET_ORDERING, build_categories_payload, build_foods_payload,
+    foods_scope, get_menu_snapshot
+)
+from restaurant_site.pagination import InvalidCursor, KeysetPagination, decode_cursor, get_page_size
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import etag, require_http_methods
+
+
+class FoodPagination(KeysetPagination):
+    ordering = FOOD_KEYSET_ORDERING
 
 
 class CategoryListView(generics.ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    
+    def list(self, request, *args, **kwargs):
+        rows = self.get_queryset().values(*CATEGORY_COLUMNS)
+        return Response(serialize_categories(rows))
 
 
 class FoodListView(generics.ListAPIView):
     serializer_class = FoodSerializer
+    pagination_class = FoodPagination
     
     def get_queryset(self):
-        return Food.objects.filter(is_available=True)
+        return Food.objects.filter(schedule.orderable_filter(), is_available=True)
+    
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.request.query_params.get('fields'))
+        return super().get_serializer(*args, **kwargs)
+    
+    def list(self, request, *args, **kwargs):
+        # Same output as FoodSerializer, built from values() rows
+        rows = self.get_queryset().values(*FOOD_COLUMNS)
+        fields = request.query_params.get('fields')
+        
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_foods(page, request, fields))
+        return Response(serialize_foods(rows, request, fields))
 
 
 @api_view(['GET'])
 def foods_by_category(request, category_id):
-    try:
-        category = Category.objects.get(id=category_id)
-        foods = Food.objects.filter(category=category, is_available=True)
-        serializer = FoodSerializer(foods, many=True)
-        return Response(serializer.data)
-    except Category.DoesNotExist:
+    if not Category.objects.filter(id=category_id).exists():
         return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    rows = Food.objects.filter(
+        schedule.orderable_filter(), category_id=category_id, is_available=True
+    ).values(*FOOD_COLUMNS)
+    fields = request.query_params.get('fields')
+    
+    paginator = FoodPagination()
+    page = paginator.paginate_queryset(rows, request)
+    if page is not None:
+        return paginator.get_paginated_response(serialize_foods(page, fields=fields))
+    return Response(serialize_foods(rows, fields=fields))
 
 
 # Template views
@@ -39,44 +75,90 @@ def menu_page(request):
     return render(request, 'menu/menu.html')
 
 
-@cache_page(60 * 5)  # Cache for 5 minutes
+class InvalidMenuQuery(ValueError):
+    pass
+
+
+def categories_snapshot(request):
+    return get_menu_snapshot(CATEGORIES_SCOPE, build_categories_payload)
+
+
+def foods_snapshot(request):
+    """``(body, etag)`` for a foods_json request; raises InvalidMenuQuery for a bad query"""
+    category_id = request.GET.get('category')
+    if category_id and not category_id.isdigit():
+        raise InvalidMenuQuery('Invalid category')
+    
+    fields = parse_fields(request.GET.get('fields'))
+    cursor = request.GET.get('cursor')
+    page_size = get_page_size(request.GET, FoodPagination.page_size, FoodPagination.max_page_size)
+    if cursor:
+        try:
+            decode_cursor(cursor, Food, FOOD_KEYSET_ORDERING)
+        except InvalidCursor:
+            raise InvalidMenuQuery('Invalid cursor')
+    
+    # The schedule segment is part of the key, so each window gets its own snapshot
+    now = timezone.now()
+    token = schedule.segment_token(now)
+    variant = f'{fields}|{cursor}|{page_size}|{token}' if fields or page_size else token
+    return get_menu_snapshot(
+        foods_scope(category_id or None),
+        lambda: build_foods_payload(category_id, fields, cursor, page_size, now),
+        variant
+    )
+
+
+def request_snapshot(request, load):
+    """The snapshot for this request, loaded once for both the ETag check and the view"""
+    if not hasattr(request, '_menu_snapshot'):
+        request._menu_snapshot = load(request)
+    return request._menu_snapshot
+
+
+def snapshot_etag(load):
+    """An @etag function returning the content hash of the request's snapshot"""
+    def get_etag(request, *args, **kwargs):
+        try:
+            return request_snapshot(request, load)[1]
+        except InvalidMenuQuery:
+            return None
+    return get_etag
+
+
 @require_http_methods(["GET"])
+@etag(snapshot_etag(categories_snapshot))
 def categories_json(request):
     """Fast JSON endpoint for categories"""
-    cache_key = 'categories_list'
-    categories_data = cache.get(cache_key)
-    
-    if categories_data is None:
-        categories = Category.objects.all().values('id', 'name', 'description')
-        categories_data = list(categories)
-        cache.set(cache_key, categories_data, 60 * 10)  # Cache for 10 minutes
-    
-    return JsonResponse({
-        'categories': categories_data,
-        'success': True
-    })
+    body, _ = request_snapshot(request, categories_snapshot)
+    return HttpResponse(body, content_type='application/json')
+
 
-@cache_page(60 * 2)  # Cache for 2 minutes
 @require_http_methods(["GET"])
+@etag(snapshot_etag(foods_snapshot))
 def foods_json(request):
-    """Fast JSON endpoint for all available foods"""
-    category_id = request.GET.get('category')
-    cache_key = f'foods_list_{category_id or "all"}'
-    foods_data = cache.get(cache_key)
-    
-    if foods_data is None:
-        foods_query = Food.objects.filter(is_available=True).select_related('category')
-        
-        if category_id:
-            foods_query = foods_query.filter(category_id=category_id)
-        
-        foods_data = list(foods_query.values(
-            'id', 'name', 'description', 'price', 'image',
-            'category__name', 'category__id'
-        ))
-        cache.set(cache_key, foods_data, 60 * 5)  # Cache for 5 minutes
+    """
+    Fast JSON endpoint for all available foods. Supports ``fields=id,name,price``
+    and keyset pagination through ``page_size`` and ``cursor``.
+    """
+    try:
+        body, _ = request_snapshot(request, foods_snapshot)
+    except InvalidMenuQuery as e:
+        return JsonResponse({'error': str(e), 'success': False}, status=400)
+    return HttpResponse(body, content_type='application/json')
+
+
+@require_http_methods(["GET"])
+def search_foods(request):
+    """Ranked full-text search over available foods, with name autocomplete"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 20)), 50))
+    except ValueError:
+        limit = 20
     
     return JsonResponse({
-        'foods': foods_data,
+        'results': search.search_foods(query, limit) if query else [],
+        'suggestions': search.suggest(query) if query else [],
         'success': True
     })
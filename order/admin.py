@@ -1,8 +1,11 @@
 from django.contrib import admin
+from django.core.files.storage import default_storage
 from django.utils.html import format_html
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.safestring import mark_safe
-from .models import Order, OrderItem
+from .models import EmailOutbox, Order, OrderItem, OrderStatusEvent
+from .utils import bulk_transition
 
 
 class OrderItemInline(admin.TabularInline):
@@ -12,6 +15,16 @@ class OrderItemInline(admin.TabularInline):
     can_delete = False
 
 
+class OrderStatusEventInline(admin.TabularInline):
+    model = OrderStatusEvent
+    extra = 0
+    readonly_fields = ['previous_status', 'status', 'created_at']
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = [
@@ -22,7 +35,7 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ['customer_name', 'customer_email', 'customer_phone', 'order_number']
     list_editable = ['status']
     readonly_fields = ['order_number', 'total', 'created_at', 'updated_at', 'user', 'cart']
-    inlines = [OrderItemInline]
+    inlines = [OrderItemInline, OrderStatusEventInline]
     
     fieldsets = (
         ('Order Information', {
@@ -59,12 +72,15 @@ class OrderAdmin(admin.ModelAdmin):
     colored_status.short_description = 'Status'
     
     def receipt_preview(self, obj):
-        if obj.receipt:
+        if obj.receipt and obj.receipt_thumbnail:
             return format_html(
                 '<a href="{}" target="_blank"><img src="{}" style="max-height: 100px; max-width: 200px;"/></a>',
                 obj.receipt.url,
-                obj.receipt.url
+                default_storage.url(obj.receipt_thumbnail)
             )
+        if obj.receipt:
+            # Not processed yet; link to the upload rather than inline a full-size photo
+            return format_html('<a href="{}" target="_blank">View receipt (processing)</a>', obj.receipt.url)
         return "No receipt uploaded"
     receipt_preview.short_description = 'Receipt'
     
@@ -73,24 +89,27 @@ class OrderAdmin(admin.ModelAdmin):
     
     actions = ['mark_as_confirmed', 'mark_as_preparing', 'mark_as_ready', 'mark_as_delivered']
     
+    def _transition(self, request, queryset, status):
+        moved, skipped = bulk_transition(queryset, status)
+        message = f'{len(moved)} orders marked as {status}.'
+        if skipped:
+            message += f' {len(skipped)} skipped because they cannot move to {status} from their current status.'
+        self.message_user(request, message)
+    
     def mark_as_confirmed(self, request, queryset):
-        updated = queryset.update(status='confirmed')
-        self.message_user(request, f'{updated} orders marked as confirmed.')
+        self._transition(request, queryset, 'confirmed')
     mark_as_confirmed.short_description = "Mark selected orders as confirmed"
     
     def mark_as_preparing(self, request, queryset):
-        updated = queryset.update(status='preparing')
-        self.message_user(request, f'{updated} orders marked as preparing.')
+        self._transition(request, queryset, 'preparing')
     mark_as_preparing.short_description = "Mark selected orders as preparing"
     
     def mark_as_ready(self, request, queryset):
-        updated = queryset.update(status='ready')
-        self.message_user(request, f'{updated} orders marked as ready.')
+        self._transition(request, queryset, 'ready')
     mark_as_ready.short_description = "Mark selected orders as ready"
     
     def mark_as_delivered(self, request, queryset):
-        updated = queryset.update(status='delivered')
-        self.message_user(request, f'{updated} orders marked as delivered.')
+        self._transition(request, queryset, 'delivered')
     mark_as_delivered.short_description = "Mark selected orders as delivered"
 
 
@@ -100,3 +119,21 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_filter = ['order__status', 'order__created_at']
     search_fields = ['food_name', 'order__customer_name']
     readonly_fields = ['order', 'food_name', 'food_price', 'quantity', 'subtotal']
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject', 'order__customer_email']
+    readonly_fields = [
+        'order', 'subject', 'body', 'from_email', 'recipients', 'status',
+        'attempts', 'next_attempt_at', 'last_error', 'created_at', 'sent_at'
+    ]
+    
+    actions = ['retry_now']
+    
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='pending', next_attempt_at=timezone.now())
+        self.message_user(request, f'{updated} emails queued for the next delivery run.')
+    retry_now.short_description = "Retry selected emails now"
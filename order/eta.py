@@ -0,0 +1,209 @@
+"""
+Delivery estimates from the kitchen's own history.
+
+OrderStatusStat holds one row per status with two figures: how many orders
+are at that status now, and a rolling average of how long orders stay
+there. Every transition updates these rows with a single UPDATE, in the
+same transaction that moves the orders. An estimate therefore never has
+to aggregate the order history. It reads a small cached summary of the
+rows and adds up a few durations. Time spent in the kitchen statuses is
+stretched or shrunk by the current queue against its usual depth: at a
+steady pace, waiting time grows with the queue (Little's law).
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Coalesce
+from .models import ACTIVE_STATUSES, STATUS_FLOW, Order, OrderStatusEvent, OrderStatusStat
+
+
+# Expected time at each status until there are samples; together they give
+# the original fixed 45/40/35/20/10 minute estimates
+DEFAULT_DURATIONS = {
+    'pending': timedelta(minutes=5),
+    'paid': timedelta(minutes=5),
+    'confirmed': timedelta(minutes=15),
+    'preparing': timedelta(minutes=10),
+    'ready': timedelta(minutes=10),
+}
+
+ETA_SMOOTHING = 0.2  # Weight of the newest sample in the rolling averages
+
+# Bounds on how much a busy or quiet kitchen scales its statuses' durations
+MIN_LOAD_FACTOR = 0.5
+MAX_LOAD_FACTOR = 3.0
+
+ETA_STATS_CACHE_KEY = 'order_eta_stats'
+ETA_STATS_TIMEOUT = 30  # Estimates may lag the latest transitions by this many seconds
+
+
+def is_next_status(old_status, new_status):
+    """Only a step to the very next status times the old one; skips and cancellations don't"""
+    return (
+        old_status in STATUS_FLOW and new_status in STATUS_FLOW
+        and STATUS_FLOW.index(new_status) == STATUS_FLOW.index(old_status) + 1
+    )
+
+
+def _by_status(values, default):
+    whens = [When(status=status, then=value) for status, value in values.items()]
+    return Case(*whens, default=default) if whens else default
+
+
+def record_transitions(changes, now):
+    """
+    Fold ``(order, previous_status, entered_at)`` changes (``order`` already
+    at its new status, ``entered_at`` when it reached ``previous_status``)
+    into the OrderStatusStat rows with one UPDATE
+    """
+    if not changes:
+        return
+    depth_changes = Counter()
+    durations = defaultdict(list)
+    for order, previous, entered_at in changes:
+        depth_changes[order.status] += 1
+        if previous:
+            depth_changes[previous] -= 1
+            if entered_at is not None and is_next_status(previous, order.status):
+                durations[previous].append((now - entered_at).total_seconds())
+
+    averages = {}
+    for status, seconds in durations.items():
+        mean = sum(seconds) / len(seconds)
+        # n samples at once move the average as far as n single samples of their mean would
+        weight = 1 - (1 - ETA_SMOOTHING) ** len(seconds)
+        current = Coalesce(F('avg_seconds'), Value(mean))
+        averages[status] = current + Value(weight) * (Value(mean) - current)
+
+    depth = F('queue_depth') + _by_status(
+        {status: Value(change) for status, change in depth_changes.items() if change}, Value(0)
+    )
+    OrderStatusStat.objects.update(
+        # Listed before queue_depth, so even backends that apply SET left to right read the old depth
+        avg_queue_depth=F('avg_queue_depth') + Value(ETA_SMOOTHING) * (depth - F('avg_queue_depth')),
+        queue_depth=depth,
+        avg_seconds=_by_status(averages, F('avg_seconds')),
+        samples=F('samples') + _by_status(
+            {status: Value(len(seconds)) for status, seconds in durations.items()}, Value(0)
+        ),
+    )
+
+
+def record_deletions(statuses):
+    """Take deleted orders, one per entry of ``statuses``, out of the queue depths with one UPDATE"""
+    removed = Counter(statuses)
+    if removed:
+        OrderStatusStat.objects.filter(status__in=removed).update(
+            queue_depth=F('queue_depth') - _by_status(
+                {status: Value(count) for status, count in removed.items()}, Value(0)
+            )
+        )
+
+
+def summarize(rows):
+    """
+    The figures an estimate needs from OrderStatusStat ``rows``: expected
+    seconds at each status, and after it until delivery
+    """
+    rows = {row['status']: row for row in rows}
+    queue = sum(max(rows[status]['queue_depth'], 0) for status in ACTIVE_STATUSES if status in rows)
+    usual = sum(rows[status]['avg_queue_depth'] for status in ACTIVE_STATUSES if status in rows)
+    load = min(max((queue + 1) / (usual + 1), MIN_LOAD_FACTOR), MAX_LOAD_FACTOR)
+
+    durations = {}
+    for status, default in DEFAULT_DURATIONS.items():
+        seconds = rows.get(status, {}).get('avg_seconds')
+        if seconds is None:
+            seconds = default.total_seconds()
+        durations[status] = seconds * load if status in ACTIVE_STATUSES else seconds
+
+    after = {}
+    remaining = 0
+    for status in reversed(list(durations)):
+        after[status] = remaining
+        remaining += durations[status]
+    return {'load': load, 'durations': durations, 'after': after}
+
+
+def get_eta_stats():
+    stats = cache.get(ETA_STATS_CACHE_KEY)
+    if stats is None:
+        stats = summarize(OrderStatusStat.objects.values('status', 'queue_depth', 'avg_queue_depth', 'avg_seconds'))
+        cache.set(ETA_STATS_CACHE_KEY, stats, ETA_STATS_TIMEOUT)
+    return stats
+
+
+def estimate_delivery(status, entered_at, now=None):
+    """
+    When an order that reached ``status`` at ``entered_at`` should be
+    delivered; None once it is delivered or cancelled. Pass ``now`` to
+    push the estimate of an order running late past the present.
+    """
+    stats = get_eta_stats()
+    if status not in stats['durations']:
+        return None
+
+    due = entered_at + timedelta(seconds=stats['durations'][status])
+    if now is not None and due < now:
+        due = now
+    return due + timedelta(seconds=stats['after'][status])
+
+
+def _rolling_average(samples):
+    average = None
+    for sample in samples:
+        average = sample if average is None else average + ETA_SMOOTHING * (sample - average)
+    return average
+
+
+def rebuild_eta_stats():
+    """
+    Recompute every OrderStatusStat from scratch: queue depths from the
+    orders, durations from the status event log, and from the
+    confirmed_at/delivered_at stamps for statuses the log has no samples for
+    """
+    depths = dict(Order.objects.order_by().values_list('status').annotate(Count('id')))
+
+    samples = defaultdict(list)  # status -> [(ended at, seconds)]
+    previous = None
+    events = OrderStatusEvent.objects.order_by('order_id', 'id').values('order_id', 'status', 'created_at')
+    for event in events.iterator():
+        if (previous and previous['order_id'] == event['order_id']
+                and is_next_status(previous['status'], event['status'])):
+            seconds = (event['created_at'] - previous['created_at']).total_seconds()
+            samples[previous['status']].append((event['created_at'], seconds))
+        previous = event
+
+    # Orders from before the event log only have milestone stamps; each span
+    # is shared out over the statuses it covers in the default proportions
+    spans = [('created_at', 'confirmed_at', ('pending', 'paid')),
+             ('confirmed_at', 'delivered_at', ('confirmed', 'preparing', 'ready'))]
+    for start, end, statuses in spans:
+        missing = [status for status in statuses if not samples[status]]
+        if not missing:
+            continue
+        total = sum(DEFAULT_DURATIONS[status].total_seconds() for status in statuses)
+        stamped = Order.objects.filter(**{f'{start}__isnull': False, f'{end}__isnull': False})
+        for started, ended in stamped.values_list(start, end).iterator():
+            for status in missing:
+                share = DEFAULT_DURATIONS[status].total_seconds() / total
+                samples[status].append((ended, (ended - started).total_seconds() * share))
+
+    stats = [
+        OrderStatusStat(
+            status=status,
+            queue_depth=depths.get(status, 0),
+            avg_queue_depth=depths.get(status, 0) if status in ACTIVE_STATUSES else 0,
+            avg_seconds=_rolling_average(seconds for ended, seconds in sorted(samples[status])),
+            samples=len(samples[status]),
+        )
+        for status, label in Order.STATUS_CHOICES
+    ]
+    with transaction.atomic():
+        OrderStatusStat.objects.all().delete()
+        OrderStatusStat.objects.bulk_create(stats)
+    cache.delete(ETA_STATS_CACHE_KEY)
+    return stats
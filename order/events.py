@@ -0,0 +1,98 @@
+"""
+In-process pub/sub for order events.
+
+Writers publish after their transaction commits, from any thread; each
+subscriber is an asyncio queue owned by one streaming response, so an
+open tracking tab or kitchen screen waits on its queue instead of
+polling the database. The broker only reaches subscribers in the same
+process, so streams also check a shared cache marker now and then to
+pick up events written by other processes (admin workers, commands).
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._listeners = defaultdict(list)
+
+    def subscribe(self, topic):
+        """Register a queue for ``topic``; call from the event loop that will read it"""
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+        with self._lock:
+            self._subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, topic, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def subscriber_count(self, topic):
+        with self._lock:
+            return len(self._subscribers.get(topic, ()))
+
+    def listen(self, topic, callback):
+        """Call ``callback(message)`` synchronously, in the publishing thread, for every message on ``topic``"""
+        with self._lock:
+            self._listeners[topic].append(callback)
+
+    def unlisten(self, topic, callback):
+        with self._lock:
+            if callback in self._listeners.get(topic, ()):
+                self._listeners[topic].remove(callback)
+
+    def publish(self, topic, message):
+        """Hand ``message`` to every listener and subscriber of ``topic``; safe to call from any thread"""
+        with self._lock:
+            listeners = list(self._listeners.get(topic, ()))
+            subscribers = list(self._subscribers.get(topic, ()))
+        for callback in listeners:
+            try:
+                callback(message)
+            except Exception:
+                # The write already committed; a listener that missed it catches up from the event log
+                logger.exception('Listener %r failed on topic %s', callback, topic)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:
+                # The subscriber's loop already closed; it unsubscribes on its way out
+                pass
+
+
+def _offer(queue, message):
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        # A stalled reader drops live messages; its next catch-up read replays them
+        pass
+
+
+broker = Broker()
+
+
+def sse_message(data, event=None, event_id=None):
+    """One Server-Sent Events frame"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, cls=DjangoJSONEncoder)}')
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,150 @@
+"""
+The kitchen display board.
+
+One KitchenBoard per process holds the active orders (paid, confirmed,
+preparing) with their lines. It is loaded from the database the first
+time a screen connects. After that it is kept current from the status
+events published on commit, so any number of screens read memory, not
+the database. Only an order entering the board costs a query, and that
+query is shared by every screen in the process. Events written by other
+processes are picked up by a periodic catch-up read of the event log,
+which only runs when the shared marker says there is something new.
+"""
+import threading
+
+from django.core.cache import cache
+from rest_framework import serializers
+from .events import broker
+from .models import ACTIVE_STATUSES, Order, OrderItem, OrderStatusEvent
+from .utils import ALL_ORDERS_TOPIC, ORDER_EVENT_MARKER_TIMEOUT, order_event_marker_key
+
+
+KITCHEN_TOPIC = 'kitchen'
+
+KITCHEN_ORDER_COLUMNS = ('id', 'status', 'customer_name', 'delivery_address', 'created_at')
+
+_timestamp = serializers.DateTimeField()
+
+
+def _kitchen_orders(order_ids=None):
+    """Board entries for the active orders (among ``order_ids``), in two queries"""
+    orders = Order.objects.filter(status__in=ACTIVE_STATUSES)
+    if order_ids is not None:
+        orders = orders.filter(id__in=order_ids)
+    rows = {row['id']: row for row in orders.order_by('created_at').values(*KITCHEN_ORDER_COLUMNS)}
+    if not rows:
+        return {}
+
+    items = {order_id: [] for order_id in rows}
+    lines = OrderItem.objects.filter(order_id__in=rows).order_by('id').values('order_id', 'food_name', 'quantity')
+    for line in lines:
+        items[line['order_id']].append({'food_name': line['food_name'], 'quantity': line['quantity']})
+
+    return {
+        order_id: {
+            'id': order_id,
+            'order_number': f'ORD{order_id:06d}',
+            'status': row['status'],
+            'customer_name': row['customer_name'],
+            'delivery_address': row['delivery_address'],
+            'created_at': _timestamp.to_representation(row['created_at']),
+            'items': items[order_id],
+        }
+        for order_id, row in rows.items()
+    }
+
+
+class KitchenBoard:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.orders = {}
+        self.event_ids = {}  # order id -> id of the newest event applied to it
+        self.cursor = 0  # Event log position covered by the last load or catch-up
+        self.version = 0
+
+    def load(self):
+        with self._lock:
+            if self.loaded:
+                return
+            # Read the log position first, so events committed during the load are caught up later
+            self.cursor = OrderStatusEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            cache.add(order_event_marker_key(), self.cursor, ORDER_EVENT_MARKER_TIMEOUT)
+            self.orders = _kitchen_orders()
+            self.loaded = True
+            broker.listen(ALL_ORDERS_TOPIC, self.apply_events)
+
+    def unload(self):
+        """Stop following events and drop the board; the next load() reads it afresh"""
+        with self._lock:
+            broker.unlisten(ALL_ORDERS_TOPIC, self.apply_events)
+            self.__init__()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'orders': sorted(self.orders.values(), key=lambda order: order['created_at']),
+            }
+
+    def apply_events(self, events):
+        """Apply status events (``{'id', 'order_id', 'status', ...}``), oldest first"""
+        with self._lock:
+            if not self.loaded:
+                return
+            latest = {}
+            for event in sorted(events, key=lambda event: event['id']):
+                if event['id'] > self.event_ids.get(event['order_id'], 0):
+                    latest[event['order_id']] = event
+            if not latest:
+                return
+
+            entering = [
+                order_id for order_id, event in latest.items()
+                if event['status'] in ACTIVE_STATUSES and order_id not in self.orders
+            ]
+            # One shared read for every order new to the board, before anything changes,
+            # so a failed read leaves these events to the next catch-up
+            arrivals = _kitchen_orders(entering) if entering else {}
+
+            changes = []
+            for order_id, event in latest.items():
+                self.event_ids[order_id] = event['id']
+                if event['status'] not in ACTIVE_STATUSES:
+                    if self.orders.pop(order_id, None) is not None:
+                        changes.append({'type': 'remove', 'id': order_id})
+                elif order_id in self.orders:
+                    self.orders[order_id]['status'] = event['status']
+                    changes.append({'type': 'update', 'order': self.orders[order_id]})
+                elif order_id in arrivals:
+                    order = arrivals[order_id]
+                    order['status'] = event['status']
+                    self.orders[order_id] = order
+                    changes.append({'type': 'update', 'order': order})
+
+            for change in changes:
+                self.version += 1
+                broker.publish(KITCHEN_TOPIC, {**change, 'version': self.version})
+
+    def catch_up(self):
+        """Apply events written by other processes; reads the log only when the shared marker moved"""
+        with self._lock:
+            marker = cache.get(order_event_marker_key())
+            if marker is not None and marker <= self.cursor:
+                return
+            events = list(
+                OrderStatusEvent.objects.filter(id__gt=self.cursor).order_by('id').values('id', 'order_id', 'status')
+            )
+            if marker is None:
+                cache.add(order_event_marker_key(), events[-1]['id'] if events else self.cursor, ORDER_EVENT_MARKER_TIMEOUT)
+            if events:
+                self.cursor = events[-1]['id']
+                self.apply_events(events)
+                # Inactive orders can't come back through an older event now the cursor has passed it
+                self.event_ids = {
+                    order_id: event_id for order_id, event_id in self.event_ids.items()
+                    if order_id in self.orders or event_id > self.cursor
+                }
+
+
+board = KitchenBoard()
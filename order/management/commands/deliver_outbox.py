@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from order.utils import OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, deliver_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send queued order emails in batches over one mail connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=OUTBOX_MAX_ATTEMPTS)
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new emails instead of exiting when drained')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep between polls with --loop')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['max_attempts'] < 1:
+            raise CommandError('--batch-size and --max-attempts must be positive')
+
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_outbox(options['batch_size'], options['max_attempts'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'{total_sent} sent, {total_failed} failed...')
+            elif options['loop']:
+                time.sleep(options['interval'])
+            else:
+                break
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nOutbox drained!\n'
+                f'Emails sent: {total_sent}\n'
+                f'Failed attempts: {total_failed}'
+            )
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from order.receipts import pending_receipts, process_receipt
+
+
+class Command(BaseCommand):
+    help = 'Downsize receipts left unprocessed (by RECEIPT_PROCESSING=command, a restart or an error)'
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        for order_id in list(pending_receipts().order_by('id').values_list('id', flat=True)):
+            try:
+                process_receipt(order_id)
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'Order {order_id}: {exc}')
+            else:
+                processed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nReceipts processed!\n'
+                f'Processed: {processed}\n'
+                f'Failed: {failed}'
+            )
+        )
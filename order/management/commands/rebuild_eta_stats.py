@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from order.eta import rebuild_eta_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the delivery estimate statistics from the orders and their status history'
+
+    def handle(self, *args, **options):
+        for stat in rebuild_eta_stats():
+            average = f'{stat.avg_seconds / 60:.1f} min' if stat.avg_seconds is not None else 'default'
+            self.stdout.write(f'{stat.status}: {stat.queue_depth} waiting, {average} from {stat.samples} samples')
+
+        self.stdout.write(self.style.SUCCESS('\nDelivery estimate statistics rebuilt!'))
@@ -0,0 +1,18 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0003_cart_indexes'),
+        ('order', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='cart',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cart.cart'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_current_status(apps, schema_editor):
+    # Existing orders start their log at the status they already have
+    Order = apps.get_model('order', 'Order')
+    OrderStatusEvent = apps.get_model('order', 'OrderStatusEvent')
+    OrderStatusEvent.objects.bulk_create(
+        (OrderStatusEvent(order_id=pk, status=status, created_at=updated_at)
+         for pk, status, updated_at in Order.objects.values_list('pk', 'status', 'updated_at').iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_email_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending Payment'), ('paid', 'Payment Received'), ('confirmed', 'Order Confirmed'), ('preparing', 'Preparing'), ('ready', 'Ready for Pickup/Delivery'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('previous_status', models.CharField(blank=True, max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='order.order')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['order', 'id'], name='order_event_replay_idx')],
+            },
+        ),
+        migrations.RunPython(seed_current_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:15
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+ACTIVE_STATUSES = ('paid', 'confirmed', 'preparing')
+
+
+def seed_statistics(apps, schema_editor):
+    # Durations are learned from here on (or from history by `manage.py rebuild_eta_stats`)
+    Order = apps.get_model('order', 'Order')
+    OrderStatusEvent = apps.get_model('order', 'OrderStatusEvent')
+    OrderStatusStat = apps.get_model('order', 'OrderStatusStat')
+
+    latest_event = OrderStatusEvent.objects.filter(order=OuterRef('pk')).order_by('-id').values('created_at')[:1]
+    Order.objects.update(status_changed_at=Coalesce(Subquery(latest_event), F('updated_at')))
+
+    depths = dict(Order.objects.order_by().values_list('status').annotate(Count('id')))
+    OrderStatusStat.objects.bulk_create(
+        OrderStatusStat(
+            status=status,
+            queue_depth=depths.get(status, 0),
+            avg_queue_depth=depths.get(status, 0) if status in ACTIVE_STATUSES else 0,
+        )
+        for status, label in Order._meta.get_field('status').choices
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0006_receipt_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending Payment'), ('paid', 'Payment Received'), ('confirmed', 'Order Confirmed'), ('preparing', 'Preparing'), ('ready', 'Ready for Pickup/Delivery'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20, unique=True)),
+                ('queue_depth', models.IntegerField(default=0)),
+                ('avg_queue_depth', models.FloatField(default=0)),
+                ('avg_seconds', models.FloatField(blank=True, null=True)),
+                ('samples', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='status_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(seed_statistics, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,27 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from cart.models import Cart
 
 
+# Forward order of the kitchen workflow; a transition may skip ahead but never go back
+STATUS_FLOW = ['pending', 'paid', 'confirmed', 'preparing', 'ready', 'delivered']
+
+# Set the first time an order reaches (or skips past) the status
+STATUS_TIMESTAMPS = {'confirmed': 'confirmed_at', 'delivered': 'delivered_at'}
+
+# Orders the kitchen has to get through: shown on the kitchen board and counted as its queue
+ACTIVE_STATUSES = ('paid', 'confirmed', 'preparing')
+
+
+def milestones_reached(status):
+    """The STATUS_TIMESTAMPS fields an order at ``status`` should have set"""
+    if status not in STATUS_FLOW:
+        return []
+    reached = STATUS_FLOW[:STATUS_FLOW.index(status) + 1]
+    return [field for milestone, field in STATUS_TIMESTAMPS.items() if milestone in reached]
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending Payment'),
@@ -15,8 +34,9 @@ class Order(models.Model):
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
-    cart = models.OneToOneField(Cart, on_delete=models.CASCADE)
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE)  # Carts are reused, so one cart can place many orders
     total = models.DecimalField(max_digits=10, decimal_places=2)
+    item_count = models.PositiveIntegerField(default=0, editable=False)  # Total quantity, set at checkout
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
     # Customer details
@@ -26,7 +46,8 @@ class Order(models.Model):
     delivery_address = models.TextField(blank=True)
     
     # Payment details
-    receipt = models.ImageField(upload_to="receipts/", null=True, blank=True)
+    receipt = models.ImageField(upload_to="receipts/incoming/", null=True, blank=True)
+    receipt_thumbnail = models.CharField(max_length=100, blank=True, editable=False)  # Set once the receipt is processed
     payment_method = models.CharField(max_length=50, blank=True)
     payment_notes = models.TextField(blank=True)
     
@@ -35,13 +56,39 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     confirmed_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
+    status_changed_at = models.DateTimeField(default=timezone.now, editable=False)  # When the order reached its status
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pages of a customer's order history
+            models.Index(fields=['user', '-created_at', 'id'], name='order_user_history_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.customer_name} - {self.status}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded status so a save can tell a status change without re-reading the row
+        if 'status' in instance.__dict__:
+            instance._loaded_status = instance.status
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        # The row just read is what the next save has to compare with
+        if 'status' in self.__dict__ and (fields is None or 'status' in fields):
+            self._loaded_status = self.status
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' in update_fields:
+            # Stamps set in pre_save have to reach the same UPDATE
+            kwargs['update_fields'] = {*update_fields, *STATUS_TIMESTAMPS.values(), 'status_changed_at'}
+        super().save(*args, **kwargs)
+    
     @property
     def order_number(self):
         return f"ORD{self.id:06d}"
@@ -57,3 +104,72 @@ class OrderItem(models.Model):
     
     def __str__(self):
         return f"{self.quantity} x {self.food_name}"
+
+
+class OrderStatusEvent(models.Model):
+    """Append-only log of an order's status changes, replayed by the tracking stream"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_events')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    previous_status = models.CharField(max_length=20, blank=True)  # '' for the order being placed
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Replay of one order's events after a given id
+            models.Index(fields=['order', 'id'], name='order_event_replay_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Order #{self.order_id}: {self.previous_status or 'new'} -> {self.status}"
+
+
+class OrderStatusStat(models.Model):
+    """
+    Running figures for one status, kept current by every transition and
+    read by the delivery estimates (see order.eta)
+    """
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, unique=True)
+    queue_depth = models.IntegerField(default=0)  # Orders at this status right now
+    avg_queue_depth = models.FloatField(default=0)  # Rolling average of queue_depth, sampled at each transition
+    avg_seconds = models.FloatField(null=True, blank=True)  # Rolling average time orders spend at this status
+    samples = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.status}: {self.queue_depth} waiting"
+
+
+class EmailOutbox(models.Model):
+    """
+    An email waiting to be sent. Rows are written in the same transaction
+    as the order change they describe and sent by the deliver_outbox command.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='emails')
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Due-row scan in deliver_outbox
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
@@ -0,0 +1,215 @@
+"""
+Payment receipt uploads.
+
+Uploads stream through ReceiptUploadHandler, which refuses anything over
+RECEIPT_MAX_UPLOAD_SIZE as soon as it gets past the cap and hashes the
+bytes on the way through. Checkout stores the raw photo under
+``receipts/incoming`` and never decodes it. After the order commits, a
+background thread (or ``manage.py process_receipts``) downsizes it,
+re-encodes it as an EXIF-free JPEG with a thumbnail, and names both
+after the content hash of the upload. The same photo uploaded twice is
+stored once; the second upload is matched by hash at checkout and is
+never written.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import MultiPartParser
+from menu.images import content_hash
+from .models import Order
+
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_FIELD = 'receipt'
+RECEIPT_DIR = 'receipts'
+INCOMING_DIR = 'receipts/incoming'
+
+# Long side of the stored receipt and of its admin thumbnail
+RECEIPT_MAX_SIDE = 2000
+THUMBNAIL_MAX_SIDE = 320
+
+JPEG_OPTIONS = {'quality': 80, 'optimize': True, 'progressive': True}
+
+# Room for the other checkout fields when judging a request by its Content-Length
+FORM_OVERHEAD = 64 * 1024
+
+# Leading bytes of the formats Pillow can process
+IMAGE_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a')
+
+RECEIPT_WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=RECEIPT_WORKERS, thread_name_prefix='receipts')
+
+
+class ReceiptTooLarge(APIException):
+    status_code = 413
+    default_detail = 'The receipt is too large.'
+    default_code = 'receipt_too_large'
+
+
+def too_large_error():
+    limit = settings.RECEIPT_MAX_UPLOAD_SIZE / (1024 * 1024)
+    return ReceiptTooLarge({RECEIPT_FIELD: [f'Receipts must be {limit:g} MB or smaller.']})
+
+
+class ReceiptUploadHandler(FileUploadHandler):
+    """
+    Goes in front of Django's own handlers: counts and hashes the receipt
+    as it streams in, and skips the rest of it once it passes the cap, so
+    an oversized photo is never written to memory or disk.
+    """
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.receiving = False
+        self.size = 0
+        self.digest = None
+        self.too_large = False
+        self._hash = None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.receiving = field_name == RECEIPT_FIELD
+        if self.receiving:
+            self.size = 0
+            self._hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.receiving:
+            self.size += len(raw_data)
+            if self.size > settings.RECEIPT_MAX_UPLOAD_SIZE:
+                self.too_large = True
+                raise SkipFile
+            self._hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.receiving:
+            self.digest = self._hash.hexdigest()[:20]
+        # Let the next handler hand over the file
+        return None
+
+
+class ReceiptUploadParser(MultiPartParser):
+    """Multipart parser for checkout that enforces the receipt size cap while the body streams in"""
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        limit = settings.RECEIPT_MAX_UPLOAD_SIZE + FORM_OVERHEAD
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > limit:
+            # Refuse before reading a byte of the body
+            raise too_large_error()
+
+        handler = ReceiptUploadHandler(request._request)
+        request._request.upload_handlers = [handler, *request._request.upload_handlers]
+        parsed = super().parse(stream, media_type, parser_context)
+        if handler.too_large:
+            raise too_large_error()
+
+        receipt = parsed.files.get(RECEIPT_FIELD)
+        if receipt is not None:
+            receipt.content_hash = handler.digest
+        return parsed
+
+
+def looks_like_image(upload):
+    """Check the leading bytes only; the photo itself is decoded after checkout"""
+    upload.seek(0)
+    head = upload.read(12)
+    upload.seek(0)
+    return head.startswith(IMAGE_SIGNATURES) or (head[:4] == b'RIFF' and head[8:12] == b'WEBP')
+
+
+def receipt_names(digest):
+    return f'{RECEIPT_DIR}/{digest}.jpg', f'{RECEIPT_DIR}/{digest}-thumb.jpg'
+
+
+def stored_receipt(upload):
+    """``(receipt, thumbnail)`` names when this exact upload was processed before, else None"""
+    digest = getattr(upload, 'content_hash', None)
+    if not digest:
+        return None
+    names = receipt_names(digest)
+    if all(default_storage.exists(name) for name in names):
+        return names
+    return None
+
+
+def _save_jpeg(name, image):
+    if not default_storage.exists(name):
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', **JPEG_OPTIONS)
+        default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def pending_receipts():
+    """Orders whose receipt hasn't been processed yet"""
+    return Order.objects.exclude(receipt='').exclude(receipt__isnull=True).filter(receipt_thumbnail='')
+
+
+def process_receipt(order_id):
+    """
+    Replace the order's uploaded receipt with a downsized, EXIF-free JPEG
+    and give it a thumbnail. Returns the stored name, or None when there
+    was nothing to do.
+    """
+    order = pending_receipts().filter(pk=order_id).only('id', 'receipt').first()
+    if order is None:
+        return None
+
+    upload = order.receipt.name
+    digest = content_hash(order.receipt)
+    receipt, thumbnail = receipt_names(digest)
+    if not (default_storage.exists(receipt) and default_storage.exists(thumbnail)):
+        order.receipt.open('rb')
+        try:
+            with Image.open(order.receipt) as original:
+                # Let the JPEG decoder scale down while reading instead of decoding every pixel
+                original.draft('RGB', (RECEIPT_MAX_SIDE, RECEIPT_MAX_SIDE))
+                # Apply the camera's rotation, then drop EXIF and any alpha channel
+                image = ImageOps.exif_transpose(original).convert('RGB')
+        finally:
+            order.receipt.close()
+
+        image.thumbnail((RECEIPT_MAX_SIDE, RECEIPT_MAX_SIDE), Image.Resampling.LANCZOS)
+        _save_jpeg(receipt, image)
+        image.thumbnail((THUMBNAIL_MAX_SIDE, THUMBNAIL_MAX_SIDE), Image.Resampling.LANCZOS)
+        _save_jpeg(thumbnail, image)
+
+    # Guarded on the upload, in case the receipt was replaced meanwhile
+    updated = Order.objects.filter(pk=order_id, receipt=upload).update(receipt=receipt, receipt_thumbnail=thumbnail)
+    if updated and upload.startswith(f'{INCOMING_DIR}/'):
+        default_storage.delete(upload)
+    return receipt
+
+
+def _process_in_background(order_id):
+    close_old_connections()
+    try:
+        process_receipt(order_id)
+    except Exception:
+        # Left pending; `manage.py process_receipts` picks it up
+        logger.exception('Could not process the receipt of order %s', order_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_receipt_processing(order_id):
+    """Process a freshly uploaded receipt as RECEIPT_PROCESSING says; call after commit"""
+    mode = settings.RECEIPT_PROCESSING
+    if mode == 'thread':
+        _executor.submit(_process_in_background, order_id)
+    elif mode == 'inline':
+        process_receipt(order_id)
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from .models import Order, OrderItem
 from cart.serializers import CartSerializer
+from menu.serializers import file_url
+from .receipts import looks_like_image, stored_receipt
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -25,9 +27,110 @@ class OrderSerializer(serializers.ModelSerializer):
 
 
 class OrderCreateSerializer(serializers.ModelSerializer):
+    # A plain file: the photo is only decoded once the order has committed (see order.receipts)
+    receipt = serializers.FileField(required=False, allow_null=True)
+    
     class Meta:
         model = Order
         fields = [
             'customer_name', 'customer_phone', 'customer_email', 
             'delivery_address', 'receipt', 'payment_method', 'payment_notes'
         ]
+    
+    def validate_receipt(self, receipt):
+        if receipt is not None and not looks_like_image(receipt):
+            raise serializers.ValidationError('Upload a JPEG, PNG, GIF or WebP image.')
+        return receipt
+    
+    def validate(self, attrs):
+        stored = stored_receipt(attrs.get('receipt'))
+        if stored:
+            # Seen this exact photo before: point at the processed copy instead of storing it again
+            attrs['receipt'], attrs['receipt_thumbnail'] = stored
+        return attrs
+
+
+# values()-based equivalent of OrderSerializer for the order read endpoints
+
+ORDER_COLUMNS = (
+    'id', 'status', 'total', 'customer_name', 'customer_phone', 'customer_email',
+    'delivery_address', 'receipt', 'payment_method', 'payment_notes', 'created_at', 'updated_at'
+)
+
+ORDER_ITEM_COLUMNS = ('order_id', 'food_name', 'food_price', 'quantity', 'subtotal')
+
+_money = serializers.DecimalField(max_digits=10, decimal_places=2)
+_price = serializers.DecimalField(max_digits=8, decimal_places=2)
+_timestamp = serializers.DateTimeField()
+
+
+def _order_items(order_ids):
+    items = {order_id: [] for order_id in order_ids}
+    for item in OrderItem.objects.filter(order_id__in=items).order_by('id').values(*ORDER_ITEM_COLUMNS):
+        items[item['order_id']].append({
+            'food_name': item['food_name'],
+            'food_price': _price.to_representation(item['food_price']),
+            'quantity': item['quantity'],
+            'subtotal': _money.to_representation(item['subtotal']),
+        })
+    return items
+
+
+def _order_data(row, items, request=None):
+    return {
+        'id': row['id'],
+        'order_number': f"ORD{row['id']:06d}",
+        'status': row['status'],
+        'total': _money.to_representation(row['total']),
+        'customer_name': row['customer_name'],
+        'customer_phone': row['customer_phone'],
+        'customer_email': row['customer_email'],
+        'delivery_address': row['delivery_address'],
+        'receipt': file_url(row['receipt'], request),
+        'payment_method': row['payment_method'],
+        'payment_notes': row['payment_notes'],
+        'items': items,
+        'created_at': _timestamp.to_representation(row['created_at']),
+        'updated_at': _timestamp.to_representation(row['updated_at']),
+    }
+
+
+def serialize_orders(orders, request=None):
+    """
+    OrderSerializer(orders, many=True).data in two queries: one for the
+    orders and one for all of their items.
+    """
+    return serialize_order_rows(orders.values(*ORDER_COLUMNS), request)
+
+
+def serialize_order_rows(rows, request=None):
+    """serialize_orders for rows already fetched with ORDER_COLUMNS, e.g. one keyset page"""
+    rows = list(rows)
+    items = _order_items([row['id'] for row in rows])
+    return [_order_data(row, items[row['id']], request) for row in rows]
+
+
+# Order history headers: no item lines, just the count stored at checkout
+ORDER_SUMMARY_COLUMNS = ('id', 'status', 'total', 'item_count', 'created_at')
+
+
+def serialize_order_summaries(rows):
+    """Order headers from rows fetched with ORDER_SUMMARY_COLUMNS"""
+    return [
+        {
+            'id': row['id'],
+            'order_number': f"ORD{row['id']:06d}",
+            'status': row['status'],
+            'total': _money.to_representation(row['total']),
+            'item_count': row['item_count'],
+            'created_at': _timestamp.to_representation(row['created_at']),
+        }
+        for row in rows
+    ]
+
+
+def serialize_order(order, request=None):
+    """OrderSerializer(order).data for an already loaded order"""
+    row = {column: getattr(order, column) for column in ORDER_COLUMNS}
+    row['receipt'] = order.receipt.name
+    return _order_data(row, _order_items([order.id])[order.id], request)
@@ -1,38 +1,69 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.db import transaction
 from django.dispatch import receiver
-from .models import Order
-from .utils import send_status_update_email
-from datetime import datetime
+from django.utils import timezone
+from .eta import record_deletions
+from .models import Order, milestones_reached
+from .receipts import schedule_receipt_processing
+from .utils import record_status_events, send_status_update_email
 
 
 @receiver(pre_save, sender=Order)
 def track_status_change(sender, instance, **kwargs):
-    """Track order status changes"""
-    if instance.pk:
-        try:
-            old_instance = Order.objects.get(pk=instance.pk)
-            instance._old_status = old_instance.status
-        except Order.DoesNotExist:
-            instance._old_status = None
-    else:
+    """
+    Track order status changes and stamp the time and the milestones they
+    reach, so the timestamps go out in the save's own UPDATE
+    """
+    if not instance.pk:
         instance._old_status = None
+        return
+    
+    if hasattr(instance, '_loaded_status'):
+        instance._old_status = instance._loaded_status
+    else:
+        # Built by hand rather than loaded, so there is nothing captured to compare with
+        instance._old_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+    
+    if instance._old_status is not None and instance._old_status != instance.status:
+        now = timezone.now()
+        instance._status_entered_at = instance.status_changed_at
+        instance.status_changed_at = now
+        for field in milestones_reached(instance.status):
+            if getattr(instance, field) is None:
+                setattr(instance, field, now)
 
 
 @receiver(post_save, sender=Order)
 def handle_status_change(sender, instance, created, **kwargs):
     """Handle order status changes"""
-    if not created and hasattr(instance, '_old_status'):
-        old_status = instance._old_status
-        new_status = instance.status
-        
-        if old_status != new_status:
-            # Send status update email
-            send_status_update_email(instance, old_status, new_status)
-            
-            # Update timestamps based on status
-            if new_status == 'confirmed' and not instance.confirmed_at:
-                instance.confirmed_at = datetime.now()
-                instance.save(update_fields=['confirmed_at'])
-            elif new_status == 'delivered' and not instance.delivered_at:
-                instance.delivered_at = datetime.now()
-                instance.save(update_fields=['delivered_at'])
+    old_status = instance._old_status
+    instance._loaded_status = instance.status
+    
+    if created:
+        record_status_events([(instance, '', None)], instance.status_changed_at)
+    elif old_status is not None and old_status != instance.status:
+        record_status_events([(instance, old_status, instance._status_entered_at)], instance.status_changed_at)
+        # Send status update email
+        send_status_update_email(instance, old_status, instance.status)
+
+
+@receiver(pre_save, sender=Order)
+def track_receipt_upload(sender, instance, **kwargs):
+    """Note a newly attached receipt, which needs processing again"""
+    instance._receipt_uploaded = bool(instance.receipt) and not instance.receipt._committed
+    if instance._receipt_uploaded:
+        instance.receipt_thumbnail = ''
+
+
+@receiver(post_save, sender=Order)
+def process_receipt_upload(sender, instance, **kwargs):
+    """Downsize a new receipt once the order has committed"""
+    if instance._receipt_uploaded:
+        order_id = instance.pk
+        transaction.on_commit(lambda: schedule_receipt_processing(order_id))
+
+
+@receiver(post_delete, sender=Order)
+def release_queue_depth(sender, instance, **kwargs):
+    """A deleted order (from the admin, or with its user) leaves its status's queue"""
+    record_deletions([getattr(instance, '_loaded_status', instance.status)])
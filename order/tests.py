@@ -1,3 +1,665 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from cart.models import Cart, CartItem
+from menu.models import Category, Food
+from .kitchen import KitchenBoard
+from .eta import get_eta_stats, rebuild_eta_stats
+from .models import EmailOutbox, Order, OrderItem, OrderStatusEvent, OrderStatusStat
+from .serializers import OrderSerializer, serialize_order, serialize_orders
+from .receipts import RECEIPT_MAX_SIDE, THUMBNAIL_MAX_SIDE
+from .utils import (
+    StatusTransitionError, bulk_transition, deliver_outbox, order_event_marker_key, transition_timestamps
+)
+
+
+CUSTOMER = {'customer_name': 'Ada', 'customer_phone': '555-0100', 'customer_email': 'ada@example.com'}
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Mains')
+        Food.objects.bulk_create(
+            Food(category=category, category_name=category.name, name=f'Dish {i}',
+                 description='', price=Decimal('4.00'))
+            for i in range(40)
+        )
+        cls.foods = list(Food.objects.order_by('id'))
+        cls.user = User.objects.create_user('diner', password='secret-pass')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, lines):
+        CartItem.objects.bulk_create(
+            CartItem(cart=self.cart, food=food, quantity=2, unit_price=food.price) for food in self.foods[:lines]
+        )
+
+    def checkout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/order/api/checkout/', CUSTOMER, content_type='application/json')
+
+    def test_checkout_query_count_is_constant(self):
+        self.fill_cart(3)
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/order/api/checkout/', CUSTOMER, content_type='application/json')
+        self.fill_cart(40)
+        with self.assertNumQueries(len(small)):
+            response = self.client.post('/order/api/checkout/', CUSTOMER, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.json()['id'])
+        self.assertEqual(order.items.count(), 40)
+        self.assertEqual(order.total, Decimal('320.00'))
+
+    def test_repeat_orders_from_the_same_cart(self):
+        for _ in range(2):
+            self.fill_cart(2)
+            response = self.checkout()
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(Order.objects.filter(cart=self.cart).count(), 2)
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.total_items, self.cart.items.count()), (0, 0))
+        self.assertEqual(EmailOutbox.objects.filter(order__cart=self.cart).count(), 2)
+
+    def test_empty_cart_is_rejected(self):
+        response = self.client.post('/order/api/checkout/', CUSTOMER, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class RefusingBackend(BaseEmailBackend):
+    """Mail backend whose server rejects every message"""
+    def send_messages(self, email_messages):
+        raise SMTPException('550 mailbox unavailable')
+
+
+class CountingBackend(LocmemBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+
+class EmailOutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('diner')
+        cls.order = Order.objects.create(user=user, cart=Cart.objects.create(user=user), total=Decimal('8.00'), **CUSTOMER)
+
+    def queue(self, count):
+        for _ in range(count):
+            self.order.status = 'preparing' if self.order.status == 'confirmed' else 'confirmed'
+            self.order.save()
+
+    def test_status_change_is_queued_not_sent(self):
+        self.queue(1)
+        self.assertEqual(len(mail.outbox), 0)
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.status, email.recipients), ('pending', [CUSTOMER['customer_email']]))
+
+    @override_settings(EMAIL_BACKEND='order.tests.CountingBackend')
+    def test_batch_is_sent_over_one_connection(self):
+        self.queue(5)
+        CountingBackend.opened = 0
+        self.assertEqual(deliver_outbox(batch_size=10), (5, 0))
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(EmailOutbox.objects.exclude(status='sent').exists())
+        self.assertEqual(deliver_outbox(), (0, 0))
+
+    @override_settings(EMAIL_BACKEND='order.tests.RefusingBackend')
+    def test_failures_back_off_then_give_up(self):
+        self.queue(1)
+        email = EmailOutbox.objects.get()
+
+        self.assertEqual(deliver_outbox(max_attempts=2), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertIn('550', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=30))
+        # Not due yet
+        self.assertEqual(deliver_outbox(max_attempts=2), (0, 0))
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        deliver_outbox(max_attempts=2)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', 2))
+
+    def test_deliver_outbox_command_drains_the_queue(self):
+        self.queue(3)
+        call_command('deliver_outbox', batch_size=2, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+
+
+class BulkTransitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('diner')
+        cls.staff = User.objects.create_user('manager', is_staff=True)
+        cls.cart = Cart.objects.create(user=cls.user)
+
+    def make_orders(self, count, status='paid'):
+        orders = Order.objects.bulk_create(
+            Order(user=self.user, cart=self.cart, total=Decimal('8.00'), status=status, **CUSTOMER)
+            for _ in range(count)
+        )
+        return Order.objects.filter(pk__in=[order.pk for order in orders])
+
+    def transition_queries(self, orders, status):
+        with CaptureQueriesContext(connection) as queries:
+            bulk_transition(orders, status)
+        return len(queries)
+
+    def test_query_count_is_constant(self):
+        small = self.transition_queries(self.make_orders(3), 'confirmed')
+        orders = self.make_orders(60)
+        with self.assertNumQueries(small):
+            moved, skipped = bulk_transition(orders, 'confirmed')
+
+        self.assertEqual((len(moved), skipped), (60, []))
+        self.assertFalse(orders.filter(confirmed_at__isnull=True).exists())
+        self.assertEqual(EmailOutbox.objects.count(), 63)
+
+    def test_invalid_transitions_are_skipped(self):
+        delivered = self.make_orders(2, status='delivered')
+        paid = self.make_orders(2)
+        moved, skipped = bulk_transition(delivered | paid, 'delivered')
+
+        self.assertEqual({order.id for order in moved}, set(paid.values_list('id', flat=True)))
+        self.assertEqual(sorted(status for _, status in skipped), ['delivered', 'delivered'])
+        # Skipping ahead still stamps the milestones passed on the way
+        self.assertFalse(paid.filter(confirmed_at__isnull=True).exists())
+        self.assertFalse(paid.filter(delivered_at__isnull=True).exists())
+        with self.assertRaises(StatusTransitionError):
+            bulk_transition(paid, 'lost')
+
+    def test_orders_changed_after_the_read_are_skipped(self):
+        orders = self.make_orders(3)
+        raced = orders.first()
+
+        def cancel_meanwhile(status, now):
+            # Another writer cancels one order between the locking read and the UPDATE
+            Order.objects.filter(pk=raced.pk).update(status='cancelled')
+            return transition_timestamps(status, now)
+
+        with mock.patch('order.utils.transition_timestamps', side_effect=cancel_meanwhile):
+            moved, skipped = bulk_transition(orders, 'confirmed')
+
+        self.assertEqual(len(moved), 2)
+        self.assertNotIn(raced.pk, {order.id for order in moved})
+        self.assertEqual(skipped, [(raced.pk, 'cancelled')])
+        self.assertEqual(OrderStatusEvent.objects.filter(order_id=raced.pk, status='confirmed').count(), 0)
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+    def test_staff_api(self):
+        orders = self.make_orders(2)
+        payload = {'order_ids': [*orders.values_list('id', flat=True), 999999], 'status': 'ready'}
+
+        self.client.force_login(self.user)
+        response = self.client.post('/order/api/staff/status/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.staff)
+        data = self.client.post('/order/api/staff/status/', payload, content_type='application/json').json()
+        self.assertEqual(len(data['updated']), 2)
+        self.assertEqual(data['not_found'], [999999])
+        self.assertEqual(set(orders.values_list('status', flat=True)), {'ready'})
+
+
+class StatusChangeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('diner')
+        cls.order_id = Order.objects.create(
+            user=user, cart=Cart.objects.create(user=user), total=Decimal('8.00'), **CUSTOMER
+        ).id
+
+    def test_status_change_is_one_update(self):
+        order = Order.objects.get(pk=self.order_id)
+        order.status = 'confirmed'
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+
+        # Previously a SELECT for the old status, the UPDATE and a second UPDATE for confirmed_at
+        order_table = [query['sql'] for query in queries if '"order_order"' in query['sql']]
+        self.assertEqual(len(order_table), 1)
+        self.assertTrue(order_table[0].startswith('UPDATE'))
+        # The other statements append the status event, update the delivery estimate
+        # statistics and queue the customer email
+        self.assertEqual(len(queries), 4)
+
+        order.refresh_from_db()
+        self.assertIsNotNone(order.confirmed_at)
+        self.assertEqual(EmailOutbox.objects.filter(order=order).count(), 1)
+
+    def test_plain_saves_and_update_fields(self):
+        order = Order.objects.get(pk=self.order_id)
+        order.payment_notes = 'Paid at the counter'
+        with self.assertNumQueries(1):
+            order.save()
+        order.status = 'delivered'
+        order.save(update_fields=['status'])
+
+        order.refresh_from_db()
+        self.assertEqual(order.payment_notes, 'Paid at the counter')
+        self.assertIsNotNone(order.confirmed_at)
+        self.assertIsNotNone(order.delivered_at)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+
+    def test_save_after_refresh_records_no_transition(self):
+        order = Order.objects.get(pk=self.order_id)
+        # Moved by another writer, then re-read here
+        other = Order.objects.get(pk=self.order_id)
+        other.status = 'paid'
+        other.save()
+        order.refresh_from_db()
+
+        order.payment_notes = 'Checked'
+        order.save()
+        self.assertEqual(list(OrderStatusEvent.objects.filter(order_id=order.pk).values_list('status', flat=True)),
+                         ['pending', 'paid'])
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+        self.assertEqual(OrderStatusStat.objects.get(status='paid').queue_depth, 1)
+
+
+class OrderEventStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('diner')
+        cls.order = Order.objects.create(
+            user=cls.user, cart=Cart.objects.create(user=cls.user), total=Decimal('8.00'), **CUSTOMER
+        )
+
+    def read_stream(self, response):
+        async def consume():
+            return ''.join([chunk.decode() async for chunk in response.streaming_content])
+        return async_to_sync(consume)()
+
+    def test_every_transition_is_logged(self):
+        self.order.status = 'paid'
+        self.order.save()
+        bulk_transition(Order.objects.filter(pk=self.order.pk), 'preparing')
+
+        events = self.order.status_events.values_list('previous_status', 'status')
+        self.assertEqual(list(events), [('', 'pending'), ('pending', 'paid'), ('paid', 'preparing')])
+
+    def test_stream_replays_after_last_event_id_and_ends_on_final_status(self):
+        first = self.order.status_events.get()
+        for status in ('confirmed', 'delivered'):
+            self.order.status = status
+            self.order.save()
+
+        self.client.force_login(self.user)
+        response = self.client.get(f'/order/api/events/{self.order.id}/', HTTP_LAST_EVENT_ID=str(first.id))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = self.read_stream(response)
+
+        self.assertEqual(body.count('event: status'), 2)
+        self.assertIn('"status": "delivered"', body)
+        self.assertNotIn('"status": "pending"', body)
+
+    def test_stream_requires_the_owner(self):
+        other = User.objects.create_user('someone-else')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(f'/order/api/events/{self.order.id}/').status_code, 404)
+
+
+class KitchenBoardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('diner')
+        cls.staff = User.objects.create_user('chef', is_staff=True)
+        cls.cart = Cart.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.board = KitchenBoard()
+        self.addCleanup(self.board.unload)
+
+    def place(self, status='pending'):
+        order = Order.objects.create(user=self.user, cart=self.cart, total=Decimal('8.00'), status=status, **CUSTOMER)
+        OrderItem.objects.create(order=order, food_name='Jollof', food_price=Decimal('4.00'), quantity=2, subtotal=Decimal('8.00'))
+        return order
+
+    def move(self, order, status):
+        order.status = status
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+
+    def test_board_follows_order_writes(self):
+        cooking = self.place('preparing')
+        self.place('delivered')
+        with self.assertNumQueries(3):
+            self.board.load()
+        self.assertEqual([order['id'] for order in self.board.snapshot()['orders']], [cooking.id])
+
+        new = self.place()
+        # The save's UPDATE, status event, statistics and email, plus one read of the order
+        # and its lines for the board, shared by every screen
+        with self.assertNumQueries(6):
+            self.move(new, 'paid')
+        # Leaving the board reads nothing
+        with self.assertNumQueries(4):
+            self.move(cooking, 'ready')
+
+        snapshot = self.board.snapshot()
+        self.assertEqual([order['id'] for order in snapshot['orders']], [new.id])
+        self.assertEqual(snapshot['orders'][0]['items'], [{'food_name': 'Jollof', 'quantity': 2}])
+
+    def test_screens_read_memory(self):
+        self.place('confirmed')
+        self.board.load()
+        with self.assertNumQueries(0):
+            for screen in range(10):
+                self.board.snapshot()
+            # Nothing new in the log, so the catch-up doesn't read it
+            self.board.catch_up()
+
+    def test_catch_up_applies_events_from_other_processes(self):
+        self.board.load()
+        order = self.place()
+        # Written without running the on-commit publish, as another process would
+        order.status = 'paid'
+        order.save()
+        cache.delete(order_event_marker_key())
+        self.board.catch_up()
+        self.assertEqual([entry['id'] for entry in self.board.snapshot()['orders']], [order.id])
+
+    def test_failing_board_does_not_fail_the_write(self):
+        self.board.load()
+        order = self.place()
+        with mock.patch('order.kitchen._kitchen_orders', side_effect=DatabaseError), self.assertLogs('order.events', 'ERROR'):
+            self.move(order, 'paid')
+        self.assertEqual(self.board.snapshot()['orders'], [])
+        # The next catch-up applies the event the board missed
+        self.board.catch_up()
+        self.assertEqual([entry['id'] for entry in self.board.snapshot()['orders']], [order.id])
+
+    def test_feed_is_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/order/api/kitchen/events/').status_code, 403)
+
+
+class OrderHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('regular')
+        cart = Cart.objects.create(user=cls.user)
+        orders = Order.objects.bulk_create(
+            Order(user=cls.user, cart=cart, total=Decimal('8.00'), item_count=2, **CUSTOMER) for _ in range(25)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, food_name='Jollof', food_price=Decimal('4.00'), quantity=2, subtotal=Decimal('8.00'))
+            for order in orders
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_pages_walk_every_order_in_constant_queries(self):
+        seen = []
+        url = '/order/api/list/?page_size=10'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get(url).json()
+            # Session, user, the page of orders and its items
+            self.assertEqual(len(queries), 4)
+            seen += [order['id'] for order in data['results']]
+            url = data['next']
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(seen, list(Order.objects.order_by('-created_at', 'id').values_list('id', flat=True)))
+
+    def test_summary_has_counts_and_no_items(self):
+        data = self.client.get('/order/api/list/?summary=1&page_size=5').json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(data['results'][0]['item_count'], 2)
+        self.assertNotIn('items', data['results'][0])
+
+    def test_unpaginated_list_is_unchanged(self):
+        data = self.client.get('/order/api/list/').json()
+        self.assertEqual(len(data), 25)
+        self.assertEqual(data[0]['items'][0]['food_name'], 'Jollof')
+
+
+def phone_photo(size=(3000, 1500), orientation=6):
+    """A JPEG with camera EXIF, like a photo straight off a phone"""
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    exif = Image.Exif()
+    exif[0x0112] = orientation  # Orientation: rotate 90 degrees to display
+    exif[0x010F] = 'PhoneCam'  # Make
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=95, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@override_settings(RECEIPT_PROCESSING='inline')
+class ReceiptUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Mains')
+        cls.food = Food.objects.create(category=category, category_name=category.name, name='Jollof',
+                                       description='', price=Decimal('4.00'))
+        cls.user = User.objects.create_user('payer')
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_settings = override_settings(MEDIA_ROOT=media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.client.force_login(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def checkout(self, photo):
+        CartItem.objects.create(cart=self.cart, food=self.food, quantity=1, unit_price=self.food.price)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/order/api/checkout/', {
+                **CUSTOMER, 'receipt': SimpleUploadedFile('IMG_0001.jpg', photo, 'image/jpeg'),
+            })
+
+    def test_receipt_is_downsized_without_exif(self):
+        response = self.checkout(phone_photo())
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get(pk=response.json()['id'])
+        self.assertRegex(order.receipt.name, r'^receipts/[0-9a-f]{20}\.jpg$')
+        with default_storage.open(order.receipt.name) as stored, Image.open(stored) as image:
+            # Rotated upright from the EXIF orientation, then fitted into the size limit
+            self.assertEqual(image.size, (RECEIPT_MAX_SIDE // 2, RECEIPT_MAX_SIDE))
+            self.assertEqual(len(image.getexif()), 0)
+        with default_storage.open(order.receipt_thumbnail) as stored, Image.open(stored) as image:
+            self.assertEqual(max(image.size), THUMBNAIL_MAX_SIDE)
+        self.assertEqual(default_storage.listdir('receipts/incoming')[1], [])
+
+    def test_duplicate_upload_is_stored_once(self):
+        photo = phone_photo()
+        first = Order.objects.get(pk=self.checkout(photo).json()['id'])
+        second = Order.objects.get(pk=self.checkout(photo).json()['id'])
+
+        self.assertEqual(second.receipt.name, first.receipt.name)
+        self.assertEqual(second.receipt_thumbnail, first.receipt_thumbnail)
+        self.assertEqual(len(default_storage.listdir('receipts')[1]), 2)
+        self.assertEqual(default_storage.listdir('receipts/incoming')[1], [])
+
+    @override_settings(RECEIPT_MAX_UPLOAD_SIZE=1000)
+    def test_oversized_request_is_refused_unread(self):
+        response = self.checkout(phone_photo())
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(RECEIPT_MAX_UPLOAD_SIZE=250 * 1024)
+    def test_oversized_receipt_is_cut_off_while_streaming(self):
+        # Small enough to pass the Content-Length check, so the upload handler has to stop it
+        photo = phone_photo()
+        self.assertGreater(len(photo), 250 * 1024)
+        response = self.checkout(photo)
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('receipt', response.json())
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(default_storage.exists('receipts'))
+
+    def test_non_image_is_rejected(self):
+        response = self.checkout(b'%PDF-1.7 not a photo')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('receipt', response.json())
+
+    @override_settings(RECEIPT_PROCESSING='command')
+    def test_command_processes_leftovers(self):
+        order = Order.objects.get(pk=self.checkout(phone_photo()).json()['id'])
+        self.assertTrue(order.receipt.name.startswith('receipts/incoming/'))
+        self.assertEqual(order.receipt_thumbnail, '')
+
+        call_command('process_receipts', stdout=StringIO())
+        order.refresh_from_db()
+        self.assertRegex(order.receipt.name, r'^receipts/[0-9a-f]{20}\.jpg$')
+        self.assertTrue(default_storage.exists(order.receipt_thumbnail))
+
+
+class DeliveryEstimateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('hungry')
+        cls.cart = Cart.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def place(self, minutes_ago=0):
+        order = Order.objects.create(user=self.user, cart=self.cart, total=Decimal('8.00'), **CUSTOMER)
+        if minutes_ago:
+            entered = timezone.now() - timedelta(minutes=minutes_ago)
+            Order.objects.filter(pk=order.pk).update(status_changed_at=entered)
+            order.status_changed_at = entered
+        return order
+
+    def estimate(self, order):
+        data = self.client.get(f'/order/api/status/{order.id}/').json()
+        return datetime.fromisoformat(data['estimated_delivery'])
+
+    def stat(self, status):
+        return OrderStatusStat.objects.get(status=status)
+
+    def test_without_history_the_fixed_estimates_apply(self):
+        order = self.place()
+        self.assertEqual(self.estimate(order), order.status_changed_at + timedelta(minutes=45))
+
+    def test_estimate_reads_no_order_history(self):
+        order = self.place()
+        self.estimate(order)
+        with CaptureQueriesContext(connection) as queries:
+            self.estimate(order)
+        # Session, user, the order and its items; the statistics come from the cache
+        self.assertEqual(len(queries), 4)
+
+    def test_transitions_update_the_statistics(self):
+        order = self.place(minutes_ago=8)
+        order.status = 'paid'
+        order.save()
+
+        pending, paid = self.stat('pending'), self.stat('paid')
+        self.assertEqual((pending.queue_depth, paid.queue_depth), (0, 1))
+        self.assertEqual(pending.samples, 1)
+        self.assertAlmostEqual(pending.avg_seconds, 8 * 60, delta=5)
+
+        # A skip ahead doesn't time the status it skipped from
+        order.status = 'ready'
+        order.save()
+        self.assertEqual(self.stat('paid').samples, 0)
+        self.assertEqual(self.stat('ready').queue_depth, 1)
+
+    def test_busy_kitchen_stretches_the_estimate(self):
+        quiet = self.place()
+        bulk_transition(Order.objects.filter(pk=quiet.pk), 'paid')
+        quiet.refresh_from_db()
+        quiet_estimate = self.estimate(quiet)
+
+        for _ in range(8):
+            self.place()
+        bulk_transition(Order.objects.filter(status='pending'), 'paid')
+        cache.clear()
+        self.assertGreater(get_eta_stats()['load'], 1)
+        self.assertGreater(self.estimate(quiet), quiet_estimate)
+
+    def test_deleted_orders_leave_the_queue(self):
+        self.place()
+        self.place().delete()
+        paid = self.place()
+        paid.status = 'paid'
+        paid.save()
+        # Deleting a user takes their orders with it
+        other = User.objects.create_user('gone')
+        Order.objects.create(user=other, cart=Cart.objects.create(user=other), total=Decimal('8.00'), **CUSTOMER)
+        other.delete()
+
+        self.assertEqual((self.stat('pending').queue_depth, self.stat('paid').queue_depth), (1, 1))
+        incremental = {stat.status: stat.queue_depth for stat in OrderStatusStat.objects.all()}
+        self.assertEqual({stat.status: stat.queue_depth for stat in rebuild_eta_stats()}, incremental)
+
+    def test_rebuild_matches_incremental_statistics(self):
+        order = self.place(minutes_ago=8)
+        order.status = 'paid'
+        order.save()
+        incremental = {stat.status: (stat.queue_depth, stat.samples) for stat in OrderStatusStat.objects.all()}
+
+        rebuilt = {stat.status: (stat.queue_depth, stat.samples) for stat in rebuild_eta_stats()}
+        self.assertEqual(rebuilt, incremental)
+
+
+class OrderSerializerParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('diner')
+        for i, receipt in enumerate(['receipts/paid.jpg', '']):
+            order = Order.objects.create(user=cls.user, cart=Cart.objects.create(user=cls.user),
+                                         total=Decimal('11.50'), delivery_address=f'{i} Marina', **CUSTOMER)
+            Order.objects.filter(pk=order.pk).update(receipt=receipt)
+            OrderItem.objects.create(order=order, food_name='Jollof', food_price=Decimal('4.00'),
+                                     quantity=2, subtotal=Decimal('8.00'))
+            OrderItem.objects.create(order=order, food_name='Suya', food_price=Decimal('3.50'),
+                                     quantity=1, subtotal=Decimal('3.50'))
+        Order.objects.create(user=cls.user, cart=Cart.objects.create(user=cls.user), total=Decimal('0.00'),
+                             **CUSTOMER)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_orders_match_the_serializer(self):
+        orders = Order.objects.filter(user=self.user)
+        request = RequestFactory().get('/order/api/orders/')
+        for context in ({}, {'request': request}):
+            with self.subTest(request='request' in context):
+                fast = serialize_orders(orders, context.get('request'))
+                self.assertEqual(fast, OrderSerializer(orders, many=True, context=context).data)
+                self.assertEqual([len(order['items']) for order in fast], [0, 2, 2])
+
+    def test_single_order_matches_the_serializer(self):
+        order = Order.objects.filter(user=self.user).exclude(receipt='').get()
+        request = RequestFactory().get(f'/order/api/orders/{order.pk}/')
+        self.assertEqual(serialize_order(order, request), OrderSerializer(order, context={'request': request}).data)
@@ -8,10 +8,14 @@ urlpatterns = [
     path('api/checkout/', views.checkout, name='api_checkout'),
     path('api/status/<int:order_id>/', views.order_status, name='api_order_status'),
     path('api/list/', views.user_orders, name='api_user_orders'),
+    path('api/events/<int:order_id>/', views.order_events, name='api_order_events'),
     path('api/cancel/<int:order_id>/', views.cancel_order, name='api_cancel_order'),
+    path('api/staff/status/', views.bulk_update_status, name='api_bulk_update_status'),
+    path('api/kitchen/events/', views.kitchen_events, name='api_kitchen_events'),
     
     # Template views
     path('checkout/', views.checkout_page, name='checkout'),
     path('tracking/<int:order_id>/', views.order_tracking_page, name='tracking'),
     path('orders/', views.orders_page, name='orders'),
+    path('kitchen/', views.kitchen_page, name='kitchen'),
 ]
@@ -1,129 +1,402 @@
-from django.core.mail import send_mail
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
 from django.template.loader import render_to_string
-from .models import Order
+from django.utils import timezone
+from rest_framework import serializers
+from .eta import estimate_delivery, record_transitions
+from .events import broker
+from .models import STATUS_FLOW, EmailOutbox, Order, OrderItem, OrderStatusEvent, milestones_reached
+from cart.models import Cart
+from cart.utils import clear_cart
 
 
-def send_order_confirmation_email(order):
-    """Send order confirmation email to customer"""
-    try:
-        subject = f'Order Confirmation - #{order.order_number}'
-        
-        # Create email content
-        context = {
-            'order': order,
-            'items': order.items.all(),
-        }
-        
-        message = f"""
-        Dear {order.customer_name},
-        
-        Thank you for your order! Here are the details:
-        
-        Order Number: #{order.order_number}
-        Total: ${order.total}
-        Status: {order.get_status_display()}
-        
-        Items:
-        """
-        
-        for item in order.items.all():
-            message += f"- {item.quantity}x {item.food_name} - ${item.subtotal}\n"
-        
-        message += f"""
-        
-        Customer Details:
-        Name: {order.customer_name}
-        Phone: {order.customer_phone}
-        Email: {order.customer_email}
-        """
-        
-        if order.delivery_address:
-            message += f"Delivery Address: {order.delivery_address}\n"
-        
-        message += """
-        
-        You can track your order status at any time by visiting our website.
-        
-        Thank you for choosing our restaurant!
-        
-        Best regards,
-        Restaurant Team
-        """
-        
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [order.customer_email],
-            fail_silently=True,
+logger = logging.getLogger(__name__)
+
+
+class EmptyCartError(Exception):
+    pass
+
+
+def place_order(serializer, user, cart):
+    """
+    Turn ``cart`` into an order in one transaction, using the same handful
+    of statements whatever the cart size: lock the cart, snapshot its lines
+    and current menu prices in one joined query, insert the order, bulk
+    insert its items, empty the cart and queue the confirmation email.
+    ``serializer`` is a validated OrderCreateSerializer; raises
+    EmptyCartError when there is nothing to order.
+    """
+    with transaction.atomic():
+        # Serializes concurrent checkouts of the same cart (a no-op on SQLite, whose writes are serialized anyway)
+        cart = Cart.objects.select_for_update().get(pk=cart.pk)
+        lines = list(
+            cart.items.order_by('id').values_list('food__name', 'food__price', 'quantity')
         )
+        if not lines:
+            raise EmptyCartError
         
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+        order = serializer.save(
+            user=user,
+            cart=cart,
+            total=sum(price * quantity for name, price, quantity in lines),
+            item_count=sum(quantity for name, price, quantity in lines)
+        )
+        items = OrderItem.objects.bulk_create(
+            OrderItem(order=order, food_name=name, food_price=price, quantity=quantity, subtotal=price * quantity)
+            for name, price, quantity in lines
+        )
+        clear_cart(cart)
+        # Committed with the order, so the email can't be lost or sent for a rolled back order
+        send_order_confirmation_email(order, items)
+    return order
+
+
+def outbox_email(order, subject, message):
+    """An unsaved outbox row addressed to the order's customer"""
+    return EmailOutbox(
+        order=order,
+        subject=subject,
+        body=message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipients=[order.customer_email],
+    )
+
+
+def queue_email(order, subject, message):
+    """Add an email to the outbox; it is sent by deliver_outbox once the caller's transaction commits"""
+    email = outbox_email(order, subject, message)
+    email.save()
+    return email
+
+
+def send_order_confirmation_email(order, items=None):
+    """Queue the order confirmation email; ``items`` saves a query when the caller has them"""
+    if items is None:
+        items = order.items.all()
+    
+    subject = f'Order Confirmation - #{order.order_number}'
+    
+    message = f"""
+    Dear {order.customer_name},
+    
+    Thank you for your order! Here are the details:
+    
+    Order Number: #{order.order_number}
+    Total: ${order.total}
+    Status: {order.get_status_display()}
+    
+    Items:
+    """
+    
+    for item in items:
+        message += f"- {item.quantity}x {item.food_name} - ${item.subtotal}\n"
+    
+    message += f"""
+    
+    Customer Details:
+    Name: {order.customer_name}
+    Phone: {order.customer_phone}
+    Email: {order.customer_email}
+    """
+    
+    if order.delivery_address:
+        message += f"Delivery Address: {order.delivery_address}\n"
+    
+    message += """
+    
+    You can track your order status at any time by visiting our website.
+    
+    Thank you for choosing our restaurant!
+    
+    Best regards,
+    Restaurant Team
+    """
+    
+    return queue_email(order, subject, message)
+
+
+STATUS_MESSAGES = {
+    'paid': 'Your payment has been received and confirmed.',
+    'confirmed': 'Your order has been confirmed and is being prepared.',
+    'preparing': 'Your order is currently being prepared by our kitchen.',
+    'ready': 'Your order is ready for pickup/delivery!',
+    'delivered': 'Your order has been delivered. Enjoy your meal!',
+    'cancelled': 'Your order has been cancelled. Please contact us if you have any questions.'
+}
+
+
+def status_update_email(order, new_status):
+    """Unsaved outbox row telling the customer their order moved to ``new_status``"""
+    subject = f'Order Update - #{order.order_number}'
+    message = f"""
+    Dear {order.customer_name},
+    
+    Your order #{order.order_number} status has been updated.
+    
+    New Status: {order.get_status_display()}
+    {STATUS_MESSAGES.get(new_status, '')}
+    
+    You can track your order at any time by visiting our website.
+    
+    Thank you!
+    Restaurant Team
+    """
+    
+    return outbox_email(order, subject, message)
 
 
 def send_status_update_email(order, old_status, new_status):
-    """Send email when order status changes"""
-    try:
-        status_messages = {
-            'paid': 'Your payment has been received and confirmed.',
-            'confirmed': 'Your order has been confirmed and is being prepared.',
-            'preparing': 'Your order is currently being prepared by our kitchen.',
-            'ready': 'Your order is ready for pickup/delivery!',
-            'delivered': 'Your order has been delivered. Enjoy your meal!',
-            'cancelled': 'Your order has been cancelled. Please contact us if you have any questions.'
-        }
-        
-        subject = f'Order Update - #{order.order_number}'
-        message = f"""
-        Dear {order.customer_name},
-        
-        Your order #{order.order_number} status has been updated.
-        
-        New Status: {order.get_status_display()}
-        {status_messages.get(new_status, '')}
-        
-        You can track your order at any time by visiting our website.
-        
-        Thank you!
-        Restaurant Team
-        """
-        
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [order.customer_email],
-            fail_silently=True,
+    """Queue the email telling the customer their order status changed"""
+    email = status_update_email(order, new_status)
+    email.save()
+    return email
+
+
+EVENT_COLUMNS = ('id', 'status', 'previous_status', 'created_at')
+
+ORDER_EVENT_MARKER_TIMEOUT = 60 * 60 * 24
+
+_event_time = serializers.DateTimeField()
+
+
+ALL_ORDERS_TOPIC = 'order_events'
+
+
+def order_event_marker_key(order_id=None):
+    """Cache key holding the id of an order's (or any order's) latest status event, shared by every process"""
+    if order_id is None:
+        return 'order_events_last'
+    return f'order_events_last_{order_id}'
+
+
+def status_event_data(row, order):
+    """Tracking stream payload for an event row (EVENT_COLUMNS) of ``order``"""
+    estimated = estimate_delivery(row['status'], row['created_at'])
+    return {
+        'id': row['id'],
+        'order_id': order.id,
+        'status': row['status'],
+        'status_display': dict(Order.STATUS_CHOICES).get(row['status'], row['status']),
+        'previous_status': row['previous_status'],
+        'created_at': _event_time.to_representation(row['created_at']),
+        'estimated_delivery': estimated.isoformat() if estimated else None,
+    }
+
+
+def record_status_events(changes, now=None):
+    """
+    Append one OrderStatusEvent per ``(order, previous_status, entered_at)``
+    in a single INSERT, fold the changes into the delivery estimate
+    statistics, then publish the events to open tracking streams once the
+    transaction commits. ``previous_status`` is '' for a newly placed order;
+    ``entered_at`` is when the order reached ``previous_status``, if known.
+    """
+    now = now or timezone.now()
+    events = OrderStatusEvent.objects.bulk_create(
+        OrderStatusEvent(order=order, status=order.status, previous_status=previous or '', created_at=now)
+        for order, previous, entered_at in changes
+    )
+    record_transitions(changes, now)
+    messages = [
+        (order.id, status_event_data({column: getattr(event, column) for column in EVENT_COLUMNS}, order))
+        for event, (order, previous, entered_at) in zip(events, changes)
+    ]
+    transaction.on_commit(lambda: publish_status_events(messages))
+    return events
+
+
+def publish_status_events(messages):
+    markers = {order_event_marker_key(order_id): data['id'] for order_id, data in messages}
+    markers[order_event_marker_key()] = max(data['id'] for order_id, data in messages)
+    cache.set_many(markers, ORDER_EVENT_MARKER_TIMEOUT)
+    for order_id, data in messages:
+        broker.publish(f'order_{order_id}', data)
+    # One message per commit for whole-restaurant views such as the kitchen board
+    broker.publish(ALL_ORDERS_TOPIC, [data for order_id, data in messages])
+
+
+# Sent once per bulk_transition call with ``orders`` (moved, with their new
+# status), ``old_statuses`` ({order id: previous status}) and ``status``
+orders_transitioned = Signal()
+
+
+class StatusTransitionError(Exception):
+    pass
+
+
+def can_transition(old_status, new_status):
+    """Staff may move an order forward through STATUS_FLOW, or cancel it until it is delivered"""
+    if new_status == 'cancelled':
+        return old_status not in ('delivered', 'cancelled')
+    if old_status not in STATUS_FLOW or new_status not in STATUS_FLOW:
+        return False
+    return STATUS_FLOW.index(new_status) > STATUS_FLOW.index(old_status)
+
+
+def transition_timestamps(new_status, now):
+    """Field updates that stamp every milestone reached by ``new_status``, keeping earlier stamps"""
+    return {field: Coalesce(F(field), Value(now)) for field in milestones_reached(new_status)}
+
+
+def bulk_transition(orders, new_status):
+    """
+    Move every order in the ``orders`` queryset that may go to ``new_status``
+    there, in a fixed number of statements whatever the batch size: one
+    locking read, one UPDATE (status, milestone timestamps and updated_at),
+    one multi-row insert each for the status events and the customer
+    emails, one UPDATE of the delivery estimate statistics, then one
+    orders_transitioned signal for the batch. Returns ``(moved, skipped)``:
+    the orders the UPDATE actually moved, and ``(id, status)`` pairs for
+    the rest, including any whose status changed after they were read.
+    """
+    if new_status not in dict(Order.STATUS_CHOICES):
+        raise StatusTransitionError(f'Unknown status: {new_status}')
+    
+    with transaction.atomic():
+        candidates = list(
+            orders.select_for_update().order_by('id').only(
+                'id', 'status', 'customer_name', 'customer_email', 'created_at', 'status_changed_at'
+            )
         )
+        moved = [order for order in candidates if can_transition(order.status, new_status)]
+        skipped = [(order.id, order.status) for order in candidates if not can_transition(order.status, new_status)]
+        if not moved:
+            return moved, skipped
         
-        return True
-    except Exception as e:
-        print(f"Error sending status update email: {e}")
-        return False
+        now = timezone.now()
+        old_statuses = {order.id: order.status for order in moved}
+        # Each row is only updated from the status it was read at, which keeps the
+        # UPDATE legal and the events right even on backends that ignore the row locks
+        by_status = defaultdict(list)
+        for order in moved:
+            by_status[order.status].append(order.id)
+        guard = Q()
+        for status, ids in by_status.items():
+            guard |= Q(pk__in=ids, status=status)
+        updated = Order.objects.filter(guard).update(
+            status=new_status, status_changed_at=now, updated_at=now, **transition_timestamps(new_status, now)
+        )
+        if updated != len(moved):
+            # Some orders changed status since the read; only the rows written here are reported moved
+            current = {
+                order_id: (status, changed_at)
+                for order_id, status, changed_at in Order.objects.filter(pk__in=old_statuses).values_list(
+                    'id', 'status', 'status_changed_at'
+                )
+            }
+            written = {order_id for order_id, state in current.items() if state == (new_status, now)}
+            skipped += [
+                (order.id, current[order.id][0]) for order in moved
+                if order.id in current and order.id not in written
+            ]
+            skipped.sort()
+            moved = [order for order in moved if order.id in written]
+            old_statuses = {order.id: old_statuses[order.id] for order in moved}
+            if not moved:
+                return moved, skipped
+        entered = {order.id: order.status_changed_at for order in moved}
+        for order in moved:
+            order.status = new_status
+            order.status_changed_at = now
+        record_status_events([(order, old_statuses[order.id], entered[order.id]) for order in moved], now)
+        EmailOutbox.objects.bulk_create(status_update_email(order, new_status) for order in moved)
+        orders_transitioned.send(sender=Order, orders=moved, old_statuses=old_statuses, status=new_status)
+    
+    return moved, skipped
 
 
-def calculate_estimated_delivery_time(order):
-    """Calculate estimated delivery time based on order status"""
-    from datetime import datetime, timedelta
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_RETRY_DELAY = 60  # Seconds before the first retry; doubles on each failure
+OUTBOX_MAX_RETRY_DELAY = 60 * 60
+OUTBOX_LEASE = 5 * 60  # Claimed rows are hidden from other workers this long
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), OUTBOX_MAX_RETRY_DELAY))
+
+
+def _claim_outbox_batch(batch_size):
+    """
+    Take up to ``batch_size`` due emails and push their next attempt past
+    the lease, so a second worker (or a crashed one) doesn't send them twice
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if batch:
+            EmailOutbox.objects.filter(pk__in=[email.pk for email in batch]).update(
+                next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE)
+            )
+    return batch
+
+
+def deliver_outbox(batch_size=OUTBOX_BATCH_SIZE, max_attempts=OUTBOX_MAX_ATTEMPTS, connection=None):
+    """
+    Send one batch of due outbox emails over a single backend connection.
+    Failed emails are retried with exponential backoff and marked failed
+    after ``max_attempts``. Returns ``(sent, failed)`` for the batch.
+    """
+    batch = _claim_outbox_batch(batch_size)
+    if not batch:
+        return 0, 0
     
-    base_time = order.created_at
-    
-    if order.status == 'pending':
-        return base_time + timedelta(minutes=45)
-    elif order.status == 'paid':
-        return base_time + timedelta(minutes=40)
-    elif order.status == 'confirmed':
-        return base_time + timedelta(minutes=35)
-    elif order.status == 'preparing':
-        return base_time + timedelta(minutes=20)
-    elif order.status == 'ready':
-        return base_time + timedelta(minutes=10)
+    connection = connection or get_connection()
+    errors = {}
+    try:
+        connection.open()
+    except Exception as e:
+        errors = {email.pk: e for email in batch}
     else:
-        return None
+        try:
+            for email in batch:
+                message = EmailMessage(
+                    email.subject, email.body, email.from_email, email.recipients, connection=connection
+                )
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    errors[email.pk] = e
+        finally:
+            connection.close()
+    
+    now = timezone.now()
+    sent_ids = [email.pk for email in batch if email.pk not in errors]
+    if sent_ids:
+        EmailOutbox.objects.filter(pk__in=sent_ids).update(
+            status='sent', sent_at=now, attempts=F('attempts') + 1, last_error=''
+        )
+    
+    failed = [email for email in batch if email.pk in errors]
+    for email in failed:
+        email.attempts += 1
+        email.last_error = f'{type(errors[email.pk]).__name__}: {errors[email.pk]}'
+        if email.attempts >= max_attempts:
+            email.status = 'failed'
+        else:
+            email.next_attempt_at = now + _retry_delay(email.attempts)
+        logger.warning('Email %s to %s failed (attempt %s): %s', email.pk, email.recipients, email.attempts, email.last_error)
+    EmailOutbox.objects.bulk_update(failed, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+    
+    return len(sent_ids), len(failed)
+
+
+def calculate_estimated_delivery_time(order):
+    """Calculate estimated delivery time from the order's status and the kitchen's recent pace"""
+    return estimate_delivery(order.status, order.status_changed_at, timezone.now())
 
 
 def get_order_statistics():
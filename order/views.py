@@ -1,51 +1,47 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from rest_framework import generics, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.parsers import FormParser, JSONParser
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from .models import Order, OrderItem
-from .serializers import OrderSerializer, OrderCreateSerializer
-from .utils import send_order_confirmation_email, calculate_estimated_delivery_time
-from cart.models import Cart
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from .events import broker, sse_message
+from .kitchen import KITCHEN_TOPIC, board as kitchen_board
+from .models import Order, OrderStatusEvent
+from .receipts import ReceiptUploadParser
+from .serializers import (
+    ORDER_COLUMNS, ORDER_SUMMARY_COLUMNS, OrderSerializer, OrderCreateSerializer, serialize_order,
+    serialize_order_rows, serialize_order_summaries
+)
+from .utils import (
+    EVENT_COLUMNS, ORDER_EVENT_MARKER_TIMEOUT, EmptyCartError, StatusTransitionError, bulk_transition,
+    calculate_estimated_delivery_time, order_event_marker_key, place_order, status_event_data
+)
 from cart.views import get_or_create_cart
+from restaurant_site.pagination import KeysetPagination
 
 
 @api_view(['POST'])
+@parser_classes([JSONParser, FormParser, ReceiptUploadParser])
 def checkout(request):
     if not request.user.is_authenticated:
         return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
     
     cart = get_or_create_cart(request)
-    if not cart.items.exists():
-        return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
     
     serializer = OrderCreateSerializer(data=request.data)
     if serializer.is_valid():
-        # Create order
-        order = serializer.save(
-            user=request.user,
-            cart=cart,
-            total=cart.total_price
-        )
-        
-        # Create order items (snapshot of cart items)
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                food_name=cart_item.food.name,
-                food_price=cart_item.food.price,
-                quantity=cart_item.quantity,
-                subtotal=cart_item.subtotal
-            )
-        
-        # Send confirmation email
-        send_order_confirmation_email(order)
+        try:
+            order = place_order(serializer, request.user, cart)
+        except EmptyCartError:
+            return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Clear cart after order creation
-        cart.items.all().delete()
-        
-        order_serializer = OrderSerializer(order)
-        return Response(order_serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serialize_order(order), status=status.HTTP_201_CREATED)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -57,10 +53,9 @@ def order_status(request, order_id):
     
     try:
         order = Order.objects.get(id=order_id, user=request.user)
-        serializer = OrderSerializer(order)
+        data = serialize_order(order)
         
         # Add estimated delivery time
-        data = serializer.data
         estimated_time = calculate_estimated_delivery_time(order)
         if estimated_time:
             data['estimated_delivery'] = estimated_time.isoformat()
@@ -70,14 +65,33 @@ def order_status(request, order_id):
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+class OrderHistoryPagination(KeysetPagination):
+    # Newest first; backed by the index on Order(user, -created_at, id)
+    ordering = ('-created_at', 'id')
+    page_size = 20
+    max_page_size = 100
+
+
 @api_view(['GET'])
 def user_orders(request):
+    """
+    The user's orders, newest first. ``?page_size=`` switches to keyset
+    pages (``{"next": <url>, "results": [...]}``); ``?summary=1`` returns
+    headers with an ``item_count`` instead of the item lines.
+    """
     if not request.user.is_authenticated:
         return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
     
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    orders = Order.objects.filter(user=request.user)
+    summary = request.query_params.get('summary') in ('1', 'true')
+    columns = ORDER_SUMMARY_COLUMNS if summary else ORDER_COLUMNS
+    serialize = serialize_order_summaries if summary else serialize_order_rows
+    
+    paginator = OrderHistoryPagination()
+    page = paginator.paginate_queryset(orders.values(*columns), request)
+    if page is None:
+        return Response(serialize(orders.order_by(*paginator.ordering).values(*columns)))
+    return paginator.get_paginated_response(serialize(page))
 
 
 @api_view(['POST'])
@@ -103,6 +117,162 @@ def cancel_order(request, order_id):
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def bulk_update_status(request):
+    """
+    Staff only: move several orders to one status,
+    ``{"order_ids": [12, 13], "status": "ready"}``. Orders that can't make
+    that transition are left alone and listed under ``skipped``.
+    """
+    order_ids = request.data.get('order_ids')
+    if not isinstance(order_ids, list) or not order_ids:
+        return Response({'error': 'order_ids must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        order_ids = [int(order_id) for order_id in order_ids]
+    except (TypeError, ValueError):
+        return Response({'error': 'order_ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        moved, skipped = bulk_transition(Order.objects.filter(id__in=order_ids), request.data.get('status'))
+    except StatusTransitionError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    found = {order.id for order in moved} | {order_id for order_id, _ in skipped}
+    return Response({
+        'updated': [order.id for order in moved],
+        'skipped': [{'id': order_id, 'status': order_status} for order_id, order_status in skipped],
+        'not_found': [order_id for order_id in order_ids if order_id not in found],
+    })
+
+
+ORDER_STREAM_LIFETIME = 15 * 60  # Seconds before the browser is asked to reconnect
+ORDER_STREAM_CATCH_UP = 30  # Seconds between checks for events published by other processes
+ORDER_STREAM_RETRY_MS = 5000
+FINAL_STATUSES = ('delivered', 'cancelled')
+
+
+async def _replay_events(order, after):
+    events = OrderStatusEvent.objects.filter(order_id=order.id, id__gt=after).order_by('id').values(*EVENT_COLUMNS)
+    return [status_event_data(row, order) async for row in events]
+
+
+async def _latest_event(order):
+    row = await OrderStatusEvent.objects.filter(order_id=order.id).order_by('-id').values(*EVENT_COLUMNS).afirst()
+    return [status_event_data(row, order)] if row else []
+
+
+async def _order_event_stream(order, after):
+    topic = f'order_{order.id}'
+    subscription = broker.subscribe(topic)
+    loop, queue = subscription
+    marker_key = order_event_marker_key(order.id)
+    try:
+        yield f'retry: {ORDER_STREAM_RETRY_MS}\n\n'
+        events = await (_latest_event(order) if after is None else _replay_events(order, after))
+        last_id = after or 0
+        deadline = loop.time() + ORDER_STREAM_LIFETIME
+        
+        while True:
+            for data in events:
+                if data['id'] <= last_id:
+                    continue
+                last_id = data['id']
+                yield sse_message(data, event='status', event_id=data['id'])
+                if data['status'] in FINAL_STATUSES:
+                    return
+            
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                events = [await asyncio.wait_for(queue.get(), timeout=min(ORDER_STREAM_CATCH_UP, remaining))]
+            except asyncio.TimeoutError:
+                # Nothing published here; only read the log if the shared marker moved
+                marker = await cache.aget(marker_key)
+                events = await _replay_events(order, last_id) if marker is None or marker > last_id else []
+                if marker is None:
+                    await cache.aadd(marker_key, events[-1]['id'] if events else last_id, ORDER_EVENT_MARKER_TIMEOUT)
+                if not events:
+                    yield ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(topic, subscription)
+
+
+async def order_events(request, order_id):
+    """
+    Server-Sent Events stream of an order's status changes for the tracking
+    page. A fresh connection gets the latest event, a reconnect everything
+    after its Last-Event-ID (or ``?after=``); after that only new events are
+    pushed, so an open tab is an idle coroutine rather than a poller. Needs
+    an ASGI server (restaurant_site.asgi) to hold many streams at once.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+    try:
+        order = await Order.objects.only('id', 'created_at').aget(id=order_id, user=user)
+    except Order.DoesNotExist:
+        return JsonResponse({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.GET.get('after'))
+    except (TypeError, ValueError):
+        after = None
+    
+    response = StreamingHttpResponse(_order_event_stream(order, after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let a proxy buffer the stream
+    return response
+
+
+KITCHEN_STREAM_LIFETIME = 60 * 60
+
+
+async def _kitchen_stream(board):
+    subscription = broker.subscribe(KITCHEN_TOPIC)
+    loop, queue = subscription
+    try:
+        yield f'retry: {ORDER_STREAM_RETRY_MS}\n\n'
+        # Subscribed first, so a change between the snapshot and the first read is delivered twice rather than lost
+        snapshot = board.snapshot()
+        yield sse_message(snapshot, event='snapshot', event_id=snapshot['version'])
+        deadline = loop.time() + KITCHEN_STREAM_LIFETIME
+        
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                change = await asyncio.wait_for(queue.get(), timeout=min(ORDER_STREAM_CATCH_UP, remaining))
+            except asyncio.TimeoutError:
+                await sync_to_async(board.catch_up)()
+                if queue.empty():
+                    yield ': keepalive\n\n'
+                continue
+            yield sse_message(change, event=change['type'], event_id=change['version'])
+    finally:
+        broker.unsubscribe(KITCHEN_TOPIC, subscription)
+
+
+async def kitchen_events(request):
+    """
+    Staff only: Server-Sent Events feed for kitchen screens. Sends the
+    active orders as a ``snapshot`` event, then ``update``/``remove`` events
+    as orders move. Every screen in a process reads the same in-memory
+    board (order.kitchen), so adding screens adds no database queries.
+    """
+    user = await request.auser()
+    if not user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=status.HTTP_403_FORBIDDEN)
+    
+    await sync_to_async(kitchen_board.load)()
+    response = StreamingHttpResponse(_kitchen_stream(kitchen_board), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # Template views
 def checkout_page(request):
     return render(request, 'order/checkout.html')
@@ -115,3 +285,8 @@ def order_tracking_page(request, order_id):
 
 def orders_page(request):
     return render(request, 'order/orders.html')
+
+
+@staff_member_required
+def kitchen_page(request):
+    return render(request, 'order/kitchen.html')
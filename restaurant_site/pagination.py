@@ -0,0 +1,152 @@
+import base64
+import binascii
+import datetime
+import json
+import operator
+from functools import reduce
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder rounds to milliseconds, which would skip rows on a datetime key
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, model, ordering):
+    """Turn a cursor back into typed values for the ``ordering`` fields"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidCursor(cursor)
+
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor(cursor)
+
+    try:
+        return [
+            model._meta.get_field(name.lstrip('-')).to_python(value)
+            for name, value in zip(ordering, values)
+        ]
+    except Exception:
+        raise InvalidCursor(cursor)
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the "rows after ``values``" condition for a composite sort key,
+    e.g. (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z).
+    """
+    clauses = []
+    for index, name in enumerate(ordering):
+        field = name.lstrip('-')
+        lookup = 'lt' if name.startswith('-') else 'gt'
+        equal = {o.lstrip('-'): v for o, v in zip(ordering[:index], values[:index])}
+        clauses.append(Q(**equal, **{f'{field}__{lookup}': values[index]}))
+    return reduce(operator.or_, clauses)
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=50):
+    """
+    Return ``(rows, next_cursor)`` for one page of ``queryset`` sorted by
+    ``ordering``. The last field must be unique (usually ``id``), and an
+    index on the ordering keeps every page a single index seek.
+    Works for model and ``values()`` querysets alike.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor, queryset.model, ordering)
+        queryset = queryset.filter(keyset_filter(ordering, values))
+
+    # Fetch one extra row to learn whether there is a next page
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    names = [name.lstrip('-') for name in ordering]
+    if isinstance(last, dict):
+        next_values = [last[name] for name in names]
+    else:
+        next_values = [getattr(last, name) for name in names]
+    return rows, encode_cursor(next_values)
+
+
+def get_page_size(query_params, default, maximum):
+    """Read ``page_size`` from the query string; None means "not paginated" """
+    page_size = query_params.get('page_size')
+    if page_size is None:
+        return default if query_params.get('cursor') else None
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        return default
+    return max(1, min(page_size, maximum))
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in keyset (cursor) pagination on a fixed composite ordering.
+
+    Unlike DRF's CursorPagination, the cursor carries every ordering value,
+    so a page never needs an OFFSET no matter how deep the client scrolls.
+    Requests without ``cursor`` or ``page_size`` get the full, unpaginated list.
+    """
+    ordering = ('id',)
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = get_page_size(request.query_params, self.page_size, self.max_page_size)
+        if page_size is None:
+            return None
+
+        self.request = request
+        try:
+            rows, self.next_cursor = keyset_page(
+                queryset, self.ordering, request.query_params.get(self.cursor_query_param), page_size
+            )
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
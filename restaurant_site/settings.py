@@ -60,6 +60,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'settings.context_processors.site_settings',
+                'cart.context_processors.cart',
             ],
         },
     },
@@ -75,6 +76,25 @@ DATABASES = {
     }
 }
 
+# Cache
+# Menu snapshots, cart payloads and their version counters live here. With
+# more than one server process, point this at a shared backend, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# CACHE_LOCATION=redis://127.0.0.1:6379/1, so a write in one process
+# invalidates what the others serve.
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# A per-process cache never sees the other processes' version bumps, so there
+# the version counters expire after this many seconds, which bounds how long
+# a process can serve a stale snapshot. A shared cache keeps them until bumped.
+CACHE_VERSION_TIMEOUT = 60 if CACHE_BACKEND.endswith('LocMemCache') else None
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -119,8 +139,28 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # The browsable API renders a full HTML page per request; keep it for development only
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    ],
 }
 
+# Where anonymous carts live: 'session' keeps them in the session until the
+# visitor logs in; 'database' writes a Cart row for every visitor
+CART_GUEST_STORAGE = config('CART_GUEST_STORAGE', default='session')
+
+# Guest carts idle for longer than this are removed by `manage.py purge_carts`
+CART_GUEST_MAX_AGE_DAYS = config('CART_GUEST_MAX_AGE_DAYS', default=30, cast=int)
+
+# Payment receipt uploads larger than this (in bytes) are refused while they stream in
+RECEIPT_MAX_UPLOAD_SIZE = config('RECEIPT_MAX_UPLOAD_SIZE', default=15 * 1024 * 1024, cast=int)
+
+# How accepted receipts are downsized after checkout: 'thread' in a background
+# thread of the web process, 'inline' straight after the order commits, or
+# 'command' to leave them all to `manage.py process_receipts`
+RECEIPT_PROCESSING = config('RECEIPT_PROCESSING', default='thread')
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",